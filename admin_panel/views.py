@@ -3,40 +3,63 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.http import require_POST
 from django.urls import reverse
 from django.db import models
-
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.utils import timezone
+from django.contrib import messages
 
 from quiz.models import Game, Question, Answer, Participant, Round
+from quiz.utils import round_ratings, broadcast_ratings, log_grades, option_distribution
+from quiz.grading import grade_answers
+from quiz.stats import publish_question_stats, question_stats
+from quiz.staging import payload_digest, round_payload, seal_round, unseal_key
+from quiz.events import publish_game_event
+from quiz.moderation import moderation_queue, STATES as MODERATION_STATES
+from quiz import actor as game_actor
+from quiz.writer import run_write
+from quiz.metrics import timed_view
+from quiz.dbrouter import read_from_replica
+from quiz import profiling
+from django.http import JsonResponse
 
 
 def superuser_required(user):
     return user.is_active and user.is_superuser
 
 
+def _transition(request, game_id, **kwargs):
+    """Hand a state transition to the game's actor; a stale operator form is reported, not applied."""
+    expected = game_actor.posted_version(request.POST)
+    if expected is None:
+        # without the version the form was rendered with, a conflicting change could not be detected
+        messages.error(request, 'Форма без версии состояния игры, действие не применено. Обновите страницу и повторите.')
+        return None
+    try:
+        return game_actor.transition(game_id, expected_version=expected, **kwargs)
+    except game_actor.TransitionConflict as exc:
+        messages.error(request, f'Состояние игры изменилось (версия {exc.current}), действие не применено. Проверьте и повторите.')
+        return None
+
+
 @login_required
 @user_passes_test(superuser_required)
+@timed_view
 def manage_game(request, game_id):
     game = get_object_or_404(Game, pk=game_id)
     rounds = game.rounds.all().prefetch_related('questions')
 
-    # ratings per participant (session_key)
-    participants = list(game.participants.all())
-    ratings = []
-    for p in participants:
-        total = Answer.objects.filter(user_id=p.session_key, question__round__game=game, points_awarded__isnull=False).aggregate(total=models.Sum('points_awarded'))['total'] or 0
-        ratings.append({'participant': p, 'score': total})
+    # ratings per participant from the materialized per-round scores
+    ratings = round_ratings(game, list(game.rounds.all()))
 
     return render(request, 'admin_panel/manage_game.html', {
         'game': game,
         'rounds': rounds,
-        'ratings': sorted(ratings, key=lambda r: r['score'], reverse=True),
+        'ratings': ratings,
     })
 
 
 @login_required
 @user_passes_test(superuser_required)
 @require_POST
+@timed_view
 def send_question(request, game_id, question_id):
     question = get_object_or_404(Question, pk=question_id, round__game__id=game_id)
     duration = int(request.POST.get('duration', 30))
@@ -54,18 +77,15 @@ def send_question(request, game_id, question_id):
         'time': duration,
     }
 
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'game_{game_id}', payload)
-
-    # persist active question state on game so reconnecting clients can read it
-    game = Game.objects.get(pk=game_id)
-    game = Game.objects.get(pk=game_id)
-    game.active_question = question
-    game.active_round = question.round
-    game.accepting_answers = True
-    from django.utils import timezone
-    game.active_round_started_at = timezone.now()
-    game.save()
+    # the game's actor persists the live state and broadcasts, in order with other transitions
+    now = timezone.now()
+    _transition(request, game_id, set={
+        'active_question_id': question.id,
+        'active_round_id': question.round_id,
+        'accepting_answers': True,
+        'active_round_started_at': now,
+        'active_question_started_at': now,
+    }, event=payload)
 
     return redirect(reverse('admin_panel:manage_game', args=[game_id]))
 
@@ -73,78 +93,77 @@ def send_question(request, game_id, question_id):
 @login_required
 @user_passes_test(superuser_required)
 @require_POST
+@timed_view
 def send_round(request, game_id, round_id):
     # send all questions of a round to players as a single 'round' payload
     rnd = get_object_or_404(Round, pk=round_id, game__id=game_id)
-    qs = list(rnd.questions.all())
-    questions_payload = []
-    for q in qs:
-        questions_payload.append({
-            'id': q.pk,
-            'text': q.text,
-            'type': q.type,
-            'options': q.options or [],
-            'allow_bet': bool(q.allow_bet),
-            'max_bet': getattr(q, 'max_bet', 10),
-            'points': q.points,
-        })
-
+    round_data = round_payload(rnd)
+    digest = payload_digest(round_data)
     payload = {
         'type': 'show_round',
-        'round': {
-            'id': rnd.pk,
-            'title': rnd.title,
-            'questions': questions_payload,
-        },
+        'round': round_data,
         'time': int(request.POST.get('duration', 30)),
+        # sockets holding this payload staged (see quiz.staging) only get the key
+        'digest': digest,
+        'key': unseal_key(digest),
     }
 
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'game_{game_id}', payload)
+    _transition(request, game_id, set={
+        'active_round_id': rnd.pk,
+        'accepting_answers': True,
+        'active_round_started_at': timezone.now(),
+        # a question sent before is no longer open: stops and answer timing go by the round
+        'active_question_id': None,
+        'active_question_started_at': None,
+    }, event=payload)
+
+    return redirect(reverse('admin_panel:manage_game', args=[game_id]))
 
-    # persist active round state on game so reconnecting clients can read it
-    game = Game.objects.get(pk=game_id)
-    game.active_round = rnd
-    game.accepting_answers = True
-    from django.utils import timezone
-    game.active_round_started_at = timezone.now()
-    game.save()
 
+@login_required
+@user_passes_test(superuser_required)
+@require_POST
+@timed_view
+def stage_round(request, game_id, round_id):
+    # push the round sealed ahead of the reveal; send_round then only releases the key
+    rnd = get_object_or_404(Round, pk=round_id, game__id=game_id)
+    sealed = seal_round(round_payload(rnd))
+    publish_game_event(game_id, dict(sealed, type='stage_round', round_id=rnd.pk))
+    messages.info(request, f'Раунд «{rnd.title}» предзагружен игрокам.')
     return redirect(reverse('admin_panel:manage_game', args=[game_id]))
 
 
 @login_required
 @user_passes_test(superuser_required)
 @require_POST
+@timed_view
 def stop_answers(request, game_id):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'game_{game_id}', {'type': 'stop_answers'})
-    # persist state
-    game = Game.objects.get(pk=game_id)
-    game.accepting_answers = False
-    # clear active round/question and timestamps
-    game.active_round = None
-    game.active_question = None
-    game.active_round_started_at = None
-    game.active_question_started_at = None
-    game.save()
+    # stop accepting and clear active round/question and timestamps
+    _transition(request, game_id, set={
+        'accepting_answers': False,
+        'active_round_id': None,
+        'active_question_id': None,
+        'active_round_started_at': None,
+        'active_question_started_at': None,
+    }, event={'type': 'stop_answers'})
     return redirect(reverse('admin_panel:manage_game', args=[game_id]))
 
 
 @login_required
 @user_passes_test(superuser_required)
 @require_POST
+@timed_view
 def stop_answers_question(request, game_id, question_id):
     # stop accepting answers (immediately) for current active question
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'game_{game_id}', {'type': 'stop_answers', 'question_id': question_id})
-    # persist state on game
-    game = Game.objects.get(pk=game_id)
-    game.accepting_answers = False
-    # if active_question matches, clear it
-    if game.active_question and game.active_question.id == question_id:
-        game.active_question = None
-    game.save()
+    # if active_question matches, clear it as well
+    _transition(
+        request,
+        game_id,
+        set={'accepting_answers': False},
+        event={'type': 'stop_answers', 'question_id': question_id},
+        when_question=question_id,
+        set_when={'active_question_id': None},
+    )
     return redirect(reverse('admin_panel:manage_game', args=[game_id]))
 
 
@@ -152,14 +171,51 @@ def stop_answers_question(request, game_id, question_id):
 @user_passes_test(superuser_required)
 def moderate_answers(request, game_id):
     game = get_object_or_404(Game, pk=game_id)
-    # open type questions' answers which are not yet moderated
-    answers = Answer.objects.filter(question__round__game=game, question__type=Question.TYPE_OPEN, is_correct__isnull=True).select_related('question')
-    return render(request, 'admin_panel/moderate_answers.html', {'game': game, 'answers': answers})
+    # open type questions' answers which are not yet moderated, one keyset page at a time
+    params = _queue_params(request, state='pending', question_type=Question.TYPE_OPEN)
+    answers, next_cursor = moderation_queue(game.id, **params)
+    return render(request, 'admin_panel/moderate_answers.html', {
+        'game': game,
+        'answers': answers,
+        'rounds': game.rounds.all(),
+        'filters': params,
+        'states': MODERATION_STATES,
+        'next_url': _next_page_url(request, next_cursor),
+    })
+
+
+def _queue_params(request, state='pending', question_type=None):
+    """Moderation queue filters from the query string: round, question, state, type, after, limit."""
+    def as_int(name):
+        try:
+            return int(request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    state = request.GET.get('state', state)
+    question_type = request.GET.get('type', question_type)
+    return {
+        'round_id': as_int('round'),
+        'question_id': as_int('question'),
+        'state': state if state in MODERATION_STATES else 'pending',
+        'question_type': None if question_type in (None, '', 'all') else question_type,
+        'after': request.GET.get('after') or None,
+        'limit': as_int('limit') or 50,
+    }
+
+
+def _next_page_url(request, cursor):
+    if not cursor:
+        return None
+    query = request.GET.copy()
+    query['after'] = cursor
+    return f'{request.path}?{query.urlencode()}'
 
 
 @login_required
 @user_passes_test(superuser_required)
 @require_POST
+@timed_view
 def mark_answer(request, game_id, answer_id):
     action = request.POST.get('action')
     ans = get_object_or_404(Answer, pk=answer_id, question__round__game__id=game_id)
@@ -176,19 +232,13 @@ def mark_answer(request, game_id, answer_id):
     else:
         ans.points_awarded = q.points if is_correct else 0
 
-    ans.save()
+    # through the single writer on SQLite, like players' answer writes
+    run_write(ans.save)
+    log_grades(game_id, [(ans.user_id, q.pk, is_correct, ans.points_awarded)], src='moderator')
+    publish_question_stats(q.pk)
 
     # notify group to update ratings
-    # build ratings after change
-    channel_layer = get_channel_layer()
-    # simple trigger: send update_rating with recalculated ratings
-    participants = list(Game.objects.get(pk=game_id).participants.all())
-    ratings = []
-    for p in participants:
-        total = Answer.objects.filter(user_id=p.session_key, question__round__game_id=game_id, points_awarded__isnull=False).aggregate(total=models.Sum('points_awarded'))['total'] or 0
-        ratings.append({'participant_id': p.id, 'session_key': p.session_key, 'team_name': p.team_name, 'score': total})
-
-    async_to_sync(channel_layer.group_send)(f'game_{game_id}', {'type': 'update_rating', 'ratings': ratings})
+    broadcast_ratings(Game.objects.get(pk=game_id))
 
     # redirect back to caller if provided
     next_url = request.POST.get('next')
@@ -198,14 +248,75 @@ def mark_answer(request, game_id, answer_id):
     return redirect(reverse('admin_panel:moderate_answers', args=[game_id]))
 
 
+@login_required
+@user_passes_test(superuser_required)
+@require_POST
+@timed_view
+def autograde_answers(request, game_id):
+    # grade pending open answers against accepted variants now (normally done when answers stop)
+    get_object_or_404(Game, pk=game_id)
+    try:
+        round_id = int(request.POST['round'])
+    except (KeyError, ValueError):
+        round_id = None
+    counts = grade_answers(game_id, round_id=round_id)
+    messages.info(request, f"Автопроверка: правильно {counts['correct']}, неверно {counts['incorrect']}, "
+                           f"оставлено на модерацию {counts['ambiguous']}.")
+    next_url = request.POST.get('next')
+    if next_url and next_url.startswith('/'):
+        return redirect(next_url)
+    return redirect(reverse('admin_panel:moderate_answers', args=[game_id]))
+
+
 @login_required
 @user_passes_test(superuser_required)
 def moderate_answers_question(request, game_id, question_id):
     game = get_object_or_404(Game, pk=game_id)
     question = get_object_or_404(Question, pk=question_id, round__game=game)
-    # show answers for this question (unmoderated first)
-    answers = Answer.objects.filter(question=question).select_related('question')
-    return render(request, 'admin_panel/moderate_answers_question.html', {'game': game, 'question': question, 'answers': answers})
+    # show answers for this question, one keyset page at a time
+    params = _queue_params(request, state='all')
+    params['question_id'] = question.id
+    answers, next_cursor = moderation_queue(game.id, **params)
+    return render(request, 'admin_panel/moderate_answers_question.html', {
+        'game': game,
+        'question': question,
+        'answers': answers,
+        'distribution': option_distribution(question) if question.type == Question.TYPE_CHOICE else None,
+        'filters': params,
+        'states': MODERATION_STATES,
+        'next_url': _next_page_url(request, next_cursor),
+    })
+
+
+@login_required
+@user_passes_test(superuser_required)
+@timed_view
+def moderation_queue_json(request, game_id):
+    """Compact JSON page of the moderation queue; pass `next` back as `after` for the following page."""
+    get_object_or_404(Game, pk=game_id)
+    answers, next_cursor = moderation_queue(game_id, **_queue_params(request))
+    return JsonResponse({
+        'answers': [{
+            'id': a.id,
+            'question_id': a.question_id,
+            'participant': a.team_name or a.user_id,
+            'answer': a.answer_text,
+            'bet': a.bet_used or 0,
+            'is_correct': a.is_correct,
+            'submitted_at': a.submitted_at.isoformat(),
+        } for a in answers],
+        'next': next_cursor,
+    })
+
+
+@login_required
+@user_passes_test(superuser_required)
+@timed_view
+@read_from_replica
+def question_stats_json(request, game_id, question_id):
+    """Statistics of one question: answers, % correct, per-option counts, bets, submit-time percentiles."""
+    question = get_object_or_404(Question, pk=question_id, round__game__id=game_id)
+    return JsonResponse(question_stats(question))
 
 
 @login_required
@@ -219,24 +330,16 @@ def moderate_round(request, game_id, round_id):
 
 @login_required
 @user_passes_test(superuser_required)
+@timed_view
 def participants_rating(request, game_id):
     game = get_object_or_404(Game, pk=game_id)
-    participants = list(game.participants.all())
     rounds = list(game.rounds.all().order_by('pk'))
-    ratings = []
-    for p in participants:
-        per_round = []
-        total_score = 0
-        for r in rounds:
-            rsum = Answer.objects.filter(user_id=p.session_key, question__round=r, points_awarded__isnull=False).aggregate(total=models.Sum('points_awarded'))['total'] or 0
-            per_round.append(rsum)
-            total_score += rsum
-        ratings.append({'participant': p, 'per_round': per_round, 'score': total_score})
-
-    ratings_sorted = sorted(ratings, key=lambda r: r['score'], reverse=True)
+    ratings_sorted = round_ratings(game, rounds)
     return render(request, 'admin_panel/ratings.html', {'game': game, 'ratings': ratings_sorted, 'rounds': rounds})
 
 
+@timed_view
+@read_from_replica
 def public_participants_rating(request, game_id):
     """Public-facing rating view (no auth required).
 
@@ -244,17 +347,20 @@ def public_participants_rating(request, game_id):
     suitable for embedding in external streaming tools.
     """
     game = get_object_or_404(Game, pk=game_id)
-    participants = list(game.participants.all())
     rounds = list(game.rounds.all().order_by('pk'))
-    ratings = []
-    for p in participants:
-        per_round = []
-        total_score = 0
-        for r in rounds:
-            rsum = Answer.objects.filter(user_id=p.session_key, question__round=r, points_awarded__isnull=False).aggregate(total=models.Sum('points_awarded'))['total'] or 0
-            per_round.append(rsum)
-            total_score += rsum
-        ratings.append({'participant': p, 'per_round': per_round, 'score': total_score})
-
-    ratings_sorted = sorted(ratings, key=lambda r: r['score'], reverse=True)
+    ratings_sorted = round_ratings(game, rounds)
     return render(request, 'admin_panel/ratings.html', {'game': game, 'ratings': ratings_sorted, 'rounds': rounds, 'public': True})
+
+
+@login_required
+@user_passes_test(superuser_required)
+def profiling_toggle(request):
+    """Show (GET) or change (POST enabled=1|0, rate, count) sampled cProfile capture of requests."""
+    if request.method == 'POST':
+        try:
+            rate = float(request.POST.get('rate', 1.0))
+            count = int(request.POST.get('count', 10))
+        except ValueError:
+            return JsonResponse({'error': 'rate and count must be numbers'}, status=400)
+        return JsonResponse(profiling.configure(request.POST.get('enabled') == '1', rate, count))
+    return JsonResponse(profiling.status())
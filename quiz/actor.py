@@ -0,0 +1,286 @@
+"""Per-game actors that serialize live game state transitions.
+
+Each live game gets one asyncio task (a `GameActor`) in the process that owns
+it. The actor keeps the game's live state (accepting flag, active
+question/round, start timestamps) in memory, applies transition commands one
+at a time in arrival order, persists only the changed columns with a single
+conditional UPDATE on `state_version` and then broadcasts the command's event.
+A transition that finds the row changed by someone else (or an operator form
+posted against an older version) raises TransitionConflict instead of
+overwriting. Answer writes read the
+accepting flag from the actor instead of the Game row. Transition events
+carry the new `state_version`: an actor of the same game in another process
+(another web worker) is marked stale when an event newer than its state
+reaches a socket of that process, or when a snapshot read finds a newer row,
+and answers then go by the Game row until it reloads. Stopping answers
+schedules auto-grading of the round or question that was open and a
+leaderboard snapshot (quiz.grading, quiz.history).
+
+By default actors live in the calling process (the Daphne event loop; sync
+views reach it through async_to_sync). With QUIZ_GAME_ACTOR_CHANNEL set,
+commands are sent over the channel layer to that channel instead, served by
+`manage.py runworker <channel>` (see quiz_platform.asgi).
+"""
+import asyncio
+import datetime
+import logging
+import threading
+import weakref
+
+from asgiref.sync import async_to_sync
+from channels.consumer import AsyncConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from .db import db_sync_to_async
+from .dbrouter import note_write
+from .events import apublish_game_event
+from .grading import schedule_answers_closed
+from .models import Game
+
+logger = logging.getLogger(__name__)
+
+STATE_FIELDS = ('accepting_answers', 'active_question_id', 'active_round_id',
+                'active_question_started_at', 'active_round_started_at')
+
+
+class TransitionConflict(Exception):
+    """The game's state moved on since the version the transition was based on."""
+
+    def __init__(self, game_id, expected, current):
+        super().__init__(f'Game {game_id} state is at version {current}, not {expected}')
+        self.game_id = game_id
+        self.expected = expected
+        self.current = current
+
+
+def apply_transition(game_id, version, changed):
+    """Write `changed` fields iff the row is still at `version`; returns the new version.
+
+    One `UPDATE ... WHERE id=? AND state_version=?`; raises TransitionConflict
+    when no row matched.
+    """
+    updated = Game.objects.filter(pk=game_id, state_version=version).update(
+        state_version=F('state_version') + 1, **changed)
+    if not updated:
+        current = Game.objects.filter(pk=game_id).values_list('state_version', flat=True).first()
+        raise TransitionConflict(game_id, version, current)
+    return version + 1
+
+
+class GameActor:
+    def __init__(self, game_id):
+        self.game_id = int(game_id)
+        self.state = None
+        self.stale = False
+        self._mailbox = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    @property
+    def alive(self):
+        return not self._task.done()
+
+    async def call(self, command):
+        future = asyncio.get_running_loop().create_future()
+        await self._mailbox.put((command, future))
+        return await future
+
+    async def _run(self):
+        idle = getattr(settings, 'QUIZ_GAME_ACTOR_IDLE_SECONDS', 600)
+        while True:
+            try:
+                command, future = await asyncio.wait_for(self._mailbox.get(), timeout=idle)
+            except asyncio.TimeoutError:
+                if self._mailbox.empty():
+                    _forget(self)
+                    return
+                continue
+            try:
+                result = await self._apply(command)
+            except TransitionConflict as exc:
+                if not future.done():
+                    future.set_exception(exc)
+            except Exception as exc:
+                logger.exception('Game %s actor failed to apply %r', self.game_id, command.get('op'))
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    @db_sync_to_async
+    def _load(self):
+        return Game.objects.filter(pk=self.game_id).values('state_version', *STATE_FIELDS).first()
+
+    @db_sync_to_async
+    def _persist(self, changed):
+        version = apply_transition(self.game_id, self.state['state_version'], changed)
+        note_write(f'game:{self.game_id}')
+        return version
+
+    async def _apply(self, command):
+        if self.state is None or self.stale:
+            self.stale = False
+            self.state = await self._load()
+            if self.state is None:
+                raise Game.DoesNotExist(f'Game {self.game_id} does not exist')
+        op = command.get('op')
+        if op == 'state':
+            return dict(self.state)
+        if op != 'transition':
+            raise ValueError(f'Unknown game actor command {op!r}')
+
+        expected = command.get('expected_version')
+        if expected is not None and expected != self.state['state_version']:
+            raise TransitionConflict(self.game_id, expected, self.state['state_version'])
+
+        changes = dict(command.get('set') or {})
+        when_question = command.get('when_question')
+        if when_question is not None and self.state['active_question_id'] == when_question:
+            changes.update(command.get('set_when') or {})
+        changed = {k: v for k, v in changes.items() if k in STATE_FIELDS and self.state[k] != v}
+        # what was open when answers stop gets auto-graded once the stop is persisted
+        closing = changed.get('accepting_answers') is False
+        if when_question is not None:
+            scope = {'question_id': when_question}
+        elif self.state['active_round_id'] is not None:
+            # a full stop closes the whole round (a single question is sent with its round too)
+            scope = {'round_id': self.state['active_round_id']}
+        else:
+            scope = {'question_id': self.state['active_question_id']}
+        if changed:
+            try:
+                version = await self._persist(changed)
+            except TransitionConflict:
+                # someone else wrote the row: drop our copy and let the caller decide
+                self.stale = True
+                raise
+            self.state.update(changed, state_version=version)
+        if command.get('event'):
+            # the version tells actors of this game in other processes that their state is behind
+            await apublish_game_event(self.game_id, dict(command['event'], state_version=self.state['state_version']))
+        if closing and any(v is not None for v in scope.values()):
+            schedule_answers_closed(self.game_id, **scope)
+        return dict(self.state)
+
+
+# actors are bound to the event loop that created them
+_registry = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+
+def _actors_for_loop(loop):
+    with _registry_lock:
+        return _registry.setdefault(loop, {})
+
+
+def _forget(actor):
+    actors = _actors_for_loop(asyncio.get_running_loop())
+    if actors.get(actor.game_id) is actor:
+        del actors[actor.game_id]
+
+
+def get_actor(game_id):
+    actors = _actors_for_loop(asyncio.get_running_loop())
+    actor = actors.get(int(game_id))
+    if actor is None or not actor.alive:
+        actor = actors[int(game_id)] = GameActor(game_id)
+    return actor
+
+
+def local_state(game_id):
+    """Live state of `game_id` from an actor of the running loop, or None if there is none.
+
+    With QUIZ_GAME_ACTOR_CHANNEL set the state is owned by the worker process, so this is always None.
+    """
+    if getattr(settings, 'QUIZ_GAME_ACTOR_CHANNEL', ''):
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    actor = _actors_for_loop(loop).get(int(game_id))
+    if actor is None or not actor.alive or actor.stale or actor.state is None:
+        return None
+    return actor.state
+
+
+def invalidate(game_id):
+    """Make actors of `game_id` reload their state (the Game row was changed elsewhere)."""
+    with _registry_lock:
+        loops = list(_registry.values())
+    for actors in loops:
+        actor = actors.get(int(game_id))
+        if actor is not None:
+            actor.stale = True
+
+
+def observe_version(game_id, version):
+    """`game_id` is at state `version` (from an event or a read): actors of this process behind it reload."""
+    if version is None:
+        return
+    with _registry_lock:
+        loops = list(_registry.values())
+    for actors in loops:
+        actor = actors.get(int(game_id))
+        if actor is not None and actor.state is not None and actor.state['state_version'] < version:
+            actor.stale = True
+
+
+def _encode(value):
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, datetime.datetime):
+        return {'__dt__': value.isoformat()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if set(value) == {'__dt__'}:
+            return parse_datetime(value['__dt__'])
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+async def send_command(game_id, command):
+    """Apply `command` in the game's actor; returns the new state (None when sent to a worker)."""
+    channel = getattr(settings, 'QUIZ_GAME_ACTOR_CHANNEL', '')
+    if channel:
+        await get_channel_layer().send(channel, {'type': 'game.command', 'game_id': int(game_id), 'command': _encode(command)})
+        return None
+    return await get_actor(game_id).call(command)
+
+
+def posted_version(data):
+    """The `state_version` an operator form was rendered with; None when it is missing or not a number."""
+    try:
+        return int(data['state_version'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def transition(game_id, set=None, event=None, when_question=None, set_when=None, expected_version=None):
+    """Sync helper for views: change live state fields and broadcast `event`, in order.
+
+    Returns the new state (with `state_version`); raises TransitionConflict when
+    `expected_version` is given and the game has moved on.
+    """
+    command = {'op': 'transition', 'set': set or {}, 'event': event, 'expected_version': expected_version}
+    if when_question is not None:
+        command.update(when_question=when_question, set_when=set_when or {})
+    return async_to_sync(send_command)(game_id, command)
+
+
+class GameActorWorker(AsyncConsumer):
+    """Channel-layer entry point for actors when QUIZ_GAME_ACTOR_CHANNEL is used."""
+
+    async def game_command(self, message):
+        try:
+            await get_actor(message['game_id']).call(_decode(message['command']))
+        except TransitionConflict as exc:
+            logger.warning('Game actor command rejected: %s', exc)
+        except Exception:
+            logger.exception('Game actor command failed')
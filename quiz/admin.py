@@ -9,9 +9,9 @@ import logging
 from django.urls import path
 from django.shortcuts import redirect
 from django.utils.html import format_html
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 from django.utils import timezone
+from django.views.decorators.http import require_POST
+from . import actor as game_actor
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +21,16 @@ class GameAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'is_active', 'mode', 'created_at', 'manage_link')
     search_fields = ('title', 'description')
     actions = ('activate_selected_games', 'duplicate_games')
+    # live state is written only by the game's actor (quiz.actor), against its state version
+    readonly_fields = ('accepting_answers', 'active_question', 'active_round',
+                       'active_question_started_at', 'active_round_started_at', 'state_version')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # only what the form changed: a full save would write back the live state loaded with the form
+            obj.save(update_fields=form.changed_data)
+        else:
+            obj.save()
 
     def manage_link(self, obj):
         try:
@@ -63,6 +73,7 @@ class GameAdmin(admin.ModelAdmin):
                             type=q.type,
                             options=q.options,
                             correct_answer=q.correct_answer,
+                            accepted_answers=q.accepted_answers,
                             points=q.points,
                             allow_bet=q.allow_bet,
                             bet_multiplier=q.bet_multiplier,
@@ -84,6 +95,7 @@ class QuestionAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_display_links = ('text',)
     list_display = ('id', 'text', 'round', 'type', 'points', 'allow_bet', 'manage_controls')
+    list_select_related = ('round__game',)
     list_display_links = ('text',)
     search_fields = ('text',)
 
@@ -91,8 +103,8 @@ class QuestionAdmin(admin.ModelAdmin):
 
     class AnswerInline(admin.TabularInline):
         model = models.Answer
-        fields = ('user_id', 'team_name', 'answer_text', 'is_correct', 'points_awarded', 'submitted_at')
-        readonly_fields = ('user_id', 'team_name', 'answer_text', 'submitted_at')
+        fields = ('user_id', 'team_name', 'answer_text', 'option_index', 'is_correct', 'points_awarded', 'submitted_at')
+        readonly_fields = ('user_id', 'team_name', 'answer_text', 'option_index', 'submitted_at')
         extra = 0
 
     inlines = [AnswerInline]
@@ -152,7 +164,7 @@ class QuestionAdmin(admin.ModelAdmin):
             return instance
 
     form = QuestionForm
-    fields = ('round', 'text', 'type', 'options_text', 'correct_answer', 'points', 'allow_bet', 'bet_multiplier')
+    fields = ('round', 'text', 'type', 'options_text', 'correct_answer', 'accepted_answers', 'points', 'allow_bet', 'bet_multiplier')
 
     def save_model(self, request, obj, form, change):
         # Ensure options JSON is stored on the model even when 'options' isn't
@@ -203,8 +215,8 @@ class QuestionAdmin(admin.ModelAdmin):
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
-            path('<int:pk>/send/', self.admin_site.admin_view(self.send_to_players), name='quiz_question_send'),
-            path('<int:pk>/stop/', self.admin_site.admin_view(self.stop_answers_view), name='quiz_question_stop'),
+            path('<int:pk>/send/', self.admin_site.admin_view(require_POST(self.send_to_players)), name='quiz_question_send'),
+            path('<int:pk>/stop/', self.admin_site.admin_view(require_POST(self.stop_answers_view)), name='quiz_question_stop'),
         ]
         return custom_urls + urls
 
@@ -212,36 +224,38 @@ class QuestionAdmin(admin.ModelAdmin):
         send_url = f'./{obj.pk}/send/'
         stop_url = f'./{obj.pk}/stop/'
         moderate_url = f'/admin/quiz/answer/?question__id__exact={obj.pk}'
+        # the buttons post the changelist form (it carries the CSRF token) with the game's
+        # state version, so a transition from a stale page is rejected instead of applied
+        version = obj.round.game.state_version
         return format_html(
-            '<a class="button" href="{}">Отправить игрокам</a>&nbsp;'
-            '<a class="button" href="{}">Остановить приём</a>&nbsp;'
+            '<button type="submit" class="button" formaction="{}" formmethod="post" name="state_version" value="{}">Отправить игрокам</button>&nbsp;'
+            '<button type="submit" class="button" formaction="{}" formmethod="post" name="state_version" value="{}">Остановить приём</button>&nbsp;'
             '<a class="button" href="{}">Модерировать ответы</a>',
-            send_url, stop_url, moderate_url
+            send_url, version, stop_url, version, moderate_url
         )
     manage_controls.short_description = 'Управление'
 
     def send_to_players(self, request, pk):
-        q = models.Question.objects.filter(pk=pk).select_related('round__game').first()
+        q = models.Question.objects.filter(pk=pk).select_related('round').first()
         if not q:
             self.message_user(request, 'Вопрос не найден', level='error')
             return redirect(request.META.get('HTTP_REFERER', '..'))
 
-        game = q.round.game
-        # mark game state: active question and start time
-        game.active_question = q
-        game.accepting_answers = True
-        game.active_question_started_at = timezone.now()
-        game.save()
+        game_id = q.round.game_id
+        expected = game_actor.posted_version(request.POST)
+        if expected is None:
+            self.message_user(request, 'Нет версии состояния игры, вопрос не отправлен. Обновите страницу и повторите.', level='error')
+            return redirect(request.META.get('HTTP_REFERER', '..'))
+        started_at = timezone.now()
 
         # build question payload including server start timestamp for sync
         # include both ISO timestamp and numeric epoch seconds for robustness
         started_iso = None
         started_ts = None
         try:
-            if game.active_question_started_at:
-                started_iso = game.active_question_started_at.isoformat()
-                # epoch seconds (int) in UTC
-                started_ts = int(game.active_question_started_at.timestamp())
+            started_iso = started_at.isoformat()
+            # epoch seconds (int) in UTC
+            started_ts = int(started_at.timestamp())
         except Exception:
             started_iso = None
             started_ts = None
@@ -257,34 +271,44 @@ class QuestionAdmin(admin.ModelAdmin):
             'started_at': started_iso,
             'started_at_ts': started_ts,
         }
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'game_{game.id}',
-            {
+        # mark game state (active question and start time) and broadcast via the game's actor
+        try:
+            game_actor.transition(game_id, set={
+                'active_question_id': q.pk,
+                # the question's round, as admin_panel's send_question does, so a full stop never scopes to a stale round
+                'active_round_id': q.round_id,
+                'accepting_answers': True,
+                'active_question_started_at': started_at,
+            }, event={
                 'type': 'show_question',
                 'question': question_payload,
-            }
-        )
+            }, expected_version=expected)
+        except game_actor.TransitionConflict:
+            self.message_user(request, 'Состояние игры изменилось, вопрос не отправлен. Обновите страницу и повторите.', level='error')
+            return redirect(request.META.get('HTTP_REFERER', '..'))
         self.message_user(request, f'Вопрос #{q.pk} отправлен игрокам')
         return redirect(request.META.get('HTTP_REFERER', '..'))
 
     def stop_answers_view(self, request, pk):
-        q = models.Question.objects.filter(pk=pk).select_related('round__game').first()
+        q = models.Question.objects.filter(pk=pk).select_related('round').first()
         if not q:
             self.message_user(request, 'Вопрос не найден', level='error')
             return redirect(request.META.get('HTTP_REFERER', '..'))
-        game = q.round.game
+        expected = game_actor.posted_version(request.POST)
+        if expected is None:
+            self.message_user(request, 'Нет версии состояния игры, приём не остановлен. Обновите страницу и повторите.', level='error')
+            return redirect(request.META.get('HTTP_REFERER', '..'))
         # clear accepting and start time
-        game.accepting_answers = False
-        game.active_question_started_at = None
-        game.save()
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'game_{game.id}',
-            {
+        try:
+            game_actor.transition(q.round.game_id, set={
+                'accepting_answers': False,
+                'active_question_started_at': None,
+            }, event={
                 'type': 'stop_answers',
-            }
-        )
+            }, expected_version=expected)
+        except game_actor.TransitionConflict:
+            self.message_user(request, 'Состояние игры изменилось, приём не остановлен. Обновите страницу и повторите.', level='error')
+            return redirect(request.META.get('HTTP_REFERER', '..'))
         self.message_user(request, f'Приём ответов для вопроса #{q.pk} остановлен')
         return redirect(request.META.get('HTTP_REFERER', '..'))
 
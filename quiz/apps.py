@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class QuizConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quiz'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .sqlite import configure_sqlite_connection
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='quiz_sqlite_profile')
@@ -0,0 +1,85 @@
+"""Two-tier cache: per-process local memory in front of an optional shared Redis.
+
+Reads hit the local tier first, then the shared tier (copying the value into
+the local tier for QUIZ_CACHE_LOCAL_TIMEOUT seconds). Writes go to both. Without
+a 'shared' cache alias it is just the local cache.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class TwoTierCache:
+    def __init__(self, local_alias='default', shared_alias='shared'):
+        self.local_alias = local_alias
+        self.shared_alias = shared_alias
+
+    @property
+    def local(self):
+        return caches[self.local_alias]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias in settings.CACHES else None
+
+    def _local_timeout(self, timeout):
+        if self.shared is None:
+            return timeout
+        local = getattr(settings, 'QUIZ_CACHE_LOCAL_TIMEOUT', 5)
+        return local if timeout is None else min(timeout, local)
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        shared = self.shared
+        if shared is None:
+            return default
+        value = shared.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.local.set(key, value, self._local_timeout(None))
+        return value
+
+    def set(self, key, value, timeout=300):
+        self.local.set(key, value, self._local_timeout(timeout))
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, value, timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(key)
+
+    def get_or_set(self, key, func, timeout=300):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = func()
+            self.set(key, value, timeout)
+        return value
+
+
+two_tier = TwoTierCache()
+
+
+def game_cache_key(game_id):
+    return f'quiz:game:{int(game_id)}'
+
+
+def cached_game(game_id, timeout=30):
+    """Game row for pages that only show its static fields (title, mode, video); None if missing.
+
+    Dropped from the cache on every Game save (see quiz.models); live state
+    (accepting answers, active question) must not be read from it.
+    """
+    from .models import Game
+    key = game_cache_key(game_id)
+    game = two_tier.get(key)
+    if game is None:
+        game = Game.objects.filter(pk=game_id).first()
+        if game is not None:
+            two_tier.set(key, game, timeout)
+    return game
@@ -1,155 +1,183 @@
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.utils import timezone
 from .models import Question, Answer, Participant, Game, Round
+from .leaderboard import leaderboard_for_event
+from .outbound import OutboundQueue
+from . import fanout, protocol
+from .events import after_commit, game_events, apublish_game_event
+from .eventlog import log_event
+from .db import db_sync_to_async, db_write_to_async
+from . import actor as game_actor
+from .stats import schedule_publish as schedule_stats_publish
+from .utils import answer_batch
+from .dbrouter import note_write, read_replica, recently_wrote
+from .tracing import trace_message
+from .querybudget import action_budget
+from .metrics import WS_CONNECTIONS, WS_CONNECT_SECONDS, WS_MESSAGES, WS_ACTION_SECONDS, WS_OUTBOUND
 
 
 class GameConsumer(AsyncJsonWebsocketConsumer):
+    REPLAYABLE_EVENTS = ('show_question', 'stage_round', 'show_round', 'stop_answers', 'update_rating', 'player_submit', 'player_joined')
+    GROUP_EVENTS = REPLAYABLE_EVENTS + ('question_stats',)
+    # client actions; anything else is counted and budgeted as 'other' so metric labels stay bounded
+    ACTIONS = ('join_game', 'round_staged', 'submit_answer', 'save_answer', 'save_round_answers')
+
     async def connect(self):
-        self.game_id = self.scope['url_route']['kwargs'].get('game_id')
-        self.group_name = f'game_{self.game_id}'
+        self.group_name = None
+        try:
+            self.game_id = int(self.scope['url_route']['kwargs'].get('game_id'))
+        except (TypeError, ValueError):
+            self.game_id = None
+        if self.game_id is None or self.game_id <= 0:
+            # the route accepts any path segment; it must not reach metric labels or group names
+            await self.close()
+            return
+        with WS_CONNECT_SECONDS.time(game=self.game_id):
+            await self._connect()
 
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+    async def _connect(self):
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        if query.get('participant_id', [''])[0]:
+            self.participant_id = query['participant_id'][0]
+
+        # all frames to this client go through a bounded queue (see quiz.outbound)
+        self.outbound = OutboundQueue(self.send_json)
+        # round_id -> digest of the sealed payload this client holds (see quiz.staging)
+        self.staged_rounds = {}
+        if fanout.shard_count() > 1:
+            # sharded game: the worker's relay for this socket's shard delivers group events
+            self.group_name = await fanout.join(self, self.game_id, getattr(self, 'participant_id', self.channel_name), self.channel_layer)
+            self.relayed = True
+        else:
+            self.group_name = fanout.group_names(self.game_id)[0]
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+        # wire format: JSON unless the client negotiated MessagePack (quiz.protocol)
+        self.codec, subprotocol = protocol.negotiate(self.scope)
+        await self.accept(subprotocol)
+        WS_CONNECTIONS.inc(game=self.game_id)
+        self.outbound.start()
+
+        # resume: a reconnecting client passes the last seq it saw and its epoch;
+        # replay only the missed events when the ring buffer of the same epoch
+        # still covers the gap
+        try:
+            last_seq = int(query['last_seq'][0])
+        except (KeyError, ValueError):
+            last_seq = None
+        if last_seq is not None:
+            missed = game_events.since(self.game_id, last_seq, query.get('epoch', [None])[0])
+            if missed is not None:
+                for event in missed:
+                    if event.get('type') in self.REPLAYABLE_EVENTS:
+                        await getattr(self, event['type'])(event)
+                return
+
+        # full snapshot; tagged with the current seq and epoch so the client can resume from it
+        snapshot_seq = game_events.current(self.game_id)
+        epoch = game_events.epoch
 
         # on new connection, if there is an active question and answers are accepted,
-        # send the current question to the connecting client so page reloads see it
-        @database_sync_to_async
-        def _get_state(gid):
+        # send the current question/round to the connecting client so page reloads see it.
+        # The whole snapshot is read in a single hop to the DB pool.
+        state = await self._load_snapshot(self.game_id, getattr(self, 'participant_id', None))
+        game_actor.observe_version(self.game_id, state.get('state_version'))
+        self.outbound.put_control({'type': 'snapshot', 'seq': snapshot_seq, 'epoch': epoch, 'accepting': bool(state.get('accepting'))})
+        if state.get('question'):
+            self.outbound.put_control({'type': 'show_question', 'question': state['question'], 'seq': snapshot_seq, 'epoch': epoch, 'snapshot': True})
+        # If there's an active round, send it (including saved answers for this participant)
+        if state.get('round'):
+            self.outbound.put_control({'type': 'show_round', 'round': state['round'], 'seq': snapshot_seq, 'epoch': epoch, 'snapshot': True})
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'relayed', False):
+            await fanout.leave(self, self.group_name)
+        elif self.group_name:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        outbound = getattr(self, 'outbound', None)
+        if outbound is not None:
+            WS_CONNECTIONS.dec(game=self.game_id)
+            await outbound.close()
+
+    async def dispatch(self, message):
+        if message.get('type') in self.REPLAYABLE_EVENTS:
+            WS_OUTBOUND.inc(game=getattr(self, 'game_id', ''), type=message['type'])
+        await super().dispatch(message)
+
+    async def deliver(self, event):
+        # group event from a shard relay (quiz.fanout); the handlers only queue
+        # frames, so skip dispatch()'s close_old_connections thread hop per socket
+        kind = event.get('type')
+        if kind in self.GROUP_EVENTS:
+            if kind in self.REPLAYABLE_EVENTS:
+                WS_OUTBOUND.inc(game=self.game_id, type=kind)
+            await getattr(self, kind)(event)
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        if bytes_data is not None and getattr(self, 'codec', 'json') == 'msgpack':
             try:
-                g = Game.objects.select_related('active_question').get(pk=gid)
-                started = None
-                started_ts = None
-                active_round_id = None
-                active_round_started = None
-                active_round_started_ts = None
-                try:
-                    if g.active_question_started_at:
-                        started = g.active_question_started_at.isoformat()
-                        started_ts = int(g.active_question_started_at.timestamp())
-                except Exception:
-                    started = None
-                    started_ts = None
-                try:
-                    if g.active_round:
-                        active_round_id = g.active_round_id
-                        if g.active_round_started_at:
-                            active_round_started = g.active_round_started_at.isoformat()
-                            active_round_started_ts = int(g.active_round_started_at.timestamp())
-                except Exception:
-                    active_round_id = None
-                return {
-                    'accepting': g.accepting_answers,
-                    'question_id': g.active_question_id,
-                    'started_at': started,
-                    'started_at_ts': started_ts,
-                    'active_round_id': active_round_id,
-                    'active_round_started': active_round_started,
-                    'active_round_started_ts': active_round_started_ts,
-                }
+                content = protocol.unpack(bytes_data)
             except Exception:
-                return {'accepting': False, 'question_id': None}
-
-        state = await _get_state(int(self.game_id)) if self.game_id else {'accepting': False, 'question_id': None}
-        if state.get('accepting') and state.get('question_id'):
-            @database_sync_to_async
-            def _load_question(qid):
-                try:
-                    q = Question.objects.get(pk=qid)
-                    # Try to fetch started_at from the game's active_question_started_at if set
-                    g = q.round.game
-                    started = None
-                    started_ts = None
-                    try:
-                        if g.active_question_started_at:
-                            started = g.active_question_started_at.isoformat()
-                            started_ts = int(g.active_question_started_at.timestamp())
-                    except Exception:
-                        started = None
-                        started_ts = None
-                    return {
-                        'id': q.pk,
-                        'text': q.text,
-                        'type': q.type,
-                        'options': q.options or [],
-                        'time': getattr(q, 'time_limit', 30),
-                        'allow_bet': bool(q.allow_bet),
-                        'max_bet': getattr(q, 'max_bet', 10),
-                        'started_at': started,
-                        'started_at_ts': started_ts,
-                    }
-                except Exception:
-                    return None
-
-            qpayload = await _load_question(state.get('question_id'))
-            if qpayload:
-                await self.send_json({'type': 'show_question', 'question': qpayload})
-        # If there's an active round, load and send it (including saved answers for this participant)
-        if state.get('accepting') and state.get('active_round_id'):
-            @database_sync_to_async
-            def _load_round(rid, user_session):
-                try:
-                    r = Round.objects.get(pk=rid)
-                    questions = []
-                    for q in r.questions.all():
-                        questions.append({
-                            'id': q.pk,
-                            'text': q.text,
-                            'type': q.type,
-                            'options': q.options or [],
-                            'allow_bet': bool(q.allow_bet),
-                            'points': q.points,
-                        })
-                    # load saved answers for this user in this round
-                    saved = {}
-                    if user_session:
-                        ans_qs = Answer.objects.filter(user_id=user_session, question__round=r)
-                        for a in ans_qs:
-                            saved[a.question_id] = {'answer_text': a.answer_text, 'bet_used': a.bet_used}
-                    started = None
-                    started_ts = None
-                    try:
-                        g = r.game
-                        if g.active_round_started_at:
-                            started = g.active_round_started_at.isoformat()
-                            started_ts = int(g.active_round_started_at.timestamp())
-                    except Exception:
-                        started = None
-                        started_ts = None
-                    return {'id': r.pk, 'title': r.title, 'questions': questions, 'saved_answers': saved, 'started_at': started, 'started_at_ts': started_ts}
-                except Exception:
-                    return None
-
-            round_payload = await _load_round(state.get('active_round_id'), getattr(self, 'participant_id', None))
-            if round_payload:
-                await self.send_json({'type': 'show_round', 'round': round_payload})
+                content = None
+            if not isinstance(content, dict):
+                WS_MESSAGES.inc(game=self.game_id, action='invalid')
+                return
+            await self.receive_json(content, **kwargs)
+            return
+        await super().receive(text_data=text_data, bytes_data=bytes_data, **kwargs)
 
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+    async def send_json(self, content, close=False):
+        if getattr(self, 'codec', 'json') == 'msgpack':
+            await self.send(bytes_data=protocol.pack(content), close=close)
+        else:
+            await super().send_json(content, close=close)
 
     async def receive_json(self, content, **kwargs):
         action = content.get('action')
+        label = action if action in self.ACTIONS else 'other'
+        WS_MESSAGES.inc(game=self.game_id, action=label)
+        with WS_ACTION_SECONDS.time(game=self.game_id, action=label), action_budget(f'ws:{label}'), \
+                trace_message(self.game_id, action) as trace:
+            await self._handle_action(action, content, trace)
 
+    def _ack(self, trace, action, ok, **extra):
+        # direct reply to the sender carrying the correlation id of its message
+        self.outbound.put_control(dict({'type': 'ack', 'action': action, 'ok': ok, 'correlation_id': trace.id}, **extra))
+
+    async def _handle_action(self, action, content, trace):
         if action == 'join_game':
             # store participant id for this connection
             self.participant_id = content.get('participant_id')
-            await self.channel_layer.group_send(
-                self.group_name,
+            await apublish_game_event(
+                self.game_id,
                 {
                     'type': 'player_joined',
                     'participant_id': self.participant_id,
-                }
+                },
+                buffer=False,
+                channel_layer=self.channel_layer,
             )
 
+        elif action == 'round_staged':
+            # the client stored a sealed round; its reveal can be just the key
+            try:
+                self.staged_rounds[int(content.get('round_id'))] = str(content.get('digest'))
+            except (TypeError, ValueError):
+                pass
+
         elif action == 'submit_answer':
             # legacy handling — treat as save
             question_id = content.get('question_id')
             answer_text = content.get('answer')
             bet = content.get('bet')
             participant_id = content.get('participant_id') or getattr(self, 'participant_id', None)
-            saved_id = await self._save_or_update_answer(participant_id, question_id, answer_text, bet)
-            await self.channel_layer.group_send(
-                self.group_name,
+            saved_id = await self._save_or_update_answer(participant_id, question_id, answer_text, bet, self._live_state())
+            self._ack(trace, action, saved_id is not None, question_id=question_id, answer_id=saved_id)
+            if saved_id is not None:
+                self._publish_stats([question_id])
+            await apublish_game_event(
+                self.game_id,
                 {
                     'type': 'player_submit',
                     'participant_id': participant_id,
@@ -157,17 +185,22 @@ class GameConsumer(AsyncJsonWebsocketConsumer):
                     'answer': answer_text,
                     'bet': bet,
                     'answer_id': saved_id,
-                }
+                },
+                buffer=False,
+                channel_layer=self.channel_layer,
             )
         elif action == 'save_answer':
             question_id = content.get('question_id')
             answer_text = content.get('answer')
             bet = content.get('bet')
             participant_id = content.get('participant_id') or getattr(self, 'participant_id', None)
-            saved_id = await self._save_or_update_answer(participant_id, question_id, answer_text, bet)
+            saved_id = await self._save_or_update_answer(participant_id, question_id, answer_text, bet, self._live_state())
+            self._ack(trace, action, saved_id is not None, question_id=question_id, answer_id=saved_id)
+            if saved_id is not None:
+                self._publish_stats([question_id])
             # no broadcast needed for every save, but we can acknowledge via player_submit
-            await self.channel_layer.group_send(
-                self.group_name,
+            await apublish_game_event(
+                self.game_id,
                 {
                     'type': 'player_submit',
                     'participant_id': participant_id,
@@ -175,46 +208,128 @@ class GameConsumer(AsyncJsonWebsocketConsumer):
                     'answer': answer_text,
                     'bet': bet,
                     'answer_id': saved_id,
-                }
+                },
+                buffer=False,
+                channel_layer=self.channel_layer,
             )
         elif action == 'save_round_answers':
             # payload should contain list of {question_id, answer, bet}
             answers = content.get('answers') or []
             participant_id = content.get('participant_id') or getattr(self, 'participant_id', None)
-            saved_ids = []
-            for item in answers:
-                qid = item.get('question_id')
-                ans_text = item.get('answer')
-                bet = item.get('bet')
-                sid = await self._save_or_update_answer(participant_id, qid, ans_text, bet)
-                if sid:
-                    saved_ids.append(sid)
+            # all answers of the sheet are written in one hop / one transaction
+            saved_ids = await self._save_round_answers(participant_id, answers, self._live_state())
+            self._ack(trace, action, len(saved_ids) == len(answers), saved_ids=saved_ids)
+            if saved_ids:
+                self._publish_stats([item.get('question_id') for item in answers])
             # notify group that this participant saved (so admin can count)
-            await self.channel_layer.group_send(self.group_name, {'type': 'player_submit', 'participant_id': participant_id, 'saved_ids': saved_ids})
+            await apublish_game_event(self.game_id, {'type': 'player_submit', 'participant_id': participant_id, 'saved_ids': saved_ids}, buffer=False, channel_layer=self.channel_layer)
+
+    def _publish_stats(self, question_ids):
+        # admin screens get the questions' statistics shortly after, coalesced across players
+        ids = set()
+        for qid in question_ids:
+            try:
+                ids.add(int(qid))
+            except (TypeError, ValueError):
+                continue
+        schedule_stats_publish(ids, channel_layer=self.channel_layer)
 
-    # Handlers for messages sent to the group by server/admin
+    # Handlers for messages sent to the group by server/admin.
+    # show/stop are control messages and are never dropped; ratings and
+    # player events are state messages coalesced per key by the outbound queue.
     async def show_question(self, event):
+        # possibly from another process's actor: ours reloads if its state is older than the event
+        game_actor.observe_version(self.game_id, event.get('state_version'))
         # event expected to contain 'question' and optional 'options'
-        await self.send_json({
+        self.outbound.put_control({
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
             'type': 'show_question',
             'question': event.get('question'),
             'options': event.get('options'),
         })
 
+    async def stage_round(self, event):
+        # sealed ahead of the reveal; useless without the key that show_round carries
+        self.outbound.put_control({
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
+            'type': 'stage_round',
+            'round_id': event.get('round_id'),
+            'digest': event.get('digest'),
+            'nonce': event.get('nonce'),
+            'sealed': event.get('sealed'),
+        })
+
+    async def show_round(self, event):
+        game_actor.observe_version(self.game_id, event.get('state_version'))
+        round_id = (event.get('round') or {}).get('id')
+        digest = event.get('digest')
+        if digest and self.staged_rounds.get(round_id) == digest:
+            self.outbound.put_control({
+                'seq': event.get('seq'),
+                'epoch': event.get('epoch'),
+                'type': 'unseal_round',
+                'round_id': round_id,
+                'key': event.get('key'),
+                'time': event.get('time'),
+            })
+            return
+        self.outbound.put_control({
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
+            'type': 'show_round',
+            'round': event.get('round'),
+            'time': event.get('time'),
+        })
+
     async def stop_answers(self, event):
-        await self.send_json({
+        game_actor.observe_version(self.game_id, event.get('state_version'))
+        self.outbound.put_control({
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
             'type': 'stop_answers'
         })
 
     async def update_rating(self, event):
-        await self.send_json({
+        participant_id = getattr(self, 'participant_id', None)
+        if not participant_id:
+            # admin panel / overlays get the full table
+            self.outbound.put_state('update_rating', {
+                'seq': event.get('seq'),
+                'epoch': event.get('epoch'),
+                'type': 'update_rating',
+                'ratings': event.get('ratings')
+            })
+            return
+        # players get a constant-size payload: top-K plus their own position
+        board = leaderboard_for_event(event)
+        self.outbound.put_state('update_rating', {
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
             'type': 'update_rating',
-            'ratings': event.get('ratings')
+            'top': board.top(),
+            'me': board.position(participant_id),
+        })
+
+    async def question_stats(self, event):
+        # per-question statistics are for the admin panel and overlays, not players
+        if getattr(self, 'participant_id', None):
+            return
+        stats = event.get('stats') or {}
+        self.outbound.put_state(f"question_stats:{stats.get('question_id')}", {
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
+            'type': 'question_stats',
+            'stats': stats,
         })
 
     # simple forwarding handlers for player events
     async def player_submit(self, event):
-        await self.send_json({
+        key = f"player_submit:{event.get('participant_id')}:{event.get('question_id')}"
+        self.outbound.put_state(key, {
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
             'type': 'player_submit',
             'participant_id': event.get('participant_id'),
             'question_id': event.get('question_id'),
@@ -223,82 +338,119 @@ class GameConsumer(AsyncJsonWebsocketConsumer):
         })
 
     async def player_joined(self, event):
-        await self.send_json({
+        self.outbound.put_state(f"player_joined:{event.get('participant_id')}", {
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
             'type': 'player_joined',
             'participant_id': event.get('participant_id'),
         })
 
-    @database_sync_to_async
-    def _save_answer(self, participant_id, question_id, answer_text, bet):
+    @staticmethod
+    def _timestamp(dt):
+        """Return (iso, epoch seconds) for an optional datetime."""
         try:
-            question = Question.objects.get(pk=question_id)
-        except Question.DoesNotExist:
-            return None
+            if dt:
+                return dt.isoformat(), int(dt.timestamp())
+        except Exception:
+            pass
+        return None, None
 
-        participant = None
-        if participant_id:
-            participant = Participant.objects.filter(id=participant_id).first()
+    @db_sync_to_async
+    def _load_snapshot(self, game_id, participant_id):
+        # snapshots read from the read database unless this game/participant was just written here
+        fresh = recently_wrote(f'game:{game_id}', f'participant:{participant_id}' if participant_id else None)
+        with read_replica(not fresh):
+            return self._read_snapshot(game_id, participant_id)
 
-        user_id = participant.session_key if participant else 'anon'
-        team_name = participant.team_name if participant else None
+    def _read_snapshot(self, game_id, participant_id):
+        try:
+            g = Game.objects.select_related('active_question', 'active_round').get(pk=int(game_id))
+        except (Game.DoesNotExist, TypeError, ValueError):
+            return {'accepting': False}
+        state = {'accepting': g.accepting_answers, 'state_version': g.state_version, 'question': None, 'round': None}
+        if not g.accepting_answers:
+            return state
 
-        # sanitize bet: only allow 1 or 2 as coefficients (0 means no bet)
-        if question.allow_bet:
-            try:
-                bval = int(bet) if bet is not None else 0
-            except Exception:
-                bval = 0
-            if bval not in (0, 1, 2):
-                # clamp to 0 if unexpected
-                bval = 0
-            bet_stored = bval
-        else:
-            bet_stored = None
-
-        ans = Answer.objects.create(
-            question=question,
-            user_id=user_id,
-            team_name=team_name,
-            answer_text=answer_text or '',
-            bet_used=bet_stored,
-        )
-        return ans.id
+        q = g.active_question
+        if q is not None:
+            started, started_ts = self._timestamp(g.active_question_started_at)
+            state['question'] = {
+                'id': q.pk,
+                'text': q.text,
+                'type': q.type,
+                'options': q.options or [],
+                'time': getattr(q, 'time_limit', 30),
+                'allow_bet': bool(q.allow_bet),
+                'max_bet': getattr(q, 'max_bet', 10),
+                'started_at': started,
+                'started_at_ts': started_ts,
+            }
 
-    @database_sync_to_async
-    def _save_or_update_answer(self, participant_id, question_id, answer_text, bet):
-        try:
-            question = Question.objects.get(pk=question_id)
-        except Question.DoesNotExist:
-            return None
+        r = g.active_round
+        if r is not None:
+            questions = []
+            for rq in r.questions.all():
+                questions.append({
+                    'id': rq.pk,
+                    'text': rq.text,
+                    'type': rq.type,
+                    'options': rq.options or [],
+                    'allow_bet': bool(rq.allow_bet),
+                    'points': rq.points,
+                })
+            # load saved answers for this participant in this round
+            saved = {}
+            if participant_id:
+                session_key = Participant.objects.filter(pk=participant_id, game=g).values_list('session_key', flat=True).first()
+                if session_key:
+                    for qid, answer_text, bet_used in Answer.objects.filter(user_id=session_key, question__round=r).values_list('question_id', 'answer_text', 'bet_used'):
+                        saved[qid] = {'answer_text': answer_text, 'bet_used': bet_used}
+            started, started_ts = self._timestamp(g.active_round_started_at)
+            state['round'] = {'id': r.pk, 'title': r.title, 'questions': questions, 'saved_answers': saved, 'started_at': started, 'started_at_ts': started_ts}
+        return state
 
-        # ensure the game's accepting_answers flag is True
-        g = question.round.game
-        if not getattr(g, 'accepting_answers', False):
+    @staticmethod
+    def _clean_bet(question, bet):
+        # sanitize bet: only allow 1 or 2 (0 = no bet)
+        if not question.allow_bet:
             return None
+        try:
+            bval = int(bet) if bet is not None else 0
+        except Exception:
+            bval = 0
+        if bval not in (0, 1, 2):
+            bval = 0
+        return bval
 
-        participant = None
-        if participant_id:
-            participant = Participant.objects.filter(id=participant_id).first()
+    def _write_answer(self, question, participant, answer_text, bet, started_at=None, existing=None):
+        """Create or update the participant's answer to `question`; returns its id (None if rejected).
 
+        `existing` maps question ids to the participant's answers when the caller loaded them already.
+        """
+        option = None
+        if question.type == Question.TYPE_CHOICE:
+            # choice answers are stored as an option index; the text is kept for display
+            option = question.option_index(answer_text)
+            if option is not None:
+                answer_text = str(question.options[option])
+            elif answer_text not in (None, ''):
+                return None
         user_id = participant.session_key if participant else 'anon'
         team_name = participant.team_name if participant else None
-
-        # sanitize bet: only allow 1 or 2 (0 = no bet)
-        if question.allow_bet:
-            try:
-                bval = int(bet) if bet is not None else 0
-            except Exception:
-                bval = 0
-            if bval not in (0,1,2):
-                bval = 0
-            bet_stored = bval
-        else:
-            bet_stored = None
+        bet_stored = self._clean_bet(question, bet)
+        # written once the answer commits (before its grade record), by participant id only
+        after_commit(log_event, question.round.game_id, 'answer', p=participant.id if participant else None,
+                     q=question.pk, a=answer_text or '', b=bet_stored)
 
         # find existing answer for this user and question, update it; else create
-        ans = Answer.objects.filter(question=question, user_id=user_id).first()
+        if existing is not None:
+            ans = existing.get(question.pk)
+        else:
+            ans = Answer.objects.filter(question=question, user_id=user_id).first()
         if ans:
+            ans.question = question
             ans.answer_text = answer_text or ''
+            ans.option_index = option
             ans.bet_used = bet_stored
             ans.is_correct = None
             ans.points_awarded = None
@@ -309,6 +461,76 @@ class GameConsumer(AsyncJsonWebsocketConsumer):
                 user_id=user_id,
                 team_name=team_name,
                 answer_text=answer_text or '',
+                option_index=option,
                 bet_used=bet_stored,
+                response_ms=max(0, int((timezone.now() - started_at).total_seconds() * 1000)) if started_at else None,
             )
+        if participant is not None:
+            note_write(f'participant:{participant.id}')
         return ans.id
+
+    def _live_state(self):
+        """Live state of this game from its actor when it lives in this process, else None."""
+        return game_actor.local_state(self.game_id)
+
+    def _open_questions(self, questions, live):
+        """Keep the questions whose game accepts answers; returns (questions, start time of what is open).
+
+        The Game row is read only without a live actor.
+        """
+        game_ids = {q.round.game_id for q in questions}
+        if live is not None and game_ids == {int(self.game_id)}:
+            if not live['accepting_answers']:
+                return [], None
+            return questions, live['active_question_started_at'] or live['active_round_started_at']
+        started = {pk: q_start or r_start for pk, q_start, r_start in Game.objects.filter(
+            pk__in=game_ids, accepting_answers=True).values_list('pk', 'active_question_started_at', 'active_round_started_at')}
+        questions = [q for q in questions if q.round.game_id in started]
+        return questions, started[questions[0].round.game_id] if questions else None
+
+    @db_write_to_async
+    def _save_or_update_answer(self, participant_id, question_id, answer_text, bet, live=None):
+        question = Question.objects.select_related('round__game').filter(pk=question_id).first()
+        if question is None:
+            return None
+
+        # ensure the game's accepting_answers flag is True
+        questions, started_at = self._open_questions([question], live)
+        if not questions:
+            return None
+
+        participant = None
+        if participant_id:
+            participant = Participant.objects.filter(id=participant_id).first()
+        with answer_batch():
+            return self._write_answer(question, participant, answer_text, bet, started_at)
+
+    @db_write_to_async
+    def _save_round_answers(self, participant_id, answers, live=None):
+        by_id = {}
+        for item in answers:
+            try:
+                by_id[int(item.get('question_id'))] = item
+            except (TypeError, ValueError):
+                continue
+        questions = Question.objects.select_related('round__game').filter(pk__in=list(by_id))
+        # ensure the game's accepting_answers flag is True
+        questions, started_at = self._open_questions(list(questions), live)
+        if not questions:
+            return []
+
+        participant = None
+        if participant_id:
+            participant = Participant.objects.filter(id=participant_id).first()
+        user_id = participant.session_key if participant else 'anon'
+        existing = {a.question_id: a for a in Answer.objects.filter(question__in=questions, user_id=user_id)}
+
+        saved_ids = []
+        # one transaction; score / stats deltas and totals applied once for the sheet
+        with answer_batch():
+            for question in questions:
+                item = by_id[question.pk]
+                saved_id = self._write_answer(question, participant, item.get('answer'), item.get('bet'), started_at, existing)
+                if saved_id is not None:
+                    saved_ids.append(saved_id)
+        return saved_ids
@@ -0,0 +1,113 @@
+"""Bounded thread pool for the database work of WebSocket consumers.
+
+`channels.db.database_sync_to_async` runs every call on one shared
+thread-sensitive thread, so under load all consumers queue behind each other.
+`db_sync_to_async` runs them on a dedicated pool of QUIZ_DB_EXECUTOR_WORKERS
+threads instead (0 restores the channels default). `db_write_to_async` is the
+same for answer/grade writes, which go to the single writer (quiz.writer)
+when it is enabled.
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync, database_sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .metrics import DB_HOPS, DB_HOP_SECONDS
+from .tracing import current_trace
+from .querybudget import count_queries, current_counter
+from .writer import get_writer, single_writer_enabled
+
+_lock = threading.Lock()
+_executor = None
+_workers = None
+
+
+def configure_db_executor(workers):
+    """(Re)create the consumer DB pool with `workers` threads; 0 disables it."""
+    global _executor, _workers
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _workers = workers
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='quiz-db') if workers else None
+    return _executor
+
+
+def get_db_executor():
+    if _workers is None:
+        configure_db_executor(getattr(settings, 'QUIZ_DB_EXECUTOR_WORKERS', 8))
+    return _executor
+
+
+def db_sync_to_async(func, write=False):
+    """Like `database_sync_to_async`, but runs `func` on the bounded consumer DB pool."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        DB_HOPS.inc(func=func.__name__)
+        target = func
+        trace = current_trace()
+        if trace is not None and trace.sampled:
+            target = _traced(target, trace)
+        counter = current_counter()
+        if counter is not None:
+            target = _counted(target, counter)
+        with DB_HOP_SECONDS.time(func=func.__name__):
+            if write and single_writer_enabled():
+                return await asyncio.wrap_future(get_writer().submit(target, *args, **kwargs))
+            executor = get_db_executor()
+            if executor is None:
+                return await database_sync_to_async(target)(*args, **kwargs)
+            return await DatabaseSyncToAsync(_managed(target), thread_sensitive=False, executor=executor)(*args, **kwargs)
+    return wrapper
+
+
+def _managed(func):
+    """Apply CONN_MAX_AGE / CONN_HEALTH_CHECKS to the pool thread's connections around `func`.
+
+    DatabaseSyncToAsync closes old connections outside the context `func` runs
+    in, where connections opened by `func` are not visible; doing it here keeps
+    persistent connections reused (and health-checked) and closes them when
+    they are not.
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return inner
+
+
+def db_write_to_async(func):
+    """`db_sync_to_async` for answer/grade writes, funnelled through the single writer when enabled."""
+    return db_sync_to_async(func, write=True)
+
+
+def _traced(func, trace):
+    """Wrap `func` to record the pool queueing time and the DB work as trace spans."""
+    submitted = time.perf_counter()
+
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        started = time.perf_counter()
+        trace.add_span('db_queue', started - submitted)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace.add_span(f'db:{func.__name__}', time.perf_counter() - started)
+    return inner
+
+
+def _counted(func, counter):
+    """Wrap `func` so the queries it runs on the pool thread are added to `counter`."""
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        with count_queries(counter):
+            return func(*args, **kwargs)
+    return inner
@@ -0,0 +1,119 @@
+"""Routing of read-heavy endpoints to an optional read database.
+
+When QUIZ_READ_DATABASE_URL is set, settings add a `replica` alias. Reads go
+there only inside `read_replica()` blocks: the ratings JSON, the public rating
+overlay, the stream page (via `@read_from_replica`) and GameConsumer's
+reconnect snapshots. Everything else, and every write, uses `default`.
+
+Read-your-writes: a request that wrote anything gets a short-lived cookie and
+reads from the primary for QUIZ_READ_REPLICA_PIN_SECONDS; WebSocket snapshots
+read from the primary while their game or participant has a recent write in
+this process (`note_write` / `recently_wrote`).
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA = 'replica'
+PIN_COOKIE = 'quiz_primary'
+
+_reading = ContextVar('quiz_read_replica', default=False)
+_request_writes = ContextVar('quiz_request_writes', default=None)
+
+_recent = {}
+_recent_lock = threading.Lock()
+
+
+def replica_enabled():
+    return REPLICA in settings.DATABASES
+
+
+def pin_seconds():
+    return float(getattr(settings, 'QUIZ_READ_REPLICA_PIN_SECONDS', 5))
+
+
+@contextmanager
+def read_replica(enabled=True):
+    """Send reads inside the block to the read database (when configured and `enabled`)."""
+    token = _reading.set(bool(enabled) and replica_enabled())
+    try:
+        yield
+    finally:
+        _reading.reset(token)
+
+
+def note_write(*keys):
+    """Remember that `keys` (e.g. 'game:3', 'participant:17') were just written."""
+    now = time.monotonic()
+    with _recent_lock:
+        for key in keys:
+            _recent[key] = now
+        if len(_recent) > 10000:
+            horizon = now - pin_seconds()
+            for key in [k for k, t in _recent.items() if t < horizon]:
+                del _recent[key]
+
+
+def recently_wrote(*keys):
+    horizon = time.monotonic() - pin_seconds()
+    with _recent_lock:
+        return any(_recent.get(key, 0) > horizon for key in keys if key)
+
+
+def read_from_replica(view):
+    """View decorator: serve the view's reads from the read database unless the client is pinned."""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        with read_replica(not pinned):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReadReplicaMiddleware:
+    """Pin clients that just wrote to the primary for a few seconds (read-your-writes)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_enabled():
+            return self.get_response(request)
+        writes = []
+        token = _request_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_writes.reset(token)
+        if writes:
+            seconds = pin_seconds()
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=max(1, int(seconds) + 1),
+                                httponly=True, samesite='Lax')
+        return response
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _reading.get():
+            writes = _request_writes.get()
+            # a block that already wrote keeps reading its own writes
+            return 'default' if writes else REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        writes = _request_writes.get()
+        if writes is not None:
+            writes.append(model._meta.label)
+        # never fall back to the instance's database: objects may have been read from the replica
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases hold the same data
+        return True
@@ -0,0 +1,137 @@
+"""Append-only per-game event log (NDJSON, size-rotated).
+
+State transitions are appended as compact JSON lines to
+QUIZ_EVENT_LOG_DIR/game_<id>.ndjson by a background thread:
+
+    {"t": 1718000000.123, "e": "show_question", "q": 12, "time": 30}
+    {"t": ..., "e": "show_round", "r": 3, "time": 60}
+    {"t": ..., "e": "stop", "q": 12}
+    {"t": ..., "e": "answer", "p": 7, "q": 12, "a": "text", "b": 1}
+    {"t": ..., "e": "grade", "p": 7, "q": 12, "c": true, "pts": 3, "src": "moderator"}
+
+Players are identified by participant id (null for answers of unregistered
+sessions), never by session key. Answer and grade records are written once
+their transaction commits, so a rolled-back write leaves no record.
+
+Files rotate at QUIZ_EVENT_LOG_MAX_BYTES keeping QUIZ_EVENT_LOG_BACKUPS old
+files (game_<id>.ndjson.1 is the most recent). `manage.py replay_game`
+feeds a log back through the views and consumers.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def log_dir():
+    return getattr(settings, 'QUIZ_EVENT_LOG_DIR', '')
+
+
+def log_path(game_id):
+    return os.path.join(log_dir(), f'game_{game_id}.ndjson')
+
+
+def log_files(game_id):
+    """Existing log files of a game, oldest first."""
+    path = log_path(game_id)
+    backups = getattr(settings, 'QUIZ_EVENT_LOG_BACKUPS', 5)
+    files = [f'{path}.{i}' for i in range(backups, 0, -1)] + [path]
+    return [f for f in files if os.path.exists(f)]
+
+
+def log_event(game_id, kind, **fields):
+    """Queue one event for the game's log; a no-op when QUIZ_EVENT_LOG_DIR is empty."""
+    if not log_dir() or game_id is None:
+        return
+    record = {'t': round(time.time(), 3), 'e': kind}
+    record.update(fields)
+    _writer.put(game_id, record)
+
+
+def read_events(game_id=None, files=None):
+    """Yield the recorded events of a game (or of the given files) in order."""
+    for path in files or log_files(game_id):
+        with open(path, encoding='utf-8') as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+
+class _EventLogWriter:
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, game_id, record):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='quiz-event-log', daemon=True)
+                    self._thread.start()
+        self._queue.put((game_id, record))
+
+    def flush(self, timeout=5.0):
+        """Wait until queued records are written (used by tools and shutdown hooks)."""
+        done = threading.Event()
+        self._queue.put((None, done))
+        if self._thread is not None:
+            done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = {}
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = []
+            for game_id, record in items:
+                if game_id is None:
+                    waiters.append(record)
+                else:
+                    batch.setdefault(game_id, []).append(record)
+            for game_id, records in batch.items():
+                try:
+                    self._write(game_id, records)
+                except OSError:
+                    logger.exception('Failed to append to event log of game %s', game_id)
+            for waiter in waiters:
+                waiter.set()
+
+    def _write(self, game_id, records):
+        os.makedirs(log_dir(), exist_ok=True)
+        path = log_path(game_id)
+        with open(path, 'a', encoding='utf-8') as fh:
+            for record in records:
+                fh.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            size = fh.tell()
+        if size >= getattr(settings, 'QUIZ_EVENT_LOG_MAX_BYTES', 10 * 1024 * 1024):
+            self._rotate(path)
+
+    @staticmethod
+    def _rotate(path):
+        backups = getattr(settings, 'QUIZ_EVENT_LOG_BACKUPS', 5)
+        if backups <= 0:
+            os.remove(path)
+            return
+        for i in range(backups - 1, 0, -1):
+            if os.path.exists(f'{path}.{i}'):
+                os.replace(f'{path}.{i}', f'{path}.{i + 1}')
+        os.replace(path, f'{path}.1')
+
+
+_writer = _EventLogWriter()
+flush = _writer.flush
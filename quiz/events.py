@@ -0,0 +1,174 @@
+"""Sequenced game events with a per-game ring buffer for reconnect resume.
+
+Every event broadcast to a game (its `game_<id>` group or shards, see quiz.fanout) gets a per-game `seq`
+and the buffer's `epoch`, a random id of this process's sequence space. Recent
+events are kept in memory so a reconnecting client that sends `last_seq` and
+`epoch` only receives what it missed; when the gap is larger than the buffer,
+or the epoch differs (the process restarted and its seqs start over), the
+consumer falls back to a full snapshot.
+
+The buffer lives in the process that publishes and serves WebSockets, which
+matches the single Daphne process deployment in docker-entrypoint.sh.
+"""
+import logging
+import threading
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .fanout import send_to_game
+from .metrics import GROUP_SENDS, GROUP_SEND_SECONDS
+from .tracing import span
+from .eventlog import log_event
+
+logger = logging.getLogger(__name__)
+
+# per thread: where after-commit calls go instead of running (see collect_after_commit)
+_collecting = threading.local()
+
+
+class GameEventBuffer:
+    def __init__(self, size=None):
+        self.size = size or getattr(settings, 'QUIZ_EVENT_BUFFER_SIZE', 200)
+        self._lock = threading.Lock()
+        self._seq = {}
+        self._events = {}
+        # highest seq that fell out of the buffer, per game
+        self._evicted = {}
+        # seqs restart from 1 with every buffer: clients resume only within the same epoch
+        self.epoch = uuid.uuid4().hex[:12]
+
+    def current(self, game_id):
+        return self._seq.get(str(game_id), 0)
+
+    def record(self, game_id, event, buffer=True):
+        """Assign the next seq and the epoch to `event` (a new dict is returned) and buffer it."""
+        key = str(game_id)
+        with self._lock:
+            seq = self._seq.get(key, 0) + 1
+            self._seq[key] = seq
+            event = dict(event, seq=seq, epoch=self.epoch)
+            if buffer:
+                events = self._events.setdefault(key, deque())
+                events.append(event)
+                while len(events) > self.size:
+                    self._evicted[key] = events.popleft()['seq']
+        return event
+
+    def since(self, game_id, last_seq, epoch=None):
+        """Events after `last_seq` of `epoch`, or None when they can no longer be replayed."""
+        if epoch != self.epoch:
+            return None
+        key = str(game_id)
+        with self._lock:
+            if last_seq > self._seq.get(key, 0) or last_seq < self._evicted.get(key, 0):
+                return None
+            return [e for e in self._events.get(key, ()) if e['seq'] > last_seq]
+
+
+game_events = GameEventBuffer()
+
+
+def _log_transition(game_id, event):
+    kind = event.get('type')
+    if kind == 'show_question':
+        log_event(game_id, 'show_question', q=(event.get('question') or {}).get('id'), time=event.get('time'))
+    elif kind == 'show_round':
+        log_event(game_id, 'show_round', r=(event.get('round') or {}).get('id'), time=event.get('time'))
+    elif kind == 'stop_answers':
+        log_event(game_id, 'stop', q=event.get('question_id'))
+
+
+def publish_game_event(game_id, event, buffer=True):
+    """Sequence, buffer and broadcast `event` to the game's group(s) (sync callers).
+
+    Inside a transaction (e.g. a single-writer batch) this happens after the
+    commit: clients never see uncommitted state, and no channel-layer I/O runs
+    while the transaction holds the write lock. Nothing is sent on rollback.
+    """
+    after_commit(_publish, game_id, event, buffer)
+
+
+def _publish(game_id, event, buffer):
+    event = game_events.record(game_id, event, buffer=buffer)
+    _log_transition(game_id, event)
+    GROUP_SENDS.inc(game=game_id, type=event.get('type'))
+    with GROUP_SEND_SECONDS.time(game=game_id):
+        async_to_sync(send_to_game)(get_channel_layer(), game_id, event)
+
+
+def after_commit(func, *args, **kwargs):
+    """Call `func(*args, **kwargs)` now, or once the current transaction commits.
+
+    A failure after the commit is only logged: the write it follows already happened.
+    """
+    _after_commit(None, func, args, kwargs)
+
+
+def after_commit_once(key, func, *args):
+    """`after_commit` for work that needs doing once per commit, such as re-reading and broadcasting a table.
+
+    Calls with the same `key` collected from one single-writer batch run once.
+    """
+    _after_commit(key, func, args, {})
+
+
+def _after_commit(key, func, args, kwargs):
+    if not transaction.get_connection().in_atomic_block:
+        func(*args, **kwargs)
+        return
+
+    def run():
+        calls = getattr(_collecting, 'calls', None)
+        if calls is not None:
+            calls.append((key, func, args, kwargs))
+            return
+        _run_logged(func, args, kwargs)
+    transaction.on_commit(run)
+
+
+def _run_logged(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('%s after commit failed', func.__name__)
+
+
+@contextmanager
+def collect_after_commit(calls):
+    """Append the after-commit calls of commits in the block to `calls` instead of running them.
+
+    The single writer (quiz.writer) resolves its batch's futures first and then
+    hands the calls to `run_collected` on another thread.
+    """
+    _collecting.calls = calls
+    try:
+        yield calls
+    finally:
+        _collecting.calls = None
+
+
+def run_collected(calls):
+    """Run calls gathered by `collect_after_commit` in order, once per `after_commit_once` key."""
+    seen = set()
+    for key, func, args, kwargs in calls:
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        _run_logged(func, args, kwargs)
+
+
+async def apublish_game_event(game_id, event, buffer=True, channel_layer=None):
+    """Async variant of `publish_game_event` for consumers."""
+    event = game_events.record(game_id, event, buffer=buffer)
+    _log_transition(game_id, event)
+    GROUP_SENDS.inc(game=game_id, type=event.get('type'))
+    with GROUP_SEND_SECONDS.time(game=game_id), span('group_send'):
+        await send_to_game(channel_layer or get_channel_layer(), game_id, event)
+    return event
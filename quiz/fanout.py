@@ -0,0 +1,120 @@
+"""Game broadcast groups: one flat group per game, or sharded sub-groups with local relays.
+
+Flat (QUIZ_GROUP_SHARDS = 1, the default): every socket joins `game_<id>` and a
+broadcast is one group_send. The channel layer then expands it to every socket's
+channel, which for Redis means one message per socket.
+
+Sharded (QUIZ_GROUP_SHARDS = N > 1): a socket is assigned to shard
+crc32(participant id or channel name) % N. Sockets do not join a channel-layer
+group themselves. Each worker runs one ShardRelay per game and shard it has
+sockets in, and only the relay's channel joins `game_<id>.s<k>`. A broadcast is
+then N group_sends that reach one relay per worker and shard, and each relay
+hands the event to its local sockets in-process.
+
+Everything that broadcasts to a game goes through `send_to_game`, and
+everything that listens joins `listen_group`.
+"""
+import asyncio
+import logging
+import weakref
+import zlib
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def shard_count():
+    return max(1, int(getattr(settings, 'QUIZ_GROUP_SHARDS', 1)))
+
+
+def shard_of(key, shards=None):
+    """Stable shard of a socket key (crc32, the same in every process)."""
+    return zlib.crc32(str(key).encode()) % (shards or shard_count())
+
+
+def group_names(game_id, shards=None):
+    shards = shards or shard_count()
+    if shards <= 1:
+        return [f'game_{game_id}']
+    return [f'game_{game_id}.s{k}' for k in range(shards)]
+
+
+def listen_group(game_id):
+    """The group a single listener (e.g. a spectator feed) joins to see every broadcast of the game."""
+    return group_names(game_id)[0]
+
+
+async def send_to_game(channel_layer, game_id, event, shards=None):
+    """Broadcast `event` to every group of the game; shards are sent concurrently."""
+    names = group_names(game_id, shards)
+    if len(names) == 1:
+        await channel_layer.group_send(names[0], event)
+    else:
+        await asyncio.gather(*(channel_layer.group_send(name, event) for name in names))
+
+
+class ShardRelay:
+    """One channel-layer subscription for one shard of a game in this worker, expanded to local sockets."""
+
+    def __init__(self, channel_layer, group_name):
+        self.channel_layer = channel_layer
+        self.group_name = group_name
+        self.members = set()
+        self._task = None
+
+    async def start(self):
+        self.channel_name = await self.channel_layer.new_channel('relay.')
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def _pump(self):
+        while True:
+            event = await self.channel_layer.receive(self.channel_name)
+            # members may leave while an event is delivered
+            for member in list(self.members):
+                try:
+                    await member.deliver(event)
+                except Exception:
+                    logger.exception('Relay %s failed to deliver %s', self.group_name, event.get('type'))
+
+
+# relays of the running event loop (the worker's), by group name
+_relays = weakref.WeakKeyDictionary()
+_locks = weakref.WeakKeyDictionary()
+
+
+async def join(member, game_id, key, channel_layer):
+    """Add a socket (an object with `async deliver(event)`) to its shard's relay; returns the group name."""
+    loop = asyncio.get_running_loop()
+    relays = _relays.setdefault(loop, {})
+    lock = _locks.setdefault(loop, asyncio.Lock())
+    name = group_names(game_id)[shard_of(key)]
+    async with lock:
+        relay = relays.get(name)
+        if relay is None:
+            relay = ShardRelay(channel_layer, name)
+            await relay.start()
+            relays[name] = relay
+        relay.members.add(member)
+    return name
+
+
+async def leave(member, name):
+    """Remove a socket from its relay; the relay unsubscribes when it was the last one."""
+    loop = asyncio.get_running_loop()
+    relays = _relays.get(loop, {})
+    async with _locks.setdefault(loop, asyncio.Lock()):
+        relay = relays.get(name)
+        if relay is None:
+            return
+        relay.members.discard(member)
+        if not relay.members:
+            del relays[name]
+            await relay.stop()
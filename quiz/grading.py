@@ -0,0 +1,307 @@
+"""Automatic grading of open answers.
+
+Each open question's accepted answers (`correct_answer` plus one variant per
+line of `accepted_answers`) are compiled into an AnswerIndex. Keys are
+normalized for case, punctuation, Latin accents and ё/е, and Cyrillic is
+transliterated to Latin, so "Пушкин", "пушкин!" and "Pushkin" share one key.
+Exact keys are a set lookup. Near matches compare only keys of similar length, with an edit distance
+bounded by the variant's length (numbers must match exactly).
+
+`AnswerIndex.grade` returns True (exact or near match), False (nothing close)
+or None (ambiguous, e.g. a slightly larger typo or a shared word). Ambiguous
+answers stay in the moderation queue.
+
+When answers stop, the game's actor calls `schedule_answers_closed`. A
+background thread then grades every pending open answer of the round or
+question in bulk (`grade_answers`) and takes the round's leaderboard snapshot
+(quiz.history). Batches of at least QUIZ_AUTOGRADE_PARALLEL_MIN answers are
+matched in a process pool of QUIZ_AUTOGRADE_WORKERS.
+"""
+import logging
+import multiprocessing
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+
+from .metrics import AUTOGRADE_ANSWERS, AUTOGRADE_SECONDS
+from .writer import run_write
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'[^\W_]+')
+_DIGITS_RE = re.compile(r'\d+')
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p',
+    'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'sch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+# spellings that differ between common romanizations, applied in order after transliteration
+_FOLDS = (('shch', 'sch'), ('kh', 'h'), ('ph', 'f'), ('ck', 'k'), ('tz', 'ts'), ('x', 'ks'),
+          ('w', 'v'), ('j', 'y'), ('iy', 'y'), ('yy', 'y'))
+
+
+def _strip_accents(text):
+    # accents on Latin letters (é, ü) are spelling variants; Cyrillic й and ё are letters and keep theirs
+    chars = []
+    for ch in unicodedata.normalize('NFD', text):
+        if unicodedata.combining(ch) and chars and not '\u0400' <= chars[-1] <= '\u04ff':
+            continue
+        chars.append(ch)
+    return unicodedata.normalize('NFC', ''.join(chars))
+
+
+def normalize(text):
+    """Lower-case words of `text` without punctuation or Latin accents, with ё folded to е."""
+    text = _strip_accents(unicodedata.normalize('NFKC', str(text or '')).lower()).replace('ё', 'е')
+    return ' '.join(_WORD_RE.findall(text))
+
+
+def answer_key(text):
+    """Lookup key of an answer: normalized and transliterated to Latin."""
+    key = normalize(text).translate(_TRANSLIT)
+    for old, new in _FOLDS:
+        key = key.replace(old, new)
+    return key
+
+
+def bounded_distance(a, b, limit):
+    """Levenshtein distance of `a` and `b`, or `limit + 1` as soon as it is known to exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if len(a) > len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def variants_of(question):
+    """Accepted answers of a question: correct_answer plus one per line of accepted_answers."""
+    lines = [question.correct_answer or '']
+    lines.extend((question.accepted_answers or '').splitlines())
+    return [line.strip() for line in lines if line.strip()]
+
+
+class AnswerIndex:
+    """Compiled accepted answers of one question."""
+
+    def __init__(self, variants, max_distance=2):
+        self.max_distance = max_distance
+        self.exact = set()
+        self.by_length = defaultdict(list)
+        self.words = set()
+        for variant in variants:
+            key = answer_key(variant)
+            if key and key not in self.exact:
+                self.exact.add(key)
+                self.by_length[len(key)].append(key)
+                self.words.update(w for w in key.split() if len(w) >= 4)
+
+    def __bool__(self):
+        return bool(self.exact)
+
+    def near_bound(self, key):
+        # no typos in short answers, one per four characters in longer ones
+        return min(self.max_distance, len(key) // 4)
+
+    def grade(self, text):
+        key = answer_key(text)
+        if not key:
+            return False
+        if key in self.exact:
+            return True
+        ambiguous = False
+        reach = 2 * self.max_distance + 1
+        digits = _DIGITS_RE.findall(key)
+        for length in range(len(key) - reach, len(key) + reach + 1):
+            for candidate in self.by_length.get(length, ()):
+                bound = self.near_bound(candidate)
+                distance = bounded_distance(key, candidate, 2 * bound + 1)
+                if distance > 2 * bound + 1:
+                    continue
+                if distance <= bound and _DIGITS_RE.findall(candidate) == digits:
+                    return True
+                ambiguous = True
+        if ambiguous or self.words.intersection(key.split()):
+            return None
+        return False
+
+
+def compile_indexes(questions):
+    """{question_id: AnswerIndex} for the questions that have accepted answers."""
+    max_distance = getattr(settings, 'QUIZ_AUTOGRADE_MAX_DISTANCE', 2)
+    indexes = {}
+    for q in questions:
+        index = AnswerIndex(variants_of(q), max_distance)
+        if index:
+            indexes[q.pk] = index
+    return indexes
+
+
+def _grade_rows(indexes, rows):
+    return [(pk, indexes[qid].grade(text)) for pk, qid, text in rows]
+
+
+_worker_indexes = None
+
+
+def _init_worker(indexes):
+    global _worker_indexes
+    _worker_indexes = indexes
+
+
+def _grade_chunk(rows):
+    return _grade_rows(_worker_indexes, rows)
+
+
+def match_answers(indexes, rows, workers=None):
+    """Grade `rows` of (answer_id, question_id, text); returns [(answer_id, verdict)]."""
+    if workers is None:
+        workers = getattr(settings, 'QUIZ_AUTOGRADE_WORKERS', 0)
+    if workers < 2 or len(rows) < getattr(settings, 'QUIZ_AUTOGRADE_PARALLEL_MIN', 2000):
+        return _grade_rows(indexes, rows)
+    size = -(-len(rows) // (workers * 4))
+    chunks = [rows[i:i + size] for i in range(0, len(rows), size)]
+    # spawn: the web process has threads (and database connections) that must not be forked
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(indexes,)) as pool:
+        return [verdict for chunk in pool.map(_grade_chunk, chunks) for verdict in chunk]
+
+
+def _store_verdicts(verdicts):
+    """Store {answer_id: is_correct} on answers that are still pending; returns the stored answers."""
+    from django.db import transaction
+
+    from .models import Answer
+    from .stats import apply_stats_delta, stats_delta
+    from .utils import answer_points, apply_round_score_delta, refresh_total_scores
+
+    with transaction.atomic():
+        # a moderator may have graded some of them meanwhile
+        answers = list(Answer.objects.select_for_update().select_related('question__round')
+                       .filter(pk__in=list(verdicts), is_correct__isnull=True))
+        deltas = defaultdict(lambda: [0, 0])
+        stats = Counter()
+        for a in answers:
+            old_points = a.points_awarded or 0
+            old_stats = a._current_stats_state()
+            a.is_correct = verdicts[a.pk]
+            a.points_awarded = answer_points(a.question, a.is_correct, a.bet_used or 0)
+            delta = deltas[(a.question.round.game_id, a.user_id, a.question.round_id)]
+            delta[0] += 1 if a.is_correct else 0
+            delta[1] += a.points_awarded - old_points
+            # the same old -> new difference Answer.save applies
+            new_stats = a._current_stats_state()
+            stats.update(stats_delta(old_stats, new_stats))
+            a._stats_state = new_stats
+        Answer.objects.bulk_update(answers, ['is_correct', 'points_awarded'])
+        apply_stats_delta(stats)
+        for (game_id, user_id, round_id), (correct, score) in deltas.items():
+            apply_round_score_delta(game_id, user_id, round_id, correct=correct, score=score)
+
+        # keep Participant.total_score in step, as update_score does for single answers
+        games = defaultdict(set)
+        for game_id, user_id, _ in deltas:
+            games[game_id].add(user_id)
+        for game_id, user_ids in games.items():
+            refresh_total_scores(game_id, list(user_ids))
+    return answers
+
+
+def grade_answers(game_id, round_id=None, question_id=None, workers=None, batch_size=500):
+    """Auto-grade the pending open answers of a game, round or question.
+
+    Returns counts {'correct', 'incorrect', 'ambiguous'}; ambiguous answers are left pending.
+    """
+    from .models import Answer, Game, Question
+    from .stats import publish_question_stats
+    from .utils import broadcast_ratings, log_grades
+
+    counts = {'correct': 0, 'incorrect': 0, 'ambiguous': 0}
+    with AUTOGRADE_SECONDS.time(game=game_id):
+        questions = Question.objects.filter(round__game_id=game_id, type=Question.TYPE_OPEN)
+        if round_id is not None:
+            questions = questions.filter(round_id=round_id)
+        if question_id is not None:
+            questions = questions.filter(pk=question_id)
+        indexes = compile_indexes(questions)
+        if not indexes:
+            return counts
+        rows = list(Answer.objects.filter(question_id__in=list(indexes), is_correct__isnull=True)
+                    .order_by('pk').values_list('pk', 'question_id', 'answer_text'))
+        verdicts = {}
+        for pk, verdict in match_answers(indexes, rows, workers):
+            if verdict is None:
+                counts['ambiguous'] += 1
+            else:
+                verdicts[pk] = verdict
+
+        stored = []
+        pending = list(verdicts.items())
+        for i in range(0, len(pending), batch_size):
+            # through the single writer on SQLite, like the players' answer writes
+            stored.extend(run_write(_store_verdicts, dict(pending[i:i + batch_size])))
+        for a in stored:
+            counts['correct' if a.is_correct else 'incorrect'] += 1
+        log_grades(game_id, [(a.user_id, a.question_id, a.is_correct, a.points_awarded) for a in stored])
+
+    for verdict, n in counts.items():
+        if n:
+            AUTOGRADE_ANSWERS.inc(n, verdict=verdict)
+    if stored:
+        broadcast_ratings(Game.objects.get(pk=game_id))
+        for qid in sorted({a.question_id for a in stored}):
+            publish_question_stats(qid)
+    return counts
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _answers_closed(game_id, round_id, question_id):
+    from django.db import close_old_connections
+
+    from .history import capture_snapshot
+    from .models import Question
+
+    close_old_connections()
+    try:
+        if getattr(settings, 'QUIZ_AUTOGRADE', True):
+            try:
+                counts = grade_answers(game_id, round_id=round_id, question_id=question_id)
+                logger.info('Auto-graded game %s round %s question %s: %s', game_id, round_id, question_id, counts)
+            except Exception:
+                logger.exception('Auto-grading of game %s failed', game_id)
+        if round_id is None and question_id is not None:
+            round_id = Question.objects.filter(pk=question_id).values_list('round_id', flat=True).first()
+        # the leaderboard history point of this round, with the grades just stored
+        run_write(capture_snapshot, game_id, round_id)
+    except Exception:
+        logger.exception('Leaderboard snapshot of game %s failed', game_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_answers_closed(game_id, round_id=None, question_id=None):
+    """After answers stop: auto-grade what was open, then snapshot the leaderboard, in a background thread.
+
+    Returns the job's Future.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quiz-autograde')
+    return _executor.submit(_answers_closed, game_id, round_id, question_id)
@@ -0,0 +1,122 @@
+"""Leaderboard history: one packed snapshot per round close, for "rank over time" charts.
+
+A snapshot stores the whole leaderboard of a game in a single row. Participant
+ids (sorted, delta-encoded), total scores and competition ranks are three
+little-endian int32/uint32 arrays, concatenated and zlib-compressed behind a
+version byte. That is about 12 bytes per participant before compression,
+instead of one row per participant per snapshot.
+
+Snapshots are taken after answers stop and auto-grading has finished (see
+quiz.grading). A later stop in the same round refreshes that round's snapshot
+instead of adding another one. `game_history` returns every snapshot of a game
+aligned to one participant list; quiz.views.ratings_history serves it as JSON.
+"""
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .leaderboard import Leaderboard
+
+FORMAT_VERSION = 1
+
+
+def _to_bytes(values, typecode):
+    arr = array(typecode, values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_bytes(data, typecode):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+def pack_snapshot(ids, scores, ranks):
+    """Pack aligned sequences (ids ascending) into the stored bytes."""
+    deltas = [b - a for a, b in zip([0] + list(ids[:-1]), ids)]
+    raw = _to_bytes(deltas, 'I') + _to_bytes(scores, 'i') + _to_bytes(ranks, 'I')
+    return bytes([FORMAT_VERSION]) + zlib.compress(raw, 6)
+
+
+def unpack_snapshot(data):
+    """Inverse of `pack_snapshot`: (ids, scores, ranks) arrays."""
+    data = bytes(data)
+    if not data or data[0] != FORMAT_VERSION:
+        raise ValueError('Unknown leaderboard snapshot format')
+    raw = zlib.decompress(data[1:])
+    n = len(raw) // 12
+    ids = array('I', accumulate(_from_bytes(raw[:4 * n], 'I')))
+    return ids, _from_bytes(raw[4 * n:8 * n], 'i'), _from_bytes(raw[8 * n:], 'I')
+
+
+def current_standings(game_id):
+    """(ids, scores, ranks) of every participant of the game, ids ascending."""
+    from .models import Participant, ParticipantRoundScore
+
+    totals = dict(ParticipantRoundScore.objects.filter(participant__game_id=game_id)
+                  .values_list('participant_id').annotate(total=Sum('score')).order_by())
+    ids = sorted(Participant.objects.filter(game_id=game_id).values_list('id', flat=True))
+    scores = [totals.get(pid, 0) for pid in ids]
+    board = Leaderboard([{'participant_id': pid, 'score': score} for pid, score in zip(ids, scores)])
+    ranks = [board.position(pid)['rank'] for pid in ids]
+    return ids, scores, ranks
+
+
+def capture_snapshot(game_id, round_id=None):
+    """Store the current leaderboard of a game; replaces the latest snapshot when it is of the same round."""
+    from .models import LeaderboardSnapshot
+
+    ids, scores, ranks = current_standings(game_id)
+    fields = {'data': pack_snapshot(ids, scores, ranks), 'participants': len(ids), 'taken_at': timezone.now()}
+    latest = LeaderboardSnapshot.objects.filter(game_id=game_id).order_by('-taken_at', '-pk').first()
+    if latest is not None and round_id is not None and latest.round_id == round_id:
+        LeaderboardSnapshot.objects.filter(pk=latest.pk).update(**fields)
+        return latest.pk
+    return LeaderboardSnapshot.objects.create(game_id=game_id, round_id=round_id, **fields).pk
+
+
+def align_snapshot(data, column):
+    """Unpack stored bytes into (scores, ranks) lists indexed by `column` ({participant_id: position})."""
+    ids, scores, ranks = unpack_snapshot(data)
+    if ids.tolist() == list(column):
+        # nobody registered since: the snapshot is already in column order
+        return scores.tolist(), ranks.tolist()
+    row_scores = [None] * len(column)
+    row_ranks = [None] * len(column)
+    for pid, score, rank in zip(ids, scores, ranks):
+        i = column.get(pid)
+        if i is not None:
+            row_scores[i] = score
+            row_ranks[i] = rank
+    return row_scores, row_ranks
+
+
+def game_history(game):
+    """All snapshots of `game` aligned to one participant list (None where a participant was not yet registered)."""
+    from .models import LeaderboardSnapshot
+
+    participants = list(game.participants.order_by('pk'))
+    column = {p.pk: i for i, p in enumerate(participants)}
+    snapshots = []
+    for snap in (LeaderboardSnapshot.objects.filter(game=game).select_related('round').order_by('taken_at', 'pk')):
+        row_scores, row_ranks = align_snapshot(snap.data, column)
+        snapshots.append({
+            'round_id': snap.round_id,
+            'round': snap.round.title if snap.round else None,
+            'taken_at': snap.taken_at.isoformat(),
+            'scores': row_scores,
+            'ranks': row_ranks,
+        })
+    return {
+        'game_id': game.pk,
+        'participants': [{'participant_id': p.pk, 'name': p.team_name or p.full_name or f'#{p.pk}'} for p in participants],
+        'snapshots': snapshots,
+    }
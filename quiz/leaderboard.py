@@ -0,0 +1,76 @@
+"""Ordered leaderboard used to push top-K plus a personal position to players."""
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# what a row shows; rating entries may carry more and it must not reach players
+ENTRY_FIELDS = ('participant_id', 'team_name', 'score')
+
+
+def top_k():
+    return getattr(settings, 'QUIZ_LEADERBOARD_TOP_K', 20)
+
+
+class Leaderboard:
+    """Ratings sorted by score with tie-aware ranks.
+
+    `rank` is competition ranking (1, 2, 2, 4), `dense_rank` is dense ranking
+    (1, 2, 2, 3). `gap` is how many points are missing to the next better score.
+    """
+
+    def __init__(self, ratings):
+        self.entries = sorted(ratings, key=lambda r: (-(r.get('score') or 0), str(r.get('participant_id'))))
+        self._positions = {}
+        rank = dense = 0
+        prev_score = better_score = None
+        for i, entry in enumerate(self.entries):
+            score = entry.get('score') or 0
+            if i == 0 or score != prev_score:
+                better_score = prev_score
+                rank = i + 1
+                dense += 1
+                prev_score = score
+            self._positions[str(entry.get('participant_id'))] = {
+                'rank': rank,
+                'dense_rank': dense,
+                'score': score,
+                'gap': (better_score - score) if better_score is not None else 0,
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def top(self, k=None):
+        k = top_k() if k is None else k
+        rows = []
+        for entry in self.entries[:k]:
+            row = {k: entry.get(k) for k in ENTRY_FIELDS}
+            row.update(self._positions[str(entry.get('participant_id'))])
+            rows.append(row)
+        return rows
+
+    def position(self, participant_id):
+        pos = self._positions.get(str(participant_id))
+        if pos is None:
+            return None
+        return dict(pos, participant_id=participant_id, total=len(self.entries))
+
+
+# Every consumer in a worker receives the same update_rating event, so the
+# leaderboard is built once per event and shared by all sockets of the worker.
+_CACHE_SIZE = 16
+_cache = OrderedDict()
+
+
+def leaderboard_for_event(event):
+    key = event.get('rating_id')
+    if key is None:
+        return Leaderboard(event.get('ratings') or [])
+    board = _cache.get(key)
+    if board is None:
+        board = Leaderboard(event.get('ratings') or [])
+        _cache[key] = board
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return board
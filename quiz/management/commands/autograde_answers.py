@@ -0,0 +1,59 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from quiz.grading import AnswerIndex, grade_answers, match_answers
+from quiz.models import Game
+
+
+class Command(BaseCommand):
+    help = ('Auto-grade pending open answers against accepted variants, '
+            'or time the matcher on synthetic answers with --bench.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--game', type=int, action='append', help='Game id (repeatable). Defaults to all active games.')
+        parser.add_argument('--round', type=int, help='Only this round.')
+        parser.add_argument('--question', type=int, help='Only this question.')
+        parser.add_argument('--workers', type=int, help='Process pool size (default QUIZ_AUTOGRADE_WORKERS).')
+        parser.add_argument('--bench', type=int, metavar='N', help='Match N synthetic answers inline and in the pool; no database writes.')
+
+    def handle(self, *args, **options):
+        if options['bench']:
+            return self._bench(options['bench'], options['workers'] or 4)
+
+        games = Game.objects.filter(is_active=True)
+        if options['game']:
+            games = Game.objects.filter(pk__in=options['game'])
+        if not games:
+            raise CommandError('No games to grade')
+        for game in games:
+            started = time.perf_counter()
+            counts = grade_answers(game.pk, round_id=options['round'], question_id=options['question'], workers=options['workers'])
+            self.stdout.write(f'game {game.pk}: correct={counts["correct"]} incorrect={counts["incorrect"]} '
+                              f'ambiguous={counts["ambiguous"]} in {time.perf_counter() - started:.2f}s')
+
+    def _bench(self, n, workers):
+        rng = random.Random(42)
+        variants = ['Александр Сергеевич Пушкин', 'Пушкин', 'Лев Толстой', 'Фёдор Достоевский', 'Ломоносов',
+                    'Менделеев', 'Чайковский', 'Эрмитаж', 'Бородинское сражение', '1812']
+        indexes = {qid: AnswerIndex(variants[qid::5]) for qid in range(5)}
+
+        def typo(text):
+            i = rng.randrange(len(text))
+            return text[:i] + rng.choice('абвгдеклмнопрст') + text[i + 1:]
+
+        answers = [v for vs in ([v, v.lower(), typo(v), 'не знаю'] for v in variants) for v in vs]
+        rows = [(pk, pk % 5, rng.choice(answers)) for pk in range(n)]
+
+        timings = {}
+        for label, pool in (('inline', 0), (f'{workers} workers', workers)):
+            started = time.perf_counter()
+            with override_settings(QUIZ_AUTOGRADE_PARALLEL_MIN=0):
+                verdicts = match_answers(indexes, rows, workers=pool)
+            timings[label] = time.perf_counter() - started
+            tally = {v: sum(1 for _, x in verdicts if x is v) for v in (True, False, None)}
+            self.stdout.write(f'{label:>12}: {timings[label]:.3f}s ({n / timings[label]:.0f} answers/s) '
+                              f'correct={tally[True]} incorrect={tally[False]} ambiguous={tally[None]}')
+
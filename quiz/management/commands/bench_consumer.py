@@ -0,0 +1,72 @@
+import asyncio
+import statistics
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+
+from quiz.db import configure_db_executor
+from quiz.models import Game, Round, Question, Participant
+from quiz.routing import websocket_urlpatterns
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark GameConsumer answer saves in-process: messages/s and latency percentiles '
+            'for each DB pool size. Creates a throwaway game and deletes it afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--messages', type=int, default=20, help='save_answer messages per client')
+        parser.add_argument('--workers', default='0,8', help='comma separated DB pool sizes; 0 = channels default thread')
+
+    def handle(self, *args, **options):
+        game = Game.objects.create(title='bench_consumer', is_active=False, accepting_answers=True)
+        try:
+            rnd = Round.objects.create(game=game, title='bench', order=1)
+            questions = [Question.objects.create(round=rnd, text=f'q{i}', type=Question.TYPE_OPEN, points=1) for i in range(options['messages'])]
+            participants = [Participant.objects.create(session_key=f'bench-{i}', game=game) for i in range(options['clients'])]
+            for workers in [int(w) for w in options['workers'].split(',') if w.strip()]:
+                configure_db_executor(workers)
+                rate, lat = asyncio.run(self._run(game, questions, participants))
+                self.stdout.write(
+                    f'workers={workers:<3} clients={len(participants)} msgs/s={rate:8.1f} '
+                    f'p50={percentile(lat, 50) * 1000:7.1f}ms p95={percentile(lat, 95) * 1000:7.1f}ms '
+                    f'p99={percentile(lat, 99) * 1000:7.1f}ms mean={statistics.mean(lat) * 1000:7.1f}ms'
+                )
+        finally:
+            game.delete()
+            configure_db_executor(None)
+
+    async def _run(self, game, questions, participants):
+        app = URLRouter(websocket_urlpatterns)
+        latencies = []
+
+        async def client(participant):
+            comm = WebsocketCommunicator(app, f'/ws/game/{game.id}/')
+            await comm.connect()
+            await comm.send_json_to({'action': 'join_game', 'participant_id': participant.id})
+            for i, q in enumerate(questions):
+                marker = f'{participant.id}-{i}'
+                started = time.perf_counter()
+                await comm.send_json_to({'action': 'save_answer', 'question_id': q.id, 'answer': marker, 'participant_id': participant.id})
+                # wait for our own player_submit echo, skipping everyone else's frames
+                while True:
+                    msg = await comm.receive_json_from(timeout=60)
+                    if msg.get('type') == 'player_submit' and msg.get('answer') == marker:
+                        break
+                latencies.append(time.perf_counter() - started)
+            await comm.disconnect()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[client(p) for p in participants])
+        elapsed = time.perf_counter() - started
+        return len(latencies) / elapsed, latencies
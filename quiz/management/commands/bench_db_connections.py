@@ -0,0 +1,94 @@
+import asyncio
+import statistics
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from quiz.db import configure_db_executor
+from quiz.models import Game, Round, Question, Participant
+from quiz.routing import websocket_urlpatterns
+
+from .bench_consumer import percentile
+
+
+class Command(BaseCommand):
+    help = ('Benchmark WebSocket connect and answer latency with and without persistent DB '
+            'connections (CONN_MAX_AGE=0 vs QUIZ_DB_CONN_MAX_AGE), counting the connections opened. '
+            'A native pool (QUIZ_DB_POOL=pool) cannot be switched off in-process: run the command '
+            'once per QUIZ_DB_POOL value to compare it. Creates a throwaway game and deletes it afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--answers', type=int, default=10, help='save_answer messages per client')
+        parser.add_argument('--modes', default='off,persistent', help='comma separated: off, persistent, current')
+
+    def handle(self, *args, **options):
+        db = connections['default'].settings_dict
+        configured = (db['CONN_MAX_AGE'], db.get('CONN_HEALTH_CHECKS', False))
+        pooled = bool(db.get('OPTIONS', {}).get('pool'))
+        opened = []
+
+        def on_connect(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(on_connect)
+        game = Game.objects.create(title='bench_db_connections', is_active=False, accepting_answers=True)
+        try:
+            rnd = Round.objects.create(game=game, title='bench', order=1)
+            questions = [Question.objects.create(round=rnd, text=f'q{i}', type=Question.TYPE_OPEN, points=1) for i in range(options['answers'])]
+            participants = [Participant.objects.create(session_key=f'bench-conn-{i}', game=game) for i in range(options['clients'])]
+            for mode in [m.strip() for m in options['modes'].split(',') if m.strip()]:
+                if mode == 'off':
+                    if pooled:
+                        self.stdout.write('mode=off skipped: the native pool is configured (set QUIZ_DB_POOL=off)')
+                        continue
+                    db['CONN_MAX_AGE'], db['CONN_HEALTH_CHECKS'] = 0, False
+                elif mode == 'persistent':
+                    db['CONN_MAX_AGE'], db['CONN_HEALTH_CHECKS'] = settings.QUIZ_DB_CONN_MAX_AGE, True
+                else:
+                    db['CONN_MAX_AGE'], db['CONN_HEALTH_CHECKS'] = configured
+                    mode = f'current({settings.QUIZ_DB_POOL})'
+                # fresh pool threads so no connection outlives the previous mode
+                configure_db_executor(settings.QUIZ_DB_EXECUTOR_WORKERS)
+                opened.clear()
+                connect_lat, answer_lat = asyncio.run(self._run(game, questions, participants))
+                self.stdout.write(
+                    f'mode={mode:<12} clients={len(participants)} connections_opened={len(opened):<5} '
+                    f'connect p50={percentile(connect_lat, 50) * 1000:6.1f}ms p95={percentile(connect_lat, 95) * 1000:6.1f}ms | '
+                    f'answer p50={percentile(answer_lat, 50) * 1000:6.1f}ms p95={percentile(answer_lat, 95) * 1000:6.1f}ms '
+                    f'mean={statistics.mean(answer_lat) * 1000:6.1f}ms'
+                )
+        finally:
+            db['CONN_MAX_AGE'], db['CONN_HEALTH_CHECKS'] = configured
+            connection_created.disconnect(on_connect)
+            game.delete()
+            configure_db_executor(None)
+
+    async def _run(self, game, questions, participants):
+        app = URLRouter(websocket_urlpatterns)
+        connect_lat, answer_lat = [], []
+
+        async def client(participant):
+            started = time.perf_counter()
+            comm = WebsocketCommunicator(app, f'/ws/game/{game.id}/?participant_id={participant.id}')
+            await comm.connect()
+            # the snapshot frame is sent after the connect-time DB hop
+            await comm.receive_json_from(timeout=60)
+            connect_lat.append(time.perf_counter() - started)
+            for q in questions:
+                started = time.perf_counter()
+                await comm.send_json_to({'action': 'save_answer', 'question_id': q.id, 'answer': 'x', 'participant_id': participant.id})
+                while True:
+                    msg = await comm.receive_json_from(timeout=60)
+                    if msg.get('type') == 'ack' and msg.get('question_id') == q.id:
+                        break
+                answer_lat.append(time.perf_counter() - started)
+            await comm.disconnect()
+
+        await asyncio.gather(*[client(p) for p in participants])
+        return connect_lat, answer_lat
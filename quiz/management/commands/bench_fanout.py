@@ -0,0 +1,105 @@
+import asyncio
+import random
+import statistics
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from quiz.fanout import ShardRelay, group_names, send_to_game, shard_of
+
+
+class _Socket:
+    """Stands in for a GameConsumer: records when the broadcast reached it."""
+
+    def __init__(self, arrivals):
+        self.arrivals = arrivals
+
+    async def deliver(self, event):
+        self.arrivals.append(time.perf_counter())
+
+
+class Command(BaseCommand):
+    help = ('Time update_rating broadcasts to N players with one flat game group and with sharded '
+            'sub-groups relayed per worker (quiz.fanout). In-memory channel layer unless --redis is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', default='300,1000,3000', help='comma-separated player counts')
+        parser.add_argument('--shards', type=int, default=8)
+        parser.add_argument('--workers', type=int, default=4, help='simulated web workers (relays per shard)')
+        parser.add_argument('--events', type=int, default=3, help='broadcasts per layout and size')
+        parser.add_argument('--redis', help='redis:// URL to run against channels_redis instead of the in-memory layer')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'shards={options["shards"]} workers={options["workers"]}, '
+                          f'median of {options["events"]} broadcasts (full rating table per event)')
+        self.stdout.write(f'{"players":>8} {"flat":>10} {"sharded":>10}')
+        for players in [int(n) for n in options['players'].split(',')]:
+            flat = asyncio.run(self._run(self._flat, players, options))
+            sharded = asyncio.run(self._run(self._sharded, players, options))
+            self.stdout.write(f'{players:>8} {flat * 1000:>8.0f}ms {sharded * 1000:>8.0f}ms')
+
+    def _layer(self, options, players):
+        if options['redis']:
+            from channels_redis.core import RedisChannelLayer
+            return RedisChannelLayer(hosts=[options['redis']], capacity=options['events'] + 10)
+        return InMemoryChannelLayer(capacity=options['events'] + 10)
+
+    async def _run(self, layout, players, options):
+        rng = random.Random(players)
+        layer = self._layer(options, players)
+        arrivals = []
+        stop = await layout(layer, players, options, arrivals)
+        timings = []
+        try:
+            for i in range(options['events']):
+                ratings = [{'participant_id': pid, 'team_name': f'Команда {pid}', 'score': rng.randrange(100)}
+                           for pid in range(players)]
+                arrivals.clear()
+                started = time.perf_counter()
+                await send_to_game(layer, 1, {'type': 'update_rating', 'ratings': ratings, 'rating_id': str(i), 'seq': i + 1},
+                                   shards=options['shards'] if layout == self._sharded else 1)
+                while len(arrivals) < players:
+                    await asyncio.sleep(0.001)
+                timings.append(max(arrivals) - started)
+        finally:
+            await stop()
+        return statistics.median(timings)
+
+    async def _flat(self, layer, players, options, arrivals):
+        # one channel per socket in game_1, each with its own receive loop (as a consumer has)
+        socket = _Socket(arrivals)
+
+        async def receive_loop(channel):
+            while True:
+                await socket.deliver(await layer.receive(channel))
+
+        channels = []
+        for _ in range(players):
+            channel = await layer.new_channel('bench.')
+            await layer.group_add(group_names(1, 1)[0], channel)
+            channels.append(channel)
+        tasks = [asyncio.ensure_future(receive_loop(c)) for c in channels]
+
+        async def stop():
+            for task in tasks:
+                task.cancel()
+            for channel in channels:
+                await layer.group_discard(group_names(1, 1)[0], channel)
+        return stop
+
+    async def _sharded(self, layer, players, options, arrivals):
+        # one relay per (worker, shard); players spread over workers round-robin
+        names = group_names(1, options['shards'])
+        relays = {}
+        for worker in range(options['workers']):
+            for name in names:
+                relays[worker, name] = ShardRelay(layer, name)
+                await relays[worker, name].start()
+        for pid in range(players):
+            relays[pid % options['workers'], names[shard_of(pid, options['shards'])]].members.add(_Socket(arrivals))
+
+        async def stop():
+            for relay in relays.values():
+                await relay.stop()
+        return stop
@@ -0,0 +1,93 @@
+import random
+import sqlite3
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from quiz.history import align_snapshot, pack_snapshot, unpack_snapshot
+from quiz.leaderboard import Leaderboard
+
+
+def _sqlite_bytes(conn):
+    return conn.execute('PRAGMA page_count').fetchone()[0] * conn.execute('PRAGMA page_size').fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = ('Compare packed leaderboard snapshots with one row per participant per snapshot: '
+            'storage, decoded memory and history assembly time. In-memory only, no database writes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=2000)
+        parser.add_argument('--snapshots', type=int, default=50)
+
+    def handle(self, *args, **options):
+        n, rounds = options['participants'], options['snapshots']
+        rng = random.Random(42)
+        ids = sorted(rng.sample(range(1, n * 5), n))
+        totals = dict.fromkeys(ids, 0)
+        history = []
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for pid in ids:
+                totals[pid] += rng.choice((0, 0, 1, 1, 2, 3))
+            scores = [totals[pid] for pid in ids]
+            board = Leaderboard([{'participant_id': pid, 'score': s} for pid, s in zip(ids, scores)])
+            history.append((scores, [board.position(pid)['rank'] for pid in ids]))
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        packed = [pack_snapshot(ids, scores, ranks) for scores, ranks in history]
+        pack = time.perf_counter() - started
+        assert all(tuple(unpack_snapshot(p)[0]) == tuple(ids) for p in packed[:1])
+
+        # storage: the LeaderboardSnapshot layout against a row per participant, in SQLite
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE snap (id INTEGER PRIMARY KEY, game_id INT, round_id INT, '
+                     'taken_at TEXT, participants INT, data BLOB)')
+        conn.executemany('INSERT INTO snap (game_id, round_id, taken_at, participants, data) VALUES (1, ?, ?, ?, ?)',
+                         [(i, '2026-01-01T00:00:00', n, p) for i, p in enumerate(packed)])
+        conn.commit()
+        packed_db = _sqlite_bytes(conn)
+        conn.close()
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE row (id INTEGER PRIMARY KEY, game_id INT, round_id INT, taken_at TEXT, '
+                     'participant_id INT, score INT, rank INT)')
+        conn.execute('CREATE INDEX row_game_idx ON row (game_id, taken_at)')
+        conn.executemany('INSERT INTO row (game_id, round_id, taken_at, participant_id, score, rank) VALUES (1, ?, ?, ?, ?, ?)',
+                         [(i, '2026-01-01T00:00:00', pid, s, r)
+                          for i, (scores, ranks) in enumerate(history) for pid, s, r in zip(ids, scores, ranks)])
+        conn.commit()
+        rows_db = _sqlite_bytes(conn)
+        conn.close()
+
+        # decoded memory: arrays as unpacked, aligned lists as served, dicts per participant
+        tracemalloc.start()
+        decoded = [unpack_snapshot(p) for p in packed]
+        arrays_mem = tracemalloc.get_traced_memory()[0]
+        del decoded
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        column = {pid: i for i, pid in enumerate(ids)}
+        started = time.perf_counter()
+        aligned = [align_snapshot(p, column) for p in packed]
+        assemble = time.perf_counter() - started
+        aligned_mem = tracemalloc.get_traced_memory()[0] - base
+        del aligned
+        base = tracemalloc.get_traced_memory()[0]
+        dicts = [[{'participant_id': pid, 'score': s, 'rank': r} for pid, s, r in zip(ids, scores, ranks)]
+                 for scores, ranks in history]
+        dicts_mem = tracemalloc.get_traced_memory()[0] - base
+        del dicts
+        tracemalloc.stop()
+
+        raw = sum(len(p) for p in packed)
+        kib = 1024
+        self.stdout.write(f'{n} participants x {rounds} snapshots (standings built in {build:.2f}s)')
+        self.stdout.write(f'  packed blobs:        {raw / kib:9.1f} KiB ({raw / (n * rounds):.2f} B/participant/snapshot), '
+                          f'packed in {pack * 1000:.1f} ms')
+        self.stdout.write(f'  sqlite, packed:      {packed_db / kib:9.1f} KiB')
+        self.stdout.write(f'  sqlite, row each:    {rows_db / kib:9.1f} KiB ({rows_db / packed_db:.1f}x)')
+        self.stdout.write(f'  decoded arrays:      {arrays_mem / kib:9.1f} KiB')
+        self.stdout.write(f'  aligned lists:       {aligned_mem / kib:9.1f} KiB, history assembled in {assemble * 1000:.1f} ms')
+        self.stdout.write(f'  dict per row:        {dicts_mem / kib:9.1f} KiB')
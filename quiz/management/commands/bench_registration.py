@@ -0,0 +1,110 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from quiz.models import Game, Participant
+
+from .bench_consumer import percentile
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class _WriteCounter:
+    """`execute_wrapper` hook counting all and writing statements, shared by the benchmark threads."""
+
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.queries += 1
+            if sql.lstrip().upper().startswith(WRITE_PREFIXES):
+                self.writes += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Registration burst: N phones open the registration page, register (--taps POSTs each, as with '
+            'double taps) and open the play page within a time window, for each session engine. Reports '
+            'latency, participants created (should equal N) and DB queries/writes per registration. '
+            'Creates a throwaway game and deletes it afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registrations', type=int, default=500)
+        parser.add_argument('--seconds', type=float, default=10.0, help='window the registrations are spread over')
+        parser.add_argument('--concurrency', type=int, default=32, help='client threads')
+        parser.add_argument('--sessions', default='db,cached_db,signed_cookies', help='comma separated session engines')
+        parser.add_argument('--taps', type=int, default=2, help='registration POSTs per phone (double taps / refreshes)')
+        parser.add_argument('--timeline', action='store_true', help='print p50/p95 per second of the burst')
+
+    def handle(self, *args, **options):
+        n = options['registrations']
+        for engine in [e.strip() for e in options['sessions'].split(',') if e.strip()]:
+            game = Game.objects.create(title='bench_registration', is_active=False)
+            try:
+                with override_settings(SESSION_ENGINE=f'django.contrib.sessions.backends.{engine}'):
+                    latencies, counter, failed, elapsed = self._burst(game, n, options['seconds'], options['concurrency'], options['taps'])
+                participants = Participant.objects.filter(game=game).count()
+                totals = [took for _, took in latencies]
+                self.stdout.write(
+                    f'sessions={engine:<15} registrations={n} failed={failed} participants={participants} '
+                    f'rate={n / elapsed:6.1f}/s | p50={percentile(totals, 50) * 1000:6.1f}ms '
+                    f'p95={percentile(totals, 95) * 1000:6.1f}ms mean={statistics.mean(totals or [0]) * 1000:6.1f}ms | '
+                    f'queries/reg={counter.queries / n:5.1f} db_writes/reg={counter.writes / n:5.2f}'
+                )
+                if options['timeline']:
+                    by_second = {}
+                    for offset, took in latencies:
+                        by_second.setdefault(int(offset), []).append(took)
+                    for second in sorted(by_second):
+                        values = by_second[second]
+                        self.stdout.write(f'  t={second:>3}s n={len(values):<4} p50={percentile(values, 50) * 1000:6.1f}ms '
+                                          f'p95={percentile(values, 95) * 1000:6.1f}ms')
+            finally:
+                game.delete()
+
+    def _burst(self, game, n, seconds, concurrency, taps=1):
+        counter = _WriteCounter()
+        latencies = []
+        failed = [0]
+        lock = threading.Lock()
+        start_at = time.perf_counter() + 0.1
+
+        def phone(i):
+            # spread the arrivals evenly over the window, like people scanning the QR code
+            delay = start_at + i * seconds / n - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            client = Client(SERVER_NAME='localhost')
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(counter))
+                started = time.perf_counter()
+                client.get(f'/game/{game.id}/register/')
+                ok = True
+                for _ in range(max(1, taps)):
+                    response = client.post(f'/game/{game.id}/register/', {
+                        'last_name': 'Иванов', 'first_name': f'Игрок{i}', 'middle_name': 'Петрович',
+                    })
+                    ok = ok and response.status_code == 302
+                ok = ok and client.get(f'/game/{game.id}/play/').status_code == 200
+                took = time.perf_counter() - started
+            connections.close_all()
+            with lock:
+                latencies.append((started - start_at, took))
+                if not ok:
+                    failed[0] += 1
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(phone, range(n)))
+        return latencies, counter, failed[0], time.perf_counter() - began
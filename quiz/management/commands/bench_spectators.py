@@ -0,0 +1,104 @@
+import asyncio
+import random
+import statistics
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from quiz.leaderboard import leaderboard_for_event
+from quiz.spectators import GameFeed, encode_frame
+
+
+class Command(BaseCommand):
+    help = ('Broadcast rating updates to N in-process spectators through one shared feed (quiz.spectators) '
+            'and through one channel per spectator (as WebSocket sockets in the game group); '
+            'reports CPU, bytes and delivery lag. In-memory channel layer, no database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spectators', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=50, help='rating updates broadcast')
+        parser.add_argument('--rate', type=float, default=20.0, help='updates per second')
+        parser.add_argument('--participants', type=int, default=300, help='rows in each rating event')
+        parser.add_argument('--interval', type=float, default=1.0, help='spectator throttle (QUIZ_SPECTATOR_INTERVAL)')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        events = []
+        for i in range(options['events']):
+            ratings = [{'participant_id': pid, 'team_name': f'Команда {pid}', 'score': rng.randrange(100)}
+                       for pid in range(options['participants'])]
+            events.append({'type': 'update_rating', 'ratings': ratings, 'rating_id': str(i), 'seq': i + 1})
+
+        self.stdout.write(f'{options["spectators"]} spectators, {len(events)} rating updates at {options["rate"]}/s, '
+                          f'{options["participants"]} rows each')
+        for label, runner in (('shared feed', self._feed), ('channel each', self._flat)):
+            with override_settings(QUIZ_SPECTATOR_INTERVAL=options['interval']):
+                cpu, wall, frames, size, lags = asyncio.run(runner(events, options))
+            self.stdout.write(
+                f'{label:>13}: cpu {cpu:.2f}s wall {wall:.2f}s, {frames} frames / {size / 1024 / 1024:.1f} MiB delivered, '
+                f'last update lag p50 {statistics.median(lags) * 1000:.0f} ms max {max(lags) * 1000:.0f} ms')
+
+    async def _broadcast(self, layer, events, rate):
+        # lag is measured from when the last update was due, so a broadcast that falls behind shows up
+        started = time.perf_counter()
+        for i, event in enumerate(events):
+            await asyncio.sleep(max(0.0, started + i / rate - time.perf_counter()))
+            await layer.group_send('game_1', event)
+        return started + (len(events) - 1) / rate
+
+    async def _feed(self, events, options):
+        layer = InMemoryChannelLayer()
+        feed = GameFeed(1, layer)
+        await feed.start()
+        last = f'"seq":{events[-1]["seq"]},'.encode()
+        arrivals = []
+        totals = [0, 0]
+
+        async def spectator():
+            s = feed.subscribe()
+            while True:
+                chunk = await s.frames()
+                totals[0] += chunk.count(b'event: ')
+                totals[1] += len(chunk)
+                if last in chunk:
+                    arrivals.append(time.perf_counter())
+                    return
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        tasks = [asyncio.ensure_future(spectator()) for _ in range(options['spectators'])]
+        sent = await self._broadcast(layer, events, options['rate'])
+        await asyncio.gather(*tasks)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        await feed.stop()
+        return cpu, wall, totals[0], totals[1], [t - sent for t in arrivals]
+
+    async def _flat(self, events, options):
+        layer = InMemoryChannelLayer(capacity=len(events) + 10)
+        arrivals = []
+        totals = [0, 0]
+        channels = []
+        for _ in range(options['spectators']):
+            channel = await layer.new_channel('bench.')
+            await layer.group_add('game_1', channel)
+            channels.append(channel)
+
+        async def socket(channel):
+            # each socket serializes its own frame, as a consumer does (leaderboard shared per event)
+            while True:
+                event = await layer.receive(channel)
+                board = leaderboard_for_event(event)
+                frame = encode_frame('rating', {'seq': event['seq'], 'top': board.top(20)})
+                totals[0] += 1
+                totals[1] += len(frame)
+                if event['seq'] == events[-1]['seq']:
+                    arrivals.append(time.perf_counter())
+                    return
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        tasks = [asyncio.ensure_future(socket(c)) for c in channels]
+        sent = await self._broadcast(layer, events, options['rate'])
+        await asyncio.gather(*tasks)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        return cpu, wall, totals[0], totals[1], [t - sent for t in arrivals]
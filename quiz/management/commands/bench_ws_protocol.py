@@ -0,0 +1,83 @@
+import json
+import random
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+
+from quiz import protocol
+from quiz.leaderboard import Leaderboard
+
+
+def _round_payload(rng, questions):
+    texts = ['Кто написал роман «Война и мир»?', 'В каком году основан Санкт-Петербург?',
+             'Какой композитор написал балет «Лебединое озеро»?', 'Назовите автора картины «Девятый вал».']
+    options = [['Толстой', 'Достоевский', 'Чехов', 'Тургенев'], ['1703', '1712', '1698', '1721'],
+               ['Чайковский', 'Глинка', 'Мусоргский', 'Прокофьев'], ['Айвазовский', 'Шишкин', 'Репин', 'Левитан']]
+    return {'id': 7, 'title': 'Раунд 3 — Русская культура', 'questions': [{
+        'id': 100 + i, 'text': rng.choice(texts), 'type': rng.choice(['choice', 'open']),
+        'options': rng.choice(options), 'allow_bet': bool(i % 2), 'max_bet': 10, 'points': 1 + i % 3,
+    } for i in range(questions)]}
+
+
+class Command(BaseCommand):
+    help = 'Compare JSON and MessagePack (quiz.protocol) frame sizes and encode/decode CPU on realistic payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=300, help='rows of the admin rating table')
+        parser.add_argument('--questions', type=int, default=12, help='questions in the round payload')
+        parser.add_argument('--repeat', type=int, default=2000, help='encode/decode iterations per payload')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        rnd = _round_payload(rng, options['questions'])
+        ratings = [{'participant_id': pid, 'team_name': f'Команда «{pid}»', 'score': rng.randrange(60)}
+                   for pid in range(options['participants'])]
+        board = Leaderboard(ratings)
+        payloads = {
+            'show_round': {'seq': 41, 'type': 'show_round', 'round': rnd, 'time': 60},
+            'snapshot round': {'type': 'show_round', 'seq': 41, 'snapshot': True, 'round': dict(
+                rnd, saved_answers={q['id']: {'answer_text': 'Толстой', 'bet_used': 1} for q in rnd['questions'][:6]},
+                started_at='2026-10-19T19:00:00+00:00', started_at_ts=1792436400)},
+            'rating (player)': {'seq': 42, 'type': 'update_rating', 'top': board.top(), 'me': board.position(17)},
+            'rating (admin)': {'seq': 42, 'type': 'update_rating', 'ratings': ratings},
+            'ack': {'type': 'ack', 'action': 'save_round_answers', 'ok': True, 'correlation_id': 'a1b2c3d4e5f6',
+                    'saved_ids': list(range(5000, 5012))},
+            'save_round_answers (in)': {'action': 'save_round_answers', 'participant_id': '17', 'answers': [
+                {'question_id': q['id'], 'answer': 'Лев Толстой', 'bet': 1} for q in rnd['questions']]},
+        }
+        encoders = {
+            # what AsyncJsonWebsocketConsumer sends today
+            'json': (lambda c: json.dumps(c).encode(), lambda b: json.loads(b)),
+            'json utf-8': (lambda c: json.dumps(c, ensure_ascii=False, separators=(',', ':')).encode(), lambda b: json.loads(b)),
+            'msgpack': (lambda c: msgpack.packb(c, use_bin_type=True), lambda b: msgpack.unpackb(b, raw=False, strict_map_key=False)),
+            'msgpack codes': (protocol.pack, protocol.unpack),
+        }
+        n = options['repeat']
+        self.stdout.write(f'{"payload":<24}' + ''.join(f'{name:>26}' for name in encoders))
+        self.stdout.write(f'{"":<24}' + ''.join(f'{"bytes   enc/dec us":>26}' for _ in encoders))
+        totals = dict.fromkeys(encoders, 0)
+        for label, content in payloads.items():
+            cells = []
+            for name, (encode, decode) in encoders.items():
+                data = encode(content)
+                assert decode(data) is not None
+                reps = max(1, n // 20) if 'admin' in label else n
+                started = time.perf_counter()
+                for _ in range(reps):
+                    encode(content)
+                enc = (time.perf_counter() - started) / reps * 1e6
+                started = time.perf_counter()
+                for _ in range(reps):
+                    decode(data)
+                dec = (time.perf_counter() - started) / reps * 1e6
+                totals[name] += len(data)
+                cells.append(f'{len(data):>8} {enc:>8.1f}/{dec:<8.1f}')
+            self.stdout.write(f'{label:<24}' + ''.join(f'{c:>26}' for c in cells))
+        base = totals['json']
+        self.stdout.write('total bytes: ' + ', '.join(f'{name} {size} ({size / base:.0%})' for name, size in totals.items()))
+
+        # round trip keeps every field (int keys of saved_answers come back as ints)
+        for label, content in payloads.items():
+            if protocol.unpack(protocol.pack(content)) != content:
+                self.stderr.write(f'{label}: MessagePack round trip differs')
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import statistics
+import threading
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from quiz.db import configure_db_executor
+from quiz.models import Game, Round, Question, Participant, Answer
+from quiz.routing import websocket_urlpatterns
+from quiz.writer import run_write
+
+from .bench_consumer import percentile
+
+
+class _LockErrors(logging.Handler):
+    """Count log records mentioning a locked database (consumer errors are logged, not raised here)."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        text = record.getMessage()
+        if record.exc_info and record.exc_info[1] is not None:
+            text += str(record.exc_info[1])
+        if 'database is locked' in text:
+            self.count += 1
+
+
+class Command(BaseCommand):
+    help = ('Load test answer writes on the default database: N players save answers over WebSocket '
+            'while a moderator grades them, with and without the single writer. Reports failed saves, '
+            '"database is locked" errors and ack latency. Creates a throwaway game and deletes it afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=300)
+        parser.add_argument('--answers', type=int, default=5, help='save_answer messages per player')
+        parser.add_argument('--writer', default='on,off', help='comma separated single-writer modes to run')
+
+    def handle(self, *args, **options):
+        vendor = connections['default'].vendor
+        if vendor != 'sqlite':
+            self.stdout.write(f'note: the default database is {vendor}, not SQLite')
+        errors = _LockErrors()
+        logging.getLogger().addHandler(errors)
+        original = settings.QUIZ_DB_SINGLE_WRITER
+        game = Game.objects.create(title='load_test_sqlite', is_active=False, accepting_answers=True)
+        try:
+            rnd = Round.objects.create(game=game, title='load', order=1)
+            questions = [Question.objects.create(round=rnd, text=f'q{i}', type=Question.TYPE_OPEN, points=1) for i in range(options['answers'])]
+            participants = Participant.objects.bulk_create(
+                [Participant(session_key=f'load-{i}', game=game) for i in range(options['players'])])
+            for mode in [m.strip() for m in options['writer'].split(',') if m.strip()]:
+                settings.QUIZ_DB_SINGLE_WRITER = mode
+                Answer.objects.filter(question__round=rnd).delete()
+                configure_db_executor(settings.QUIZ_DB_EXECUTOR_WORKERS)
+                errors.count = 0
+                started = time.perf_counter()
+                latencies, failed, graded = asyncio.run(self._run(game, questions, participants))
+                elapsed = time.perf_counter() - started
+                saved = Answer.objects.filter(question__round=rnd).count()
+                self.stdout.write(
+                    f'writer={mode:<4} players={len(participants)} saves={len(latencies)} failed={failed} '
+                    f'locked_errors={errors.count} stored={saved} graded={graded} time={elapsed:.1f}s | '
+                    f'ack p50={percentile(latencies, 50) * 1000:.1f}ms p95={percentile(latencies, 95) * 1000:.1f}ms '
+                    f'p99={percentile(latencies, 99) * 1000:.1f}ms mean={statistics.mean(latencies or [0]) * 1000:.1f}ms'
+                )
+        finally:
+            settings.QUIZ_DB_SINGLE_WRITER = original
+            logging.getLogger().removeHandler(errors)
+            game.delete()
+            configure_db_executor(None)
+
+    async def _run(self, game, questions, participants):
+        app = URLRouter(websocket_urlpatterns)
+        latencies = []
+        failed = 0
+        done = threading.Event()
+        graded = [0]
+
+        def moderator():
+            # grade saved answers while players are still writing, as a moderator would
+            while not done.is_set():
+                for answer in Answer.objects.filter(question__in=questions, is_correct__isnull=True)[:20]:
+                    answer.is_correct = True
+                    answer.points_awarded = 1
+                    try:
+                        run_write(answer.save)
+                        graded[0] += 1
+                    except Exception as exc:
+                        logging.getLogger(__name__).error('grade failed: %s', exc)
+                time.sleep(0.05)
+            connections.close_all()
+
+        async def player(participant):
+            nonlocal failed
+            comm = WebsocketCommunicator(app, f'/ws/game/{game.id}/?participant_id={participant.id}')
+            await comm.connect(timeout=60)
+            for q in questions:
+                started = time.perf_counter()
+                await comm.send_json_to({'action': 'save_answer', 'question_id': q.id, 'answer': 'x', 'participant_id': participant.id})
+                try:
+                    while True:
+                        msg = await comm.receive_json_from(timeout=60)
+                        if msg.get('type') == 'ack' and msg.get('question_id') == q.id:
+                            break
+                except Exception:
+                    failed += 1
+                    break
+                if not msg.get('ok'):
+                    failed += 1
+                latencies.append(time.perf_counter() - started)
+            await comm.disconnect()
+
+        grader = threading.Thread(target=moderator, name='load-moderator')
+        grader.start()
+        try:
+            await asyncio.gather(*[player(p) for p in participants])
+        finally:
+            done.set()
+            await asyncio.get_running_loop().run_in_executor(None, grader.join)
+        return latencies, failed, graded[0]
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.models import Game, Question
+from quiz.stats import compute_question_stats, materialized_question_stats, rebuild_question_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-question statistics (QuestionStat) from raw answers (or verify them with --check).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--game', type=int, action='append', help='Game id (repeatable). Defaults to all games.')
+        parser.add_argument('--check', action='store_true', help='Only compare stored counters with the raw aggregation.')
+
+    def handle(self, *args, **options):
+        games = Game.objects.all()
+        if options['game']:
+            games = games.filter(pk__in=options['game'])
+
+        mismatched = 0
+        for game in games:
+            questions = Question.objects.filter(round__game=game)
+            if options['check']:
+                raw = compute_question_stats(questions)
+                stored = materialized_question_stats(questions)
+                diff = sorted(k for k in set(raw) | set(stored) if raw.get(k) != stored.get(k))
+                for qid, metric, key in diff:
+                    self.stdout.write(f'game {game.pk}: question {qid} {metric}[{key}]: raw={raw.get((qid, metric, key))} '
+                                      f'stored={stored.get((qid, metric, key))}')
+                mismatched += len(diff)
+            else:
+                count = rebuild_question_stats(questions)
+                self.stdout.write(f'game {game.pk}: {count} counters rebuilt')
+
+        if mismatched:
+            raise CommandError(f'{mismatched} question statistics differ from raw answers')
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('Question statistics match raw answers'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz.models import Game
+from quiz.utils import compute_round_scores, materialized_round_scores, rebuild_round_scores
+
+
+class Command(BaseCommand):
+    help = 'Rebuild ParticipantRoundScore rows from raw answers (or verify them with --check).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--game', type=int, action='append', help='Game id (repeatable). Defaults to all games.')
+        parser.add_argument('--check', action='store_true', help='Only compare materialized scores with the raw aggregation.')
+
+    def handle(self, *args, **options):
+        games = Game.objects.all()
+        if options['game']:
+            games = games.filter(pk__in=options['game'])
+
+        mismatched = 0
+        for game in games:
+            if options['check']:
+                raw = compute_round_scores(game)
+                stored = materialized_round_scores(game)
+                diff = sorted(k for k in set(raw) | set(stored) if raw.get(k) != stored.get(k))
+                for pid, rid in diff:
+                    self.stdout.write(f'game {game.pk}: participant {pid} round {rid}: raw={raw.get((pid, rid))} stored={stored.get((pid, rid))}')
+                mismatched += len(diff)
+            else:
+                count = rebuild_round_scores(game)
+                self.stdout.write(f'game {game.pk}: {count} rows rebuilt')
+
+        if mismatched:
+            raise CommandError(f'{mismatched} materialized round scores differ from raw answers')
+        if options['check']:
+            self.stdout.write(self.style.SUCCESS('Materialized round scores match raw answers'))
@@ -0,0 +1,171 @@
+import asyncio
+import statistics
+import time
+from collections import Counter, defaultdict, deque
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from quiz.eventlog import read_events
+from quiz.models import Game, Round, Question, Participant, Answer
+from quiz.routing import websocket_urlpatterns
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Replay a recorded game event log through the admin views and GameConsumer against a copy '
+            'of the game, reporting throughput and latency. The source game must exist in the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_id', type=int, help='Recorded game (its rounds/questions are copied)')
+        parser.add_argument('--file', action='append', help='Log file(s) to replay, in order (defaults to the game log)')
+        parser.add_argument('--speed', default='max', help='Time scale: 1, 10, ... or "max" for no delays')
+        parser.add_argument('--keep', action='store_true', help='Keep the replayed game instead of deleting it')
+
+    def handle(self, *args, **options):
+        try:
+            source = Game.objects.get(pk=options['game_id'])
+        except Game.DoesNotExist:
+            raise CommandError(f'Game {options["game_id"]} does not exist')
+        events = list(read_events(source.pk, files=options['file']))
+        if not events:
+            raise CommandError('No recorded events')
+        speed = None if options['speed'] == 'max' else float(options['speed'])
+
+        game, qmap, rmap = self._clone(source)
+        user = get_user_model().objects.create_superuser(f'replay-{game.pk}', password=None)
+        try:
+            # the replay itself is not recorded
+            with override_settings(QUIZ_EVENT_LOG_DIR=''):
+                report = asyncio.run(self._replay(game, events, qmap, rmap, user, speed))
+        finally:
+            user.delete()
+            if not options['keep']:
+                game.delete()
+        self._print(report, len(events), options['speed'])
+
+    def _clone(self, source):
+        game = Game.objects.create(title=f'{source.title} (replay)', description=source.description, is_active=False, mode=source.mode)
+        qmap, rmap = {}, {}
+        for rnd in source.rounds.all().order_by('order'):
+            new_round = Round.objects.create(game=game, title=rnd.title, order=rnd.order, description=rnd.description)
+            rmap[rnd.pk] = new_round.pk
+            for q in rnd.questions.all():
+                qmap[q.pk] = Question.objects.create(
+                    round=new_round, text=q.text, type=q.type, options=q.options, correct_answer=q.correct_answer,
+                    points=q.points, allow_bet=q.allow_bet, bet_multiplier=q.bet_multiplier,
+                ).pk
+        return game, qmap, rmap
+
+    async def _replay(self, game, events, qmap, rmap, user, speed):
+        app = URLRouter(websocket_urlpatterns)
+        client = Client(SERVER_NAME='localhost')
+        await sync_to_async(client.force_login)(user)
+        post = sync_to_async(client.post)
+
+        players = {}
+        pending = defaultdict(deque)
+        ack_latency = []
+        view_latency = defaultdict(list)
+        counts = Counter()
+
+        async def reader(key, comm):
+            while True:
+                msg = await comm.receive_json_from(timeout=3600)
+                if msg.get('type') == 'ack' and pending[key]:
+                    ack_latency.append(time.perf_counter() - pending[key].popleft())
+
+        async def player(session):
+            if session not in players:
+                p = await sync_to_async(Participant.objects.create)(session_key=f'replay-{game.pk}-{session}', game=game, team_name=str(session)[:50])
+                comm = WebsocketCommunicator(app, f'/ws/game/{game.pk}/?participant_id={p.pk}')
+                await comm.connect()
+                players[session] = (p, comm, asyncio.ensure_future(reader(session, comm)))
+            return players[session]
+
+        async def timed_post(kind, url, data=None):
+            started = time.perf_counter()
+            await post(url, data or {})
+            view_latency[kind].append(time.perf_counter() - started)
+
+        async def transition_post(kind, url, data=None):
+            # operator forms carry the game's state version; the replay is the only operator here
+            version = await sync_to_async(Game.objects.filter(pk=game.pk).values_list('state_version', flat=True).get)()
+            await timed_post(kind, url, dict(data or {}, state_version=version))
+
+        def find_answer(session_key, qid):
+            return Answer.objects.filter(question_id=qid, user_id=session_key).values_list('pk', flat=True).first()
+
+        started = time.perf_counter()
+        first_t = events[0].get('t', 0)
+        for event in events:
+            if speed:
+                delay = (event.get('t', first_t) - first_t) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            kind = event.get('e')
+            counts[kind] += 1
+            if kind == 'show_question' and event.get('q') in qmap:
+                await transition_post(kind, reverse('admin_panel:send_question', args=[game.pk, qmap[event['q']]]), {'duration': event.get('time') or 30})
+            elif kind == 'show_round' and event.get('r') in rmap:
+                await transition_post(kind, reverse('admin_panel:send_round', args=[game.pk, rmap[event['r']]]), {'duration': event.get('time') or 30})
+            elif kind == 'stop':
+                if event.get('q') in qmap:
+                    await transition_post(kind, reverse('admin_panel:stop_answers_question', args=[game.pk, qmap[event['q']]]))
+                else:
+                    await transition_post(kind, reverse('admin_panel:stop_answers', args=[game.pk]))
+            elif kind == 'answer' and event.get('q') in qmap:
+                # players are participant ids (logs written before that used session keys in `u`)
+                session = event.get('p') or event.get('u') or 'anon'
+                p, comm, _ = await player(session)
+                pending[session].append(time.perf_counter())
+                await comm.send_json_to({'action': 'save_answer', 'question_id': qmap[event['q']], 'answer': event.get('a'),
+                                         'bet': event.get('b'), 'participant_id': p.pk})
+            elif kind == 'grade' and event.get('src') == 'moderator' and event.get('q') in qmap:
+                # automatic grades are reproduced by the answer saves themselves
+                session = event.get('p') or event.get('u')
+                if session in players:
+                    # the answer being graded must be stored first
+                    deadline = time.perf_counter() + 10
+                    while pending[session] and time.perf_counter() < deadline:
+                        await asyncio.sleep(0.005)
+                    answer_id = await sync_to_async(find_answer)(players[session][0].session_key, qmap[event['q']])
+                    if answer_id:
+                        await timed_post(kind, reverse('admin_panel:mark_answer', args=[game.pk, answer_id]),
+                                         {'action': 'correct' if event.get('c') else 'incorrect'})
+
+        # wait for outstanding acks
+        deadline = time.perf_counter() + 30
+        while any(pending.values()) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started
+
+        for _, comm, task in players.values():
+            task.cancel()
+            await comm.disconnect()
+        return {'elapsed': elapsed, 'counts': counts, 'acks': ack_latency, 'views': view_latency,
+                'players': len(players), 'lost': sum(len(v) for v in pending.values())}
+
+    def _print(self, report, total, speed):
+        elapsed = report['elapsed']
+        self.stdout.write(f'replayed {total} events at speed {speed} in {elapsed:.2f}s ({total / elapsed:.1f} events/s), '
+                          f'{report["players"]} players')
+        self.stdout.write('events: ' + ', '.join(f'{k}={v}' for k, v in sorted(report['counts'].items())))
+        acks = report['acks']
+        if acks:
+            self.stdout.write(f'answer ack: n={len(acks)} p50={percentile(acks, 50) * 1000:.1f}ms p95={percentile(acks, 95) * 1000:.1f}ms '
+                              f'p99={percentile(acks, 99) * 1000:.1f}ms mean={statistics.mean(acks) * 1000:.1f}ms lost={report["lost"]}')
+        for kind, values in sorted(report['views'].items()):
+            self.stdout.write(f'{kind:<14} n={len(values)} p50={percentile(values, 50) * 1000:.1f}ms p95={percentile(values, 95) * 1000:.1f}ms')
@@ -0,0 +1,60 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+class Command(BaseCommand):
+    help = 'Summarize sampled WebSocket traces (QUIZ_TRACE_FILE) into per-stage latency percentiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None, help='Trace file (defaults to QUIZ_TRACE_FILE)')
+        parser.add_argument('--game', default=None, help='Only traces of this game id')
+        parser.add_argument('--action', default=None, help='Only traces of this action')
+        parser.add_argument('--slowest', type=int, default=0, help='Also list the N slowest traces')
+
+    def handle(self, *args, **options):
+        path = options['file'] or getattr(settings, 'QUIZ_TRACE_FILE', 'traces.jsonl')
+        stages = defaultdict(list)
+        traces = []
+        try:
+            with open(path, encoding='utf-8') as fh:
+                for line in fh:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if options['game'] and str(record.get('game')) != options['game']:
+                        continue
+                    if options['action'] and record.get('action') != options['action']:
+                        continue
+                    traces.append(record)
+                    stages[f"total:{record.get('action')}"].append(record['total_ms'])
+                    for span in record.get('spans', []):
+                        stages[span['name']].append(span['ms'])
+        except FileNotFoundError:
+            raise CommandError(f'No trace file at {path}')
+
+        if not traces:
+            self.stdout.write('No traces')
+            return
+
+        self.stdout.write(f'{len(traces)} traces from {path}')
+        self.stdout.write(f"{'stage':<32}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name in sorted(stages):
+            values = stages[name]
+            self.stdout.write(f'{name:<32}{len(values):>8}{percentile(values, 50):>10.2f}{percentile(values, 90):>10.2f}'
+                              f'{percentile(values, 99):>10.2f}{max(values):>10.2f}')
+
+        if options['slowest']:
+            self.stdout.write('')
+            for record in sorted(traces, key=lambda r: r['total_ms'], reverse=True)[:options['slowest']]:
+                spans = ', '.join(f"{s['name']}={s['ms']}" for s in record.get('spans', []))
+                self.stdout.write(f"{record['id']} game={record.get('game')} {record.get('action')} {record['total_ms']}ms [{spans}]")
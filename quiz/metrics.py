@@ -0,0 +1,184 @@
+"""Minimal in-process metrics (counters, gauges, histograms) in Prometheus text format.
+
+Metrics are process-local and cheap to update: a dict lookup and an addition
+under a lock. `render()` produces the exposition served by the /metrics view.
+"""
+import bisect
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    @abstractmethod
+    def _samples(self):
+        """Exposition lines of the current values."""
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}' for k, v in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][idx] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1]) for k, v in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+def register_collector(func):
+    """Register a callable returning extra exposition lines, evaluated on each scrape."""
+    _collectors.append(func)
+    return func
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return '\n'.join(lines) + '\n'
+
+
+# ---- metrics recorded by the quiz app ----
+
+WS_CONNECTIONS = Gauge('quiz_ws_connections', 'Open game WebSocket connections', ['game'])
+WS_CONNECT_SECONDS = Histogram('quiz_ws_connect_seconds', 'Time to accept a connection and send its initial state', ['game'])
+WS_MESSAGES = Counter('quiz_ws_messages_total', 'Inbound WebSocket messages by action', ['game', 'action'])
+WS_ACTION_SECONDS = Histogram('quiz_ws_action_seconds', 'Handling time of inbound WebSocket actions', ['game', 'action'])
+WS_OUTBOUND = Counter('quiz_ws_outbound_total', 'Group events handled by consumers, by type', ['game', 'type'])
+GROUP_SENDS = Counter('quiz_group_send_total', 'Events broadcast to game groups', ['game', 'type'])
+GROUP_SEND_SECONDS = Histogram('quiz_group_send_seconds', 'Channel layer group_send latency', ['game'])
+DB_HOPS = Counter('quiz_db_hops_total', 'Thread hops from consumers to the database pool', ['func'])
+DB_HOP_SECONDS = Histogram('quiz_db_hop_seconds', 'Duration of consumer database hops, including queueing', ['func'])
+UPDATE_SCORE_SECONDS = Histogram('quiz_update_score_seconds', 'Duration of quiz.utils.update_score', ['game'])
+WRITER_BATCH_SIZE = Histogram('quiz_db_writer_batch_size', 'Writes committed per single-writer transaction', buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+WRITER_FAILURES = Counter('quiz_db_writer_failures_total', 'Single-writer jobs that raised, by exception type', ['error'])
+AUTOGRADE_ANSWERS = Counter('quiz_autograde_answers_total', 'Pending open answers seen by auto-grading, by verdict', ['verdict'])
+AUTOGRADE_SECONDS = Histogram('quiz_autograde_seconds', 'Duration of bulk auto-grading runs', ['game'])
+SPECTATORS = Gauge('quiz_spectators', 'Open spectator (SSE) streams', ['game'])
+SPECTATOR_FRAMES = Counter('quiz_spectator_frames_total', 'Frames offered to spectators before throttling', ['game', 'event'])
+VIEW_SECONDS = Histogram('quiz_view_seconds', 'Duration of admin control and ratings views', ['view', 'game'])
+
+
+def timed_view(view_func):
+    """Record the view duration in `quiz_view_seconds`, labelled with its name and game id."""
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with VIEW_SECONDS.time(view=view_func.__name__, game=kwargs.get('game_id', '')):
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+@register_collector
+def _outbound_queue_samples():
+    from .outbound import outbound_stats
+    stats = outbound_stats()
+    lines = []
+    for name, kind in (('depth', 'gauge'), ('max_depth', 'gauge'), ('sent', 'counter'), ('coalesced', 'counter'), ('dropped', 'counter')):
+        metric = f'quiz_ws_outbound_queue_{name}' + ('_total' if kind == 'counter' else '')
+        lines.append(f'# TYPE {metric} {kind}')
+        lines.append(f'{metric} {stats[name]}')
+    return lines
@@ -0,0 +1,32 @@
+import time
+
+from . import profiling
+from .querybudget import count_queries, check_budget
+
+
+class QueryBudgetMiddleware:
+    """Count queries and time per view, log offenders and run sampled cProfile captures."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profiler = profiling.new_profiler() if profiling.should_profile() else None
+        started = time.perf_counter()
+        with count_queries() as counter:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            name = match.view_name or request.path
+            check_budget(name, counter.count, elapsed)
+            if profiler is not None:
+                profiling.save(profiler, name)
+        return response
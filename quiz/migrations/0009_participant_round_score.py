@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_round_scores(apps, schema_editor):
+    Participant = apps.get_model('quiz', 'Participant')
+    Answer = apps.get_model('quiz', 'Answer')
+    ParticipantRoundScore = apps.get_model('quiz', 'ParticipantRoundScore')
+    by_session = {}
+    for pid, game_id, session_key in Participant.objects.values_list('id', 'game_id', 'session_key'):
+        by_session.setdefault((game_id, session_key), []).append(pid)
+    rows = (Answer.objects.values('user_id', 'question__round_id', 'question__round__game_id')
+            .annotate(score=Sum('points_awarded'), answered=Count('id'), correct=Count('id', filter=Q(is_correct=True))))
+    objs = []
+    for row in rows:
+        for pid in by_session.get((row['question__round__game_id'], row['user_id']), []):
+            objs.append(ParticipantRoundScore(participant_id=pid, round_id=row['question__round_id'], score=row['score'] or 0,
+                                              answered_count=row['answered'], correct_count=row['correct']))
+    ParticipantRoundScore.objects.bulk_create(objs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0008_add_participant_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticipantRoundScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(default=0, verbose_name='Очки')),
+                ('answered_count', models.PositiveIntegerField(default=0, verbose_name='Ответов')),
+                ('correct_count', models.PositiveIntegerField(default=0, verbose_name='Правильных ответов')),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='round_scores', to='quiz.participant', verbose_name='Участник')),
+                ('round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participant_scores', to='quiz.round', verbose_name='Раунд')),
+            ],
+            options={
+                'verbose_name': 'Очки участника за раунд',
+                'verbose_name_plural': 'Очки участников за раунды',
+                'constraints': [models.UniqueConstraint(fields=('participant', 'round'), name='uniq_participant_round_score')],
+            },
+        ),
+        migrations.RunPython(backfill_round_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0009_participant_round_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='state_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия состояния'),
+        ),
+    ]
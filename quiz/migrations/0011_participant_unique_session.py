@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:01
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+
+def merge_duplicate_participants(apps, schema_editor):
+    # keep the first registration of each (game, session); answers are keyed by
+    # session, so the kept row already carries the same round scores
+    Participant = apps.get_model('quiz', 'Participant')
+    dups = (Participant.objects.values('game_id', 'session_key')
+            .annotate(n=Count('id'), keep=Min('id'), best=Max('total_score')).filter(n__gt=1))
+    for row in dups:
+        Participant.objects.filter(pk=row['keep']).update(total_score=row['best'])
+        (Participant.objects.filter(game_id=row['game_id'], session_key=row['session_key'])
+         .exclude(pk=row['keep']).delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0010_game_state_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_participants, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='participant',
+            constraint=models.UniqueConstraint(fields=('game', 'session_key'), name='uniq_participant_game_session'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0011_participant_unique_session'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', 'submitted_at', 'id'], name='answer_question_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(condition=models.Q(('is_correct__isnull', True)), fields=['submitted_at', 'id'], name='answer_pending_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0012_answer_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='accepted_answers',
+            field=models.TextField(blank=True, default='', help_text='Open questions: one accepted answer per line', verbose_name='Принимаемые варианты'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:12
+
+from django.db import migrations, models
+
+
+def _index_of(options, text):
+    text = str(text or '').strip().lower()
+    for i, opt in enumerate(options if isinstance(options, list) else []):
+        if text and str(opt).strip().lower() == text:
+            return i
+    return None
+
+
+def fill_option_indexes(apps, schema_editor):
+    # same matching as Question.option_index, on historical models
+    Question = apps.get_model('quiz', 'Question')
+    Answer = apps.get_model('quiz', 'Answer')
+    for q in Question.objects.filter(type='choice').iterator():
+        q.correct_option = _index_of(q.options, q.correct_answer)
+        q.save(update_fields=['correct_option'])
+        answers = list(Answer.objects.filter(question=q).only('pk', 'answer_text'))
+        for a in answers:
+            a.option_index = _index_of(q.options, a.answer_text)
+        Answer.objects.bulk_update(answers, ['option_index'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0013_question_accepted_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='option_index',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Номер варианта'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='correct_option',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Номер правильного варианта'),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', 'option_index'], name='answer_question_option_idx'),
+        ),
+        migrations.RunPython(fill_option_indexes, migrations.RunPython.noop),
+    ]
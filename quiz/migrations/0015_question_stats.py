@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:15
+
+import django.db.models.deletion
+from collections import Counter
+from django.db import migrations, models
+
+
+def build_question_stats(apps, schema_editor):
+    # counters for answers given before the statistics existed (no submit times for those)
+    from quiz.stats import contributions
+    Answer = apps.get_model('quiz', 'Answer')
+    QuestionStat = apps.get_model('quiz', 'QuestionStat')
+    counts = Counter()
+    for row in Answer.objects.values_list('question_id', 'option_index', 'bet_used', 'is_correct', 'response_ms').iterator():
+        counts.update(contributions(*row))
+    QuestionStat.objects.bulk_create([
+        QuestionStat(question_id=qid, metric=metric, key=key, count=n) for (qid, metric, key), n in counts.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0014_choice_option_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='answer',
+            name='response_ms',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Время ответа, мс'),
+        ),
+        migrations.CreateModel(
+            name='QuestionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=16, verbose_name='Показатель')),
+                ('key', models.CharField(blank=True, default='', max_length=16, verbose_name='Ключ')),
+                ('count', models.IntegerField(default=0, verbose_name='Значение')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='quiz.question', verbose_name='Вопрос')),
+            ],
+            options={
+                'verbose_name': 'Статистика вопроса',
+                'verbose_name_plural': 'Статистика вопросов',
+                'constraints': [models.UniqueConstraint(fields=('question', 'metric', 'key'), name='uniq_question_stat')],
+            },
+        ),
+        migrations.RunPython(build_question_stats, migrations.RunPython.noop),
+    ]
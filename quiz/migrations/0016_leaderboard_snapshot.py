@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0015_question_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время снимка')),
+                ('participants', models.PositiveIntegerField(default=0, verbose_name='Участников')),
+                ('data', models.BinaryField(verbose_name='Данные')),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_snapshots', to='quiz.game', verbose_name='Игра')),
+                ('round', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='quiz.round', verbose_name='Раунд')),
+            ],
+            options={
+                'verbose_name': 'Снимок рейтинга',
+                'verbose_name_plural': 'Снимки рейтинга',
+                'indexes': [models.Index(fields=['game', 'taken_at'], name='leaderboard_snapshot_game_idx')],
+            },
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 
@@ -24,10 +24,21 @@ class Game(models.Model):
     active_question_started_at = models.DateTimeField('Время старта активного вопроса', null=True, blank=True)
     active_round_started_at = models.DateTimeField('Время старта активного раунда', null=True, blank=True)
     mode = models.CharField('Режим', max_length=20, choices=MODE_CHOICES, default=MODE_INDIVIDUAL)
+    # bumped by every state transition (see quiz.actor) so concurrent writers detect each other
+    state_version = models.PositiveIntegerField('Версия состояния', default=0, editable=False)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # a full save may change live state too (the Django admin saves only changed fields)
+        bump = self.pk is not None and not self._state.adding and kwargs.get('update_fields') is None
+        if bump:
+            self.state_version = models.F('state_version') + 1
+        super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=['state_version'])
+
     class Meta:
         verbose_name = 'Игра'
         verbose_name_plural = 'Игры'
@@ -61,6 +72,10 @@ class Question(models.Model):
     type = models.CharField('Тип', max_length=10, choices=TYPE_CHOICES, default=TYPE_CHOICE)
     options = models.JSONField('Варианты (JSON)', blank=True, null=True, help_text='Store list of option strings')
     correct_answer = models.TextField('Правильный ответ', blank=True, null=True, help_text='For choice must match one option; for open — moderator reference')
+    # open questions are graded automatically against these and correct_answer (quiz.grading)
+    accepted_answers = models.TextField('Принимаемые варианты', blank=True, default='', help_text='Open questions: one accepted answer per line')
+    # index of correct_answer in options, kept in step by save(); choice answers compare option indexes
+    correct_option = models.PositiveSmallIntegerField('Номер правильного варианта', null=True, blank=True, editable=False)
     points = models.PositiveIntegerField('Очки', validators=[MinValueValidator(1)])
     allow_bet = models.BooleanField('Разрешена ставка', default=False)
     bet_multiplier = models.PositiveIntegerField('Множитель ставки', default=1)
@@ -72,6 +87,26 @@ class Question(models.Model):
     def __str__(self):
         return f"Q#{self.pk}: {self.text[:50]}"
 
+    def save(self, *args, **kwargs):
+        self.correct_option = self.option_index(self.correct_answer) if self.type == self.TYPE_CHOICE else None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'correct_option' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['correct_option']
+        super().save(*args, **kwargs)
+
+    def option_index(self, value):
+        """Index of `value` in options (an index, or an option's text ignoring case); None if it is not an option."""
+        opts = self.options if isinstance(self.options, (list, tuple)) else []
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value if 0 <= value < len(opts) else None
+        text = str(value or '').strip().lower()
+        if not text:
+            return None
+        for i, opt in enumerate(opts):
+            if str(opt).strip().lower() == text:
+                return i
+        return None
+
 
 class Participant(models.Model):
     session_key = models.CharField('Ключ сессии', max_length=255)
@@ -87,6 +122,10 @@ class Participant(models.Model):
         verbose_name = 'Участник'
         verbose_name_plural = 'Участники'
         ordering = ['-total_score']
+        constraints = [
+            # one participant per browser session and game; registration upserts on it
+            models.UniqueConstraint(fields=['game', 'session_key'], name='uniq_participant_game_session'),
+        ]
 
     def __str__(self):
         if self.team_name:
@@ -108,18 +147,66 @@ class Answer(models.Model):
     user_id = models.CharField('ID пользователя (сессия)', max_length=255)
     team_name = models.CharField('Название команды / имя', max_length=255, blank=True, null=True)
     answer_text = models.TextField('Текст ответа')
+    # choice questions: index into Question.options (answer_text keeps the option text for display)
+    option_index = models.PositiveSmallIntegerField('Номер варианта', null=True, blank=True)
     is_correct = models.BooleanField('Правильный', null=True)
     points_awarded = models.IntegerField('Начисленные очки', blank=True, null=True)
     bet_used = models.PositiveIntegerField('Ставка', blank=True, null=True)
     submitted_at = models.DateTimeField('Время отправки', auto_now_add=True)
+    # milliseconds from the question (or round) start to the first submission, for quiz.stats
+    response_ms = models.PositiveIntegerField('Время ответа, мс', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Ответ'
         verbose_name_plural = 'Ответы'
+        indexes = [
+            # keyset pagination of moderation queues (quiz.moderation)
+            models.Index(fields=['question', 'submitted_at', 'id'], name='answer_question_keyset_idx'),
+            models.Index(fields=['submitted_at', 'id'], condition=models.Q(is_correct__isnull=True),
+                         name='answer_pending_keyset_idx'),
+            # per-option distribution of choice answers (quiz.utils.option_distribution)
+            models.Index(fields=['question', 'option_index'], name='answer_question_option_idx'),
+        ]
 
     def __str__(self):
         return f"Ответ {self.user_id} на Q#{self.question_id}"
 
+    _SCORE_FIELDS = ('user_id', 'question_id', 'is_correct', 'points_awarded')
+    _STATS_FIELDS = ('question_id', 'option_index', 'bet_used', 'is_correct', 'response_ms')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what this row currently contributes to ParticipantRoundScore and QuestionStat
+        if all(f in instance.__dict__ for f in cls._SCORE_FIELDS):
+            instance._score_state = instance._current_score_state()
+        if all(f in instance.__dict__ for f in cls._STATS_FIELDS):
+            instance._stats_state = instance._current_stats_state()
+        return instance
+
+    def _current_stats_state(self):
+        return tuple(getattr(self, f) for f in self._STATS_FIELDS)
+
+    def _current_score_state(self):
+        """Return (user_id, question_id, (answered, correct, score)) for this answer."""
+        contribution = (1, 1 if self.is_correct is True else 0, self.points_awarded or 0)
+        return (self.user_id, self.question_id, contribution)
+
+    def _sync_round_score(self, old, batch=None):
+        # apply the difference between the previously persisted state and the current one
+        from .utils import apply_round_score_delta
+        apply = batch.add_score if batch is not None else apply_round_score_delta
+        new = self._current_score_state()
+        rnd = self.question.round
+        if old and old[:2] != new[:2]:
+            old_round_id = rnd.pk if old[1] == new[1] else Question.objects.filter(pk=old[1]).values_list('round_id', flat=True).first()
+            if old_round_id is not None:
+                apply(rnd.game_id, old[0], old_round_id, *[-v for v in old[2]])
+            old = None
+        base = old[2] if old else (0, 0, 0)
+        apply(rnd.game_id, new[0], rnd.pk, *[n - o for n, o in zip(new[2], base)])
+        self._score_state = new
+
     def save(self, *args, **kwargs):
         # Auto-evaluate choice answers when question.correct_answer exists
         try:
@@ -127,23 +214,49 @@ class Answer(models.Model):
         except Exception:
             q = None
 
-        if getattr(q, 'type', None) == Question.TYPE_CHOICE and getattr(q, 'correct_answer', None):
+        if getattr(q, 'type', None) == Question.TYPE_CHOICE:
+            if self.option_index is None and self.answer_text:
+                # answers created without an index (e.g. in the Django admin)
+                self.option_index = q.option_index(self.answer_text)
             # Only auto-set is_correct when it's not explicitly set (allow moderator override later)
-            if self.is_correct is None:
-                try:
-                    # simple normalization: strip + lower
-                    if (self.answer_text or '').strip().lower() == (q.correct_answer or '').strip().lower():
-                        self.is_correct = True
-                    else:
-                        self.is_correct = False
-                except Exception:
-                    # fall back to leaving is_correct as-is
-                    pass
+            if self.is_correct is None and getattr(q, 'correct_answer', None):
+                self.is_correct = self.option_index is not None and self.option_index == q.correct_option
 
         # If is_correct is set and points_awarded not calculated yet, defer to util to compute
         is_set = self.is_correct is not None
         need_calc = self.points_awarded is None
-        super().save(*args, **kwargs)
+        from .utils import current_answer_batch
+        batch = current_answer_batch()
+        if batch is not None and is_set and need_calc and q is not None:
+            # inside an answer batch the points are set before the write, so the row is written once
+            from .utils import answer_points
+            try:
+                bet = int(self.bet_used) if self.bet_used is not None else 0
+            except (TypeError, ValueError):
+                bet = 0
+            self.points_awarded = answer_points(q, self.is_correct, bet)
+        old_state = getattr(self, '_score_state', None)
+        old_stats = getattr(self, '_stats_state', None)
+        # a batch applies the deltas at its end, inside the caller's transaction: no savepoint per answer
+        with transaction.atomic(savepoint=batch is None):
+            if (old_state is None or old_stats is None) and not self._state.adding and self.pk:
+                row = Answer.objects.filter(pk=self.pk).values_list(*self._SCORE_FIELDS, *self._STATS_FIELDS).first()
+                if row:
+                    old_state = (row[0], row[1], (1, 1 if row[2] is True else 0, row[3] or 0))
+                    old_stats = row[len(self._SCORE_FIELDS):]
+            super().save(*args, **kwargs)
+            self._sync_round_score(old_state, batch)
+            from .stats import apply_stats_delta, stats_delta
+            new_stats = self._current_stats_state()
+            if batch is not None:
+                batch.stats.update(stats_delta(old_stats, new_stats))
+            else:
+                apply_stats_delta(stats_delta(old_stats, new_stats))
+            self._stats_state = new_stats
+        if batch is not None:
+            if is_set and need_calc and q is not None:
+                batch.graded(self)
+            return
         if is_set and need_calc:
             # avoid circular import at module load
             from .utils import update_score
@@ -156,11 +269,111 @@ class Answer(models.Model):
             update_score(participant, self.question, self, self.bet_used)
 
 
+class ParticipantRoundScore(models.Model):
+    """Per-round totals of a participant, maintained incrementally on answer saves.
+
+    Rebuild from raw answers with `manage.py rebuild_round_scores`.
+    """
+    participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='round_scores', verbose_name='Участник')
+    round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name='participant_scores', verbose_name='Раунд')
+    score = models.IntegerField('Очки', default=0)
+    answered_count = models.PositiveIntegerField('Ответов', default=0)
+    correct_count = models.PositiveIntegerField('Правильных ответов', default=0)
+
+    class Meta:
+        verbose_name = 'Очки участника за раунд'
+        verbose_name_plural = 'Очки участников за раунды'
+        constraints = [
+            models.UniqueConstraint(fields=['participant', 'round'], name='uniq_participant_round_score'),
+        ]
+
+    def __str__(self):
+        return f"{self.participant_id} / раунд {self.round_id}: {self.score}"
+
+
+class LeaderboardSnapshot(models.Model):
+    """Leaderboard of a game at a round close, packed into one row (see quiz.history)."""
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='leaderboard_snapshots', verbose_name='Игра')
+    round = models.ForeignKey(Round, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Раунд')
+    taken_at = models.DateTimeField('Время снимка', default=timezone.now)
+    participants = models.PositiveIntegerField('Участников', default=0)
+    data = models.BinaryField('Данные')
+
+    class Meta:
+        verbose_name = 'Снимок рейтинга'
+        verbose_name_plural = 'Снимки рейтинга'
+        indexes = [
+            models.Index(fields=['game', 'taken_at'], name='leaderboard_snapshot_game_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.game_id} @ {self.taken_at:%H:%M:%S} ({self.participants})"
+
+
+class QuestionStat(models.Model):
+    """One counter of the per-question statistics (quiz.stats), maintained incrementally on answer writes.
+
+    Rebuild from raw answers with `manage.py rebuild_question_stats`.
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='stats', verbose_name='Вопрос')
+    metric = models.CharField('Показатель', max_length=16)
+    key = models.CharField('Ключ', max_length=16, blank=True, default='')
+    count = models.IntegerField('Значение', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика вопроса'
+        verbose_name_plural = 'Статистика вопросов'
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'metric', 'key'], name='uniq_question_stat'),
+        ]
+
+    def __str__(self):
+        return f"Q#{self.question_id} {self.metric}[{self.key}] = {self.count}"
+
+
 # Auto-mark answers for choice questions when correct_answer is set/updated
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 
+@receiver(post_delete, sender=Answer)
+def remove_answer_from_round_scores(sender, instance, **kwargs):
+    state = getattr(instance, '_score_state', None)
+    if not state:
+        return
+    from .utils import apply_round_score_delta
+    row = Question.objects.filter(pk=state[1]).values_list('round_id', 'round__game_id').first()
+    if not row:
+        # the question (and its round) is being deleted, score rows go with the round
+        return
+    apply_round_score_delta(row[1], state[0], row[0], *[-v for v in state[2]], create=False)
+
+
+@receiver(post_delete, sender=Answer)
+def remove_answer_from_question_stats(sender, instance, **kwargs):
+    state = getattr(instance, '_stats_state', None)
+    if not state:
+        return
+    from .stats import apply_stats_delta, stats_delta
+    # only decrement existing counters: during a cascade the question may be going away too
+    apply_stats_delta(stats_delta(state, None), create=False)
+
+
+@receiver(post_save, sender=Game)
+def invalidate_game_actors(sender, instance, **kwargs):
+    # live state is owned by the game's actor (quiz.actor); a full save elsewhere
+    # (e.g. the Django admin form) makes actors of this process reload it
+    from .actor import invalidate
+    invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Game)
+@receiver(post_delete, sender=Game)
+def forget_cached_game(sender, instance, **kwargs):
+    from .cache import game_cache_key, two_tier
+    two_tier.delete(game_cache_key(instance.pk))
+
+
 @receiver(post_save, sender=Question)
 def auto_mark_answers_on_correct_answer(sender, instance, created, **kwargs):
     # Only for choice questions with a non-empty correct_answer
@@ -170,19 +383,6 @@ def auto_mark_answers_on_correct_answer(sender, instance, created, **kwargs):
     except Exception:
         return
 
-    # find answers for this question that are not yet moderated
-    qs = Answer.objects.filter(question=instance, is_correct__isnull=True)
-    if not qs.exists():
-        return
-
-    # Mark answers whose text matches correct_answer (case-insensitive) as correct
-    matches = qs.filter(answer_text__iexact=instance.correct_answer)
-    from .utils import update_score
-    for a in matches:
-        a.is_correct = True
-        a.save()  # Answer.save will call update_score if needed
-    # Mark remaining unmoderated answers for this question as incorrect
-    non_matches = qs.exclude(pk__in=matches.values_list('pk', flat=True))
-    for a in non_matches:
-        a.is_correct = False
-        a.save()
+    # answers that are not yet moderated are graded by option index in one UPDATE
+    from .utils import grade_choice_answers
+    grade_choice_answers(instance)
@@ -0,0 +1,74 @@
+"""Keyset-paginated moderation queues.
+
+Answers are walked in (submitted_at, id) order; a page ends with an opaque
+cursor encoding the last row, and the next page starts strictly after it, so
+fetching any page costs the same however many answers came before it (see the
+keyset indexes on Answer).
+"""
+import base64
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Answer, Question
+
+STATES = ('pending', 'correct', 'incorrect', 'all')
+MAX_LIMIT = 200
+
+
+def encode_cursor(answer):
+    raw = f'{answer.submitted_at.isoformat()}|{answer.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (submitted_at, id) from `encode_cursor`, or None for a missing/garbled cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        stamp, pk = raw.rsplit('|', 1)
+        submitted_at = parse_datetime(stamp)
+        if not isinstance(submitted_at, datetime.datetime):
+            return None
+        if settings.USE_TZ and timezone.is_naive(submitted_at):
+            # encode_cursor always writes the offset; a naive stamp was not made here
+            return None
+        return submitted_at, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def moderation_queue(game_id, round_id=None, question_id=None, state='pending', question_type=None,
+                     after=None, limit=50):
+    """One page of answers of `game_id` matching the filters; returns (answers, next cursor or None)."""
+    questions = Question.objects.filter(round__game_id=game_id)
+    if round_id:
+        questions = questions.filter(round_id=round_id)
+    if question_id:
+        questions = questions.filter(pk=question_id)
+    if question_type:
+        questions = questions.filter(type=question_type)
+    # a game has few questions: resolve them once instead of joining up to Game per row
+    question_ids = list(questions.values_list('pk', flat=True))
+
+    qs = Answer.objects.filter(question_id__in=question_ids)
+    if state == 'pending':
+        qs = qs.filter(is_correct__isnull=True)
+    elif state == 'correct':
+        qs = qs.filter(is_correct=True)
+    elif state == 'incorrect':
+        qs = qs.filter(is_correct=False)
+
+    position = decode_cursor(after)
+    if position is not None:
+        submitted_at, pk = position
+        qs = qs.filter(Q(submitted_at__gt=submitted_at) | Q(submitted_at=submitted_at, pk__gt=pk))
+
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    answers = list(qs.select_related('question').order_by('submitted_at', 'pk')[:limit + 1])
+    next_cursor = encode_cursor(answers[limit - 1]) if len(answers) > limit else None
+    return answers[:limit], next_cursor
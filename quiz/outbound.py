@@ -0,0 +1,100 @@
+"""Bounded per-connection outbound queue for GameConsumer.
+
+Control messages (show/stop) are never dropped and are sent before anything
+else. State messages (ratings, submit/join counters) are keyed; a newer message
+with the same key replaces the queued one, and when the queue is full the
+oldest state message is dropped.
+"""
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# process-wide counters, read with outbound_stats()
+_stats = {
+    'connections': 0,
+    'depth': 0,
+    'max_depth': 0,
+    'sent': 0,
+    'coalesced': 0,
+    'dropped': 0,
+}
+
+
+def outbound_stats():
+    return dict(_stats)
+
+
+class OutboundQueue:
+    def __init__(self, send, max_state=None):
+        self._send = send
+        self._max_state = max_state or getattr(settings, 'QUIZ_WS_OUTBOUND_QUEUE_SIZE', 50)
+        self._control = deque()
+        self._state = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._control) + len(self._state)
+
+    def start(self):
+        if self._task is None:
+            _stats['connections'] += 1
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        _stats['connections'] -= 1
+        _stats['depth'] -= len(self)
+        self._control.clear()
+        self._state.clear()
+        self._task = None
+
+    def put_control(self, message):
+        self._control.append(message)
+        self._grew()
+
+    def put_state(self, key, message):
+        if key in self._state:
+            # latest wins, keep the original position in the queue
+            self._state[key] = message
+            _stats['coalesced'] += 1
+            self._wakeup.set()
+            return
+        if len(self._state) >= self._max_state:
+            self._state.popitem(last=False)
+            _stats['dropped'] += 1
+            _stats['depth'] -= 1
+        self._state[key] = message
+        self._grew()
+
+    def _grew(self):
+        _stats['depth'] += 1
+        if _stats['depth'] > _stats['max_depth']:
+            _stats['max_depth'] = _stats['depth']
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._control or self._state:
+                if self._control:
+                    message = self._control.popleft()
+                else:
+                    _, message = self._state.popitem(last=False)
+                _stats['depth'] -= 1
+                try:
+                    await self._send(message)
+                    _stats['sent'] += 1
+                except Exception:
+                    logger.exception('Failed to send outbound message')
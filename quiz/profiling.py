@@ -0,0 +1,67 @@
+"""On-demand cProfile sampling of HTTP requests, toggled by a superuser.
+
+While enabled, QueryBudgetMiddleware profiles a `rate` fraction of requests
+(at most `remaining` of them) and writes each profile to QUIZ_PROFILE_DIR as
+a .prof file plus a short text summary.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_state = {'enabled': False, 'rate': 1.0, 'remaining': 0}
+
+
+def status():
+    return dict(_state, directory=str(_profile_dir()))
+
+
+def configure(enabled, rate=1.0, count=10):
+    with _lock:
+        _state.update(enabled=bool(enabled), rate=max(0.0, min(1.0, float(rate))), remaining=max(0, int(count)))
+    return status()
+
+
+def should_profile():
+    if not _state['enabled']:
+        return False
+    with _lock:
+        if _state['remaining'] <= 0:
+            _state['enabled'] = False
+            return False
+        if random.random() >= _state['rate']:
+            return False
+        _state['remaining'] -= 1
+        return True
+
+
+def _profile_dir():
+    return getattr(settings, 'QUIZ_PROFILE_DIR', 'profiles')
+
+
+def save(profiler, name):
+    """Dump `profiler` to the profile directory; returns the .prof path."""
+    directory = _profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)[:80]
+    path = os.path.join(directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{safe}.prof')
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+    with open(path[:-5] + '.txt', 'w', encoding='utf-8') as fh:
+        fh.write(out.getvalue())
+    logger.info('Saved profile of %s to %s', name, path)
+    return path
+
+
+def new_profiler():
+    return cProfile.Profile()
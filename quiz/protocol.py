@@ -0,0 +1,99 @@
+"""WebSocket wire formats of GameConsumer: JSON (default) or MessagePack with short field codes.
+
+A client opts in by offering the `quiz.msgpack.v1` subprotocol, or with
+`?proto=msgpack` for clients that cannot set subprotocols. Frames in both
+directions are then binary MessagePack. Dict keys listed in FIELDS are replaced
+by their short code, and the values of `type` (server messages) and `action`
+(client messages) by small integers. Unknown keys and values pass through
+unchanged, so a field added later still works before it gets a code. The
+tables are served to the play page (`codes()`), so the client never hardcodes them.
+
+Codes are append-only: changing or reusing one needs a new protocol version.
+"""
+import msgpack
+
+SUBPROTOCOL = 'quiz.msgpack.v1'
+
+FIELDS = {
+    'type': 't', 'action': 'a', 'seq': 's', 'snapshot': 'sn', 'accepting': 'ac',
+    'question': 'q', 'question_id': 'qi', 'questions': 'qs', 'round': 'r', 'round_id': 'ri',
+    'id': 'i', 'text': 'x', 'title': 'ti', 'options': 'o', 'time': 'tm', 'points': 'pt',
+    'allow_bet': 'ab', 'max_bet': 'mb', 'started_at': 'st', 'started_at_ts': 'sts',
+    'saved_answers': 'sv', 'answer_text': 'at', 'bet_used': 'bu',
+    'participant_id': 'p', 'session_key': 'k', 'team_name': 'n', 'score': 'sc', 'rank': 'rk',
+    'gap': 'g', 'total': 'tt', 'top': 'tp', 'me': 'm', 'ratings': 'rs',
+    'answer': 'an', 'answers': 'as', 'bet': 'b', 'answer_id': 'ai', 'saved_ids': 'si',
+    'ok': 'ok', 'correlation_id': 'c', 'error': 'e',
+    'digest': 'd', 'nonce': 'nc', 'sealed': 'sl', 'key': 'ky', 'stats': 'sa', 'epoch': 'ep',
+}
+TYPES = {
+    'snapshot': 1, 'show_question': 2, 'show_round': 3, 'stop_answers': 4, 'update_rating': 5,
+    'player_submit': 6, 'player_joined': 7, 'ack': 8, 'question_stats': 9, 'stage_round': 10,
+    'unseal_round': 11,
+}
+ACTIONS = {
+    'join_game': 1, 'submit_answer': 2, 'save_answer': 3, 'save_round_answers': 4, 'round_staged': 5,
+}
+
+_FIELDS_BACK = {v: k for k, v in FIELDS.items()}
+_TYPES_BACK = {v: k for k, v in TYPES.items()}
+_ACTIONS_BACK = {v: k for k, v in ACTIONS.items()}
+# maps keyed by data (question ids, histogram buckets) rather than field names
+_DATA_MAPS = ('saved_answers', 'bets', 'time_histogram')
+_CONTAINERS = (dict, list, tuple)
+
+
+def codes():
+    """The tables for clients: {'fields', 'types', 'actions'}."""
+    return {'fields': FIELDS, 'types': TYPES, 'actions': ACTIONS}
+
+
+def negotiate(scope):
+    """(codec, subprotocol to accept) for a WebSocket scope."""
+    if SUBPROTOCOL in (scope.get('subprotocols') or ()):
+        return 'msgpack', SUBPROTOCOL
+    query = scope.get('query_string', b'').decode()
+    if 'proto=msgpack' in query.split('&'):
+        return 'msgpack', None
+    return 'json', None
+
+
+def _shorten(value):
+    if type(value) is dict:
+        out = {FIELDS.get(k, k): v if type(v) not in _CONTAINERS else _shorten(v) for k, v in value.items()}
+        # the keys of these maps are data (ids, buckets), not field names: keep them
+        for name in _DATA_MAPS:
+            if name in value and type(value[name]) is dict:
+                out[FIELDS.get(name, name)] = {dk: _shorten(dv) if type(dv) in _CONTAINERS else dv for dk, dv in value[name].items()}
+        if 't' in out:
+            out['t'] = TYPES.get(out['t'], out['t'])
+        if 'a' in out:
+            out['a'] = ACTIONS.get(out['a'], out['a'])
+        return out
+    if type(value) in (list, tuple):
+        return [v if type(v) not in _CONTAINERS else _shorten(v) for v in value]
+    return value
+
+
+def _expand(value):
+    if type(value) is dict:
+        out = {_FIELDS_BACK.get(k, k): v if type(v) not in _CONTAINERS else _expand(v) for k, v in value.items()}
+        for name in _DATA_MAPS:
+            if name in out and type(value.get(FIELDS.get(name, name))) is dict:
+                out[name] = {dk: _expand(dv) if type(dv) in _CONTAINERS else dv for dk, dv in value[FIELDS.get(name, name)].items()}
+        if 'type' in out:
+            out['type'] = _TYPES_BACK.get(out['type'], out['type'])
+        if 'action' in out:
+            out['action'] = _ACTIONS_BACK.get(out['action'], out['action'])
+        return out
+    if type(value) is list:
+        return [v if type(v) not in _CONTAINERS else _expand(v) for v in value]
+    return value
+
+
+def pack(content):
+    return msgpack.packb(_shorten(content), use_bin_type=True)
+
+
+def unpack(data):
+    return _expand(msgpack.unpackb(data, raw=False, strict_map_key=False))
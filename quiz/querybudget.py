@@ -0,0 +1,101 @@
+"""Query/time budgets for HTTP views and WebSocket actions.
+
+`QueryBudgetMiddleware` (quiz.middleware) and GameConsumer count the SQL
+queries and the wall time of each view / action and log the ones over
+QUIZ_QUERY_BUDGET queries or QUIZ_QUERY_TIME_BUDGET_MS. Per-name overrides go
+in QUIZ_QUERY_BUDGETS, e.g. {'admin_panel:manage_game': 12, 'ws:save_round_answers': 40}.
+"""
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_EXCEEDED = Counter('quiz_query_budget_exceeded_total', 'Views / WebSocket actions over their query or time budget', ['name'])
+
+_current = ContextVar('quiz_query_counter', default=None)
+
+
+class QueryCounter:
+    """`execute_wrapper` hook counting queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+@contextmanager
+def count_queries(counter=None, using=None):
+    """Count the queries run on this thread's `using` connection (default: all databases) inside the block."""
+    counter = counter if counter is not None else QueryCounter()
+    with ExitStack() as stack:
+        for alias in ([using] if using else connections):
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        yield counter
+
+
+def current_counter():
+    return _current.get()
+
+
+@contextmanager
+def action_budget(name):
+    """Budget a unit of async work; DB hops started inside add their queries to it."""
+    counter = QueryCounter()
+    token = _current.set(counter)
+    started = time.perf_counter()
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+        check_budget(name, counter.count, time.perf_counter() - started)
+
+
+def budget_for(name):
+    overrides = getattr(settings, 'QUIZ_QUERY_BUDGETS', {}) or {}
+    return overrides.get(name, getattr(settings, 'QUIZ_QUERY_BUDGET', 30))
+
+
+def check_budget(name, queries, seconds):
+    """Log and count `name` when it exceeds its budget; returns True when within budget."""
+    time_budget = getattr(settings, 'QUIZ_QUERY_TIME_BUDGET_MS', 500) / 1000.0
+    budget = budget_for(name)
+    if queries <= budget and seconds <= time_budget:
+        return True
+    QUERY_BUDGET_EXCEEDED.inc(name=name)
+    logger.warning('Budget exceeded by %s: %d queries (budget %d), %.1f ms (budget %.0f ms)',
+                   name, queries, budget, seconds * 1000, time_budget * 1000)
+    return False
+
+
+def assert_query_budget(client, url, budget, method='get', data=None, using=None):
+    """Request `url` with a Django test client and fail if it runs more than `budget` queries.
+
+    Queries are captured on this thread's connections, so the view's database
+    work must stay on this thread: in tests, turn QUIZ_DB_SINGLE_WRITER off and
+    the consumer DB pool off (`configure_db_executor(0)`), which brings the
+    game actor's hops back to the calling thread. Returns (response, query count).
+    """
+    from django.test.utils import CaptureQueriesContext
+
+    with ExitStack() as stack:
+        captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in ([using] if using else connections)]
+        response = getattr(client, method)(url, data or {})
+    queries = [q['sql'] for capture in captures for q in capture.captured_queries]
+    if len(queries) > budget:
+        raise AssertionError(f'{method.upper()} {url} ran {len(queries)} queries, budget is {budget}:\n' + '\n'.join(queries))
+    return response, len(queries)
@@ -0,0 +1,223 @@
+"""Read-only spectator feed (Server-Sent Events) for overlays and the stream page.
+
+Each worker keeps one GameFeed per game with spectators. A feed holds a single
+channel-layer subscription to the game's group (quiz.fanout), however many spectators are
+connected. It turns group events into SSE frames once, encoded once, and hands
+the same bytes to every spectator:
+
+    rating   top-K of the leaderboard (no session keys)
+    state    current question / round, or {'accepting': false} after a stop
+
+Spectators are throttled: a Spectator keeps only the latest frame per event
+name and flushes at most once every QUIZ_SPECTATOR_INTERVAL seconds, so a burst
+of rating updates costs a slow overlay one frame. A feed remembers the latest
+frame of each kind for late joiners (loaded from the database once per feed)
+and unsubscribes QUIZ_SPECTATOR_LINGER seconds after its last spectator leaves.
+"""
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .fanout import listen_group
+from .leaderboard import Leaderboard
+from .metrics import SPECTATORS, SPECTATOR_FRAMES
+
+logger = logging.getLogger(__name__)
+
+RATING_FIELDS = ('participant_id', 'team_name', 'score', 'rank', 'gap')
+
+
+def encode_frame(event, data):
+    """One SSE frame as bytes."""
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(",", ":"))}\n\n'.encode()
+
+
+def rating_data(ratings, seq=None):
+    top = Leaderboard(ratings or []).top(getattr(settings, 'QUIZ_SPECTATOR_TOP', 20))
+    return {'seq': seq, 'total': len(ratings or []), 'top': [{k: row.get(k) for k in RATING_FIELDS} for row in top]}
+
+
+def spectator_frame(event):
+    """(name, bytes) of the SSE frame for a group event, or None for events spectators do not see."""
+    kind = event.get('type')
+    seq = event.get('seq')
+    if kind == 'update_rating':
+        return 'rating', encode_frame('rating', rating_data(event.get('ratings'), seq))
+    if kind == 'show_question':
+        return 'state', encode_frame('state', {'seq': seq, 'accepting': True, 'question': event.get('question'), 'time': event.get('time')})
+    if kind == 'show_round':
+        # never the unseal key of a pre-staged round (quiz.staging)
+        return 'state', encode_frame('state', {'seq': seq, 'accepting': True, 'round': event.get('round'), 'time': event.get('time')})
+    if kind == 'stop_answers':
+        return 'state', encode_frame('state', {'seq': seq, 'accepting': False, 'question_id': event.get('question_id')})
+    return None
+
+
+def load_snapshot(game_id):
+    """Initial frames {name: bytes} of a game from the database (sync)."""
+    from .events import game_events
+    from .models import Game
+    from .staging import round_payload
+    from .utils import round_ratings
+
+    game = Game.objects.select_related('active_question', 'active_round').filter(pk=game_id).first()
+    if game is None:
+        return {}
+    seq = game_events.current(game_id)
+    state = {'seq': seq, 'accepting': game.accepting_answers}
+    if game.accepting_answers and game.active_question is not None:
+        q = game.active_question
+        state['question'] = {'id': q.pk, 'text': q.text, 'type': q.type, 'options': q.options or []}
+    elif game.accepting_answers and game.active_round is not None:
+        state['round'] = round_payload(game.active_round)
+    ratings = [{'participant_id': r['participant'].pk, 'team_name': r['participant'].team_name, 'score': r['score']}
+               for r in round_ratings(game, list(game.rounds.all()))]
+    return {'state': encode_frame('state', state), 'rating': encode_frame('rating', rating_data(ratings, seq))}
+
+
+class Spectator:
+    """Downstream end of a feed: latest frame per name, flushed at a bounded rate."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self._ready = asyncio.Event()
+        self._last_flush = 0.0
+
+    def offer(self, name, frame):
+        self.pending[name] = frame
+        self._ready.set()
+
+    async def frames(self, timeout=None):
+        """Wait for pending frames and return them as one chunk (b'' on timeout)."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return b''
+        wait = self._last_flush + self.interval - time.monotonic()
+        if wait > 0:
+            # throttle: more updates of the same kind replace each other meanwhile
+            await asyncio.sleep(wait)
+        self._ready.clear()
+        chunk = b''.join(self.pending.values())
+        self.pending = {}
+        self._last_flush = time.monotonic()
+        return chunk
+
+
+class GameFeed:
+    """The shared upstream subscription of one game in this worker."""
+
+    def __init__(self, game_id, channel_layer=None):
+        self.game_id = game_id
+        self.group_name = listen_group(game_id)
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.spectators = set()
+        self.latest = {}
+        self._task = None
+        self._snapshot = None
+        self._linger = None
+
+    async def start(self):
+        self.channel_name = await self.channel_layer.new_channel('spectators.')
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self._task = asyncio.ensure_future(self._pump())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def ensure_snapshot(self):
+        """Fill `latest` from the database once per feed; concurrent spectators share the load."""
+        from .db import db_sync_to_async
+
+        if self._snapshot is None:
+            self._snapshot = asyncio.ensure_future(db_sync_to_async(load_snapshot)(self.game_id))
+        frames = await asyncio.shield(self._snapshot)
+        for name, frame in frames.items():
+            # an event that arrived while loading is newer than the database read
+            self.latest.setdefault(name, frame)
+
+    def publish(self, name, frame):
+        self.latest[name] = frame
+        SPECTATOR_FRAMES.inc(len(self.spectators), game=self.game_id, event=name)
+        for spectator in self.spectators:
+            spectator.offer(name, frame)
+
+    async def _pump(self):
+        while True:
+            try:
+                event = await self.channel_layer.receive(self.channel_name)
+                frame = spectator_frame(event)
+                if frame is not None:
+                    self.publish(*frame)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Spectator feed of game %s failed on an event', self.game_id)
+
+    def subscribe(self):
+        spectator = Spectator(getattr(settings, 'QUIZ_SPECTATOR_INTERVAL', 1.0))
+        for name, frame in self.latest.items():
+            spectator.offer(name, frame)
+        self.spectators.add(spectator)
+        SPECTATORS.inc(game=self.game_id)
+        if self._linger is not None:
+            self._linger.cancel()
+            self._linger = None
+        return spectator
+
+    def unsubscribe(self, spectator):
+        if spectator in self.spectators:
+            self.spectators.discard(spectator)
+            SPECTATORS.dec(game=self.game_id)
+        if not self.spectators:
+            loop = asyncio.get_running_loop()
+            self._linger = loop.call_later(getattr(settings, 'QUIZ_SPECTATOR_LINGER', 30.0), self._close_if_idle)
+
+    def _close_if_idle(self):
+        self._linger = None
+        if not self.spectators:
+            feeds = _feeds.get(asyncio.get_running_loop(), {})
+            if feeds.get(self.game_id) is self:
+                del feeds[self.game_id]
+            asyncio.ensure_future(self.stop())
+
+
+# feeds of the running event loop (the worker's), by game id
+_feeds = weakref.WeakKeyDictionary()
+
+
+async def get_feed(game_id, channel_layer=None):
+    """The game's feed in this worker, started on first use."""
+    feeds = _feeds.setdefault(asyncio.get_running_loop(), {})
+    feed = feeds.get(game_id)
+    if feed is None:
+        feed = feeds[game_id] = GameFeed(game_id, channel_layer)
+        await feed.start()
+    return feed
+
+
+async def event_stream(game_id):
+    """Async iterator of SSE bytes for one spectator."""
+    keepalive = getattr(settings, 'QUIZ_SPECTATOR_KEEPALIVE', 15.0)
+    feed = await get_feed(game_id)
+    spectator = feed.subscribe()
+    try:
+        yield b'retry: 3000\n\n'
+        await feed.ensure_snapshot()
+        for name, frame in feed.latest.items():
+            spectator.offer(name, frame)
+        while True:
+            chunk = await spectator.frames(timeout=keepalive)
+            # comment lines keep proxies from closing an idle stream
+            yield chunk or b': keepalive\n\n'
+    finally:
+        feed.unsubscribe(spectator)
@@ -0,0 +1,23 @@
+"""SQLite profile for single-box deployments.
+
+Applied to every new SQLite connection (see QuizConfig.ready): WAL journal so
+readers never block the writer, `synchronous` level (NORMAL is durable enough
+with WAL) and the busy timeout in milliseconds. Answer and grade writes are
+additionally funnelled through quiz.writer.
+"""
+from django.conf import settings
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    level = str(getattr(settings, 'QUIZ_SQLITE_SYNCHRONOUS', 'NORMAL')).upper()
+    timeout_ms = int(float(getattr(settings, 'QUIZ_SQLITE_BUSY_TIMEOUT', 20)) * 1000)
+    with connection.cursor() as cursor:
+        if getattr(settings, 'QUIZ_SQLITE_WAL', True):
+            cursor.execute('PRAGMA journal_mode=WAL')
+        if level in SYNCHRONOUS_LEVELS:
+            cursor.execute(f'PRAGMA synchronous={level}')
+        cursor.execute(f'PRAGMA busy_timeout={timeout_ms}')
@@ -0,0 +1,77 @@
+"""Pre-staged rounds: the round payload reaches players before the reveal.
+
+`stage_round` seals a round's payload with AES-GCM and broadcasts the
+ciphertext as a `stage_round` event, ahead of time and at the operator's pace.
+The key is derived from SECRET_KEY and the payload digest, so it needs no
+storage and changes whenever the round is edited. Clients that hold the staged
+copy answer with a `round_staged` action carrying the digest.
+
+At the reveal, send_round's `show_round` event carries the digest and key.
+Each consumer sends a socket that staged that exact digest a small
+`unseal_round` frame (round id, key, time) instead of the full payload. Other
+sockets (no WebCrypto, reconnected, edited round) get the usual `show_round`.
+"""
+import base64
+import hashlib
+import hmac
+import json
+
+from django.conf import settings
+
+
+def round_payload(rnd):
+    """The `round` part of a show_round event."""
+    return {
+        'id': rnd.pk,
+        'title': rnd.title,
+        'questions': [{
+            'id': q.pk,
+            'text': q.text,
+            'type': q.type,
+            'options': q.options or [],
+            'allow_bet': bool(q.allow_bet),
+            'max_bet': getattr(q, 'max_bet', 10),
+            'points': q.points,
+        } for q in rnd.questions.all()],
+    }
+
+
+def _encode(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode()
+
+
+def payload_digest(payload):
+    return hashlib.sha256(_encode(payload)).hexdigest()[:32]
+
+
+def _key_material(digest):
+    secret = hmac.new(settings.SECRET_KEY.encode(), f'quiz-round-seal:{digest}'.encode(), hashlib.sha256).digest()
+    # 128-bit AES key and 96-bit nonce; one key per payload, so the nonce is never reused with another plaintext
+    return secret[:16], secret[16:28]
+
+
+def seal_round(payload):
+    """{'digest', 'nonce', 'sealed'} (base64) of an AES-GCM sealed round payload."""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    digest = payload_digest(payload)
+    key, nonce = _key_material(digest)
+    sealed = AESGCM(key).encrypt(nonce, _encode(payload), None)
+    return {
+        'digest': digest,
+        'nonce': base64.b64encode(nonce).decode(),
+        'sealed': base64.b64encode(sealed).decode(),
+    }
+
+
+def unseal_key(digest):
+    """Base64 key that opens the payload sealed under `digest`."""
+    return base64.b64encode(_key_material(digest)[0]).decode()
+
+
+def unseal_round(digest, nonce, sealed):
+    """Inverse of `seal_round` with the revealed key (what a client does)."""
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    key = base64.b64decode(unseal_key(digest))
+    return json.loads(AESGCM(key).decrypt(base64.b64decode(nonce), base64.b64decode(sealed), None))
@@ -0,0 +1,197 @@
+"""Per-question statistics maintained incrementally on answer writes.
+
+Counters live in QuestionStat rows keyed by (question, metric, key):
+
+    answers   ''          answers given
+    correct   ''          answers graded correct
+    incorrect ''          answers graded incorrect
+    option    '<index>'   choice answers per option
+    bet       '<bet>'     answers per bet (0 = no bet)
+    time      '<bound>'   answers per submit-time bucket, seconds since the
+                          question started (upper bounds in TIME_BUCKETS, 'inf')
+
+Answer.save and the bulk grading paths add the difference between an answer's
+old and new contribution (`apply_stats_delta`): one INSERT of missing rows and
+one UPDATE per distinct delta. `question_stats` turns the counters into the
+payload served by the JSON endpoint and pushed to admin WebSockets as
+`question_stats` events (at most every QUIZ_STATS_PUBLISH_SECONDS per question
+for answer writes). Rebuild from raw answers with `manage.py rebuild_question_stats`.
+"""
+import asyncio
+import bisect
+import weakref
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+TIME_BUCKETS = (1, 2, 3, 5, 7, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+
+
+def time_bucket(response_ms):
+    i = bisect.bisect_left(TIME_BUCKETS, response_ms / 1000)
+    return str(TIME_BUCKETS[i]) if i < len(TIME_BUCKETS) else 'inf'
+
+
+def contributions(question_id, option_index, bet, is_correct, response_ms):
+    """Counter keys (question_id, metric, key) one answer adds to."""
+    keys = [(question_id, 'answers', ''), (question_id, 'bet', str(bet or 0))]
+    if is_correct is True:
+        keys.append((question_id, 'correct', ''))
+    elif is_correct is False:
+        keys.append((question_id, 'incorrect', ''))
+    if option_index is not None:
+        keys.append((question_id, 'option', str(option_index)))
+    if response_ms is not None:
+        keys.append((question_id, 'time', time_bucket(response_ms)))
+    return keys
+
+
+def stats_delta(old, new):
+    """Counter delta between two `contributions` argument tuples (either may be None)."""
+    delta = Counter(contributions(*new) if new else ())
+    delta.subtract(contributions(*old) if old else ())
+    return delta
+
+
+def apply_stats_delta(delta, create=True):
+    """Add a Counter of {(question_id, metric, key): n} to the QuestionStat rows (created unless `create` is False)."""
+    from .models import QuestionStat
+
+    delta = {k: n for k, n in delta.items() if n}
+    if not delta:
+        return
+    by_amount = defaultdict(list)
+    for (qid, metric, key), n in delta.items():
+        by_amount[n].append(Q(question_id=qid, metric=metric, key=key))
+    # no savepoint: callers (Answer.save, bulk grading) already run in a transaction
+    with transaction.atomic(savepoint=False):
+        if create:
+            QuestionStat.objects.bulk_create(
+                [QuestionStat(question_id=qid, metric=metric, key=key) for qid, metric, key in delta],
+                ignore_conflicts=True,
+            )
+        for n, conditions in by_amount.items():
+            match = conditions[0]
+            for condition in conditions[1:]:
+                match |= condition
+            QuestionStat.objects.filter(match).update(count=F('count') + n)
+
+
+def _percentile(histogram, total, fraction):
+    seen = 0
+    for bound in [str(b) for b in TIME_BUCKETS] + ['inf']:
+        seen += histogram.get(bound, 0)
+        if total and seen >= fraction * total:
+            return None if bound == 'inf' else int(bound)
+    return None
+
+
+def question_stats(question):
+    """Statistics payload of one question from its counters."""
+    counters = defaultdict(dict)
+    for metric, key, count in question.stats.values_list('metric', 'key', 'count'):
+        counters[metric][key] = count
+    answered = counters['answers'].get('', 0)
+    correct = counters['correct'].get('', 0)
+    incorrect = counters['incorrect'].get('', 0)
+    bets = {int(k): n for k, n in counters['bet'].items() if n}
+    times = counters['time']
+    timed = sum(times.values())
+    payload = {
+        'question_id': question.pk,
+        'answered': answered,
+        'correct': correct,
+        'incorrect': incorrect,
+        'pending': answered - correct - incorrect,
+        'correct_pct': round(100 * correct / (correct + incorrect), 1) if correct + incorrect else None,
+        'bets': bets,
+        'avg_bet': round(sum(b * n for b, n in bets.items()) / answered, 2) if answered else None,
+        # upper bounds of the submit-time buckets, in seconds
+        'time_p50': _percentile(times, timed, 0.5),
+        'time_p90': _percentile(times, timed, 0.9),
+        'time_histogram': {k: n for k, n in times.items() if n},
+    }
+    if question.type == question.TYPE_CHOICE:
+        options = counters['option']
+        payload['options'] = [{'option': opt, 'count': options.get(str(i), 0)} for i, opt in enumerate(question.options or [])]
+        payload['correct_option'] = question.correct_option
+    return payload
+
+
+def compute_question_stats(questions):
+    """Aggregate raw answers of `questions` into {(question_id, metric, key): count}."""
+    from .models import Answer
+
+    counts = Counter()
+    rows = Answer.objects.filter(question__in=questions).values_list(
+        'question_id', 'option_index', 'bet_used', 'is_correct', 'response_ms')
+    for row in rows.iterator():
+        counts.update(contributions(*row))
+    return counts
+
+
+def materialized_question_stats(questions):
+    """The stored counters in the shape of `compute_question_stats` (zero rows skipped)."""
+    from .models import QuestionStat
+
+    return {(qid, metric, key): count for qid, metric, key, count in QuestionStat.objects.filter(
+        question__in=questions).values_list('question_id', 'metric', 'key', 'count') if count}
+
+
+def rebuild_question_stats(questions):
+    """Replace the counters of `questions` with a fresh aggregation; returns the number of rows."""
+    from .models import QuestionStat
+
+    counts = compute_question_stats(questions)
+    with transaction.atomic():
+        QuestionStat.objects.filter(question__in=questions).delete()
+        QuestionStat.objects.bulk_create([
+            QuestionStat(question_id=qid, metric=metric, key=key, count=n) for (qid, metric, key), n in counts.items()
+        ])
+    return len(counts)
+
+
+def _stats_event(question_id):
+    from .models import Question
+
+    question = Question.objects.select_related('round').filter(pk=question_id).first()
+    if question is None:
+        return None, None
+    return question.round.game_id, {'type': 'question_stats', 'stats': question_stats(question)}
+
+
+def publish_question_stats(question_id):
+    """Push a question's statistics to its game's admin WebSockets now (sync callers)."""
+    from .events import publish_game_event
+
+    game_id, event = _stats_event(question_id)
+    if event is not None:
+        publish_game_event(game_id, event, buffer=False)
+
+
+# answer writes publish at most once per interval per question, from the event loop
+_scheduled = weakref.WeakKeyDictionary()
+
+
+def schedule_publish(question_ids, channel_layer=None):
+    """Publish statistics of `question_ids` after QUIZ_STATS_PUBLISH_SECONDS, coalescing repeated calls."""
+    loop = asyncio.get_running_loop()
+    pending = _scheduled.setdefault(loop, set())
+    delay = getattr(settings, 'QUIZ_STATS_PUBLISH_SECONDS', 1.0)
+    for qid in question_ids:
+        if qid is None or qid in pending:
+            continue
+        pending.add(qid)
+        loop.call_later(delay, lambda q=qid: asyncio.ensure_future(_publish_later(q, pending, channel_layer)))
+
+
+async def _publish_later(question_id, pending, channel_layer):
+    from .db import db_sync_to_async
+    from .events import apublish_game_event
+
+    pending.discard(question_id)
+    game_id, event = await db_sync_to_async(_stats_event)(question_id)
+    if event is not None:
+        await apublish_game_event(game_id, event, buffer=False, channel_layer=channel_layer)
@@ -0,0 +1,987 @@
+import asyncio
+import base64
+import datetime
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import threading
+import time
+import zlib
+from unittest import mock, skipUnless
+
+import msgpack
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import actor as game_actor, protocol
+from .consumers import GameConsumer
+from .db import configure_db_executor
+from .events import GameEventBuffer, after_commit, after_commit_once, game_events, publish_game_event
+from .grading import AnswerIndex, answer_key, bounded_distance, grade_answers, normalize, variants_of
+from .history import (FORMAT_VERSION as HISTORY_FORMAT_VERSION, align_snapshot, capture_snapshot, game_history,
+                      pack_snapshot, unpack_snapshot)
+from .leaderboard import ENTRY_FIELDS, Leaderboard
+from .metrics import WS_MESSAGES
+from .moderation import decode_cursor, encode_cursor, moderation_queue
+from .outbound import OutboundQueue, outbound_stats
+from .querybudget import assert_query_budget, budget_for
+from .stats import compute_question_stats, materialized_question_stats
+from .models import Answer, Game, LeaderboardSnapshot, Participant, ParticipantRoundScore, Question, Round
+from .staging import payload_digest, seal_round, unseal_key, unseal_round
+from .writer import SingleWriter
+from .utils import answer_batch, broadcast_ratings, compute_round_scores, grade_choice_answers, materialized_round_scores
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='')
+class MaterializedConsistencyTest(TestCase):
+    """Random grading sequences keep ParticipantRoundScore and QuestionStat equal to fresh aggregations of the answers."""
+
+    STEPS = 120
+
+    def setUp(self):
+        self.game = Game.objects.create(title='consistency', is_active=False)
+        self.questions = []
+        for r in range(2):
+            rnd = Round.objects.create(game=self.game, title=f'r{r}', order=r)
+            self.questions.append(Question.objects.create(round=rnd, text='open', type=Question.TYPE_OPEN, points=2,
+                                                          correct_answer='Пушкин', allow_bet=True))
+            self.questions.append(Question.objects.create(round=rnd, text='choice', type=Question.TYPE_CHOICE, points=1,
+                                                          options=['a', 'b', 'c'], correct_answer='b', allow_bet=True))
+        for i in range(4):
+            Participant.objects.create(game=self.game, session_key=f's{i}', team_name=f't{i}')
+        # answers of a session that never registered count for nobody
+        self.users = [f's{i}' for i in range(4)] + ['ghost']
+
+    def assertConsistent(self, step):
+        self.assertEqual(materialized_round_scores(self.game), compute_round_scores(self.game), f'after {step}')
+        self.assertEqual(materialized_question_stats(self.questions), dict(+compute_question_stats(self.questions)), f'after {step}')
+
+    def _answer(self, rng):
+        ids = list(Answer.objects.filter(question__round__game=self.game).values_list('pk', flat=True))
+        return Answer.objects.get(pk=rng.choice(ids)) if ids else None
+
+    def _step(self, rng):
+        """Apply one random change; returns its name."""
+        answer = self._answer(rng)
+        op = rng.choice(['create', 'create', 'grade', 'mark', 'regrade', 'ungrade', 'bet', 'move', 'delete', 'bulk', 'autograde', 'sheet'])
+        if answer is None or op == 'create':
+            question = rng.choice(self.questions)
+            Answer.objects.create(question=question, user_id=rng.choice(self.users), answer_text=rng.choice(['a', 'b', 'Пушкин', 'x']),
+                                  bet_used=rng.choice([None, 0, 1, 3]), response_ms=rng.randrange(60000))
+            return 'create'
+        if op == 'grade':
+            # points left to update_score
+            answer.is_correct = rng.choice([True, False])
+            answer.points_awarded = None
+        elif op == 'mark':
+            # moderator override with explicit points, as admin_panel.views.mark_answer does
+            answer.is_correct = rng.choice([True, False])
+            answer.points_awarded = rng.randrange(-5, 6)
+        elif op == 'regrade':
+            answer.is_correct = not answer.is_correct if answer.is_correct is not None else True
+            answer.points_awarded = None
+        elif op == 'ungrade':
+            answer.is_correct = None
+            answer.points_awarded = None
+        elif op == 'bet':
+            answer.bet_used = rng.choice([None, 0, 1, 2, 5])
+            answer.points_awarded = None
+        elif op == 'move':
+            answer.question = rng.choice(self.questions)
+            answer.user_id = rng.choice(self.users)
+        elif op == 'delete':
+            answer.delete()
+            return op
+        elif op == 'bulk':
+            grade_choice_answers(rng.choice([q for q in self.questions if q.type == Question.TYPE_CHOICE]))
+            return op
+        elif op == 'autograde':
+            grade_answers(self.game.pk)
+            return op
+        elif op == 'sheet':
+            # several saves with the deltas applied once, as GameConsumer._save_round_answers does
+            with answer_batch():
+                for _ in range(rng.randrange(1, 4)):
+                    answer = self._answer(rng)
+                    answer.is_correct = rng.choice([None, True, False])
+                    answer.points_awarded = None
+                    answer.bet_used = rng.choice([None, 0, 2])
+                    answer.save()
+                Answer.objects.create(question=rng.choice(self.questions), user_id=rng.choice(self.users),
+                                      answer_text=rng.choice(['a', 'b', 'x']), bet_used=rng.choice([None, 1]))
+            return op
+        answer.save()
+        return op
+
+    def test_random_grading_sequences(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                Answer.objects.filter(question__round__game=self.game).delete()
+                self.assertConsistent('reset')
+                for i in range(self.STEPS):
+                    op = self._step(rng)
+                    self.assertConsistent(f'step {i} ({op}), seed {seed}')
+
+
+def _version(game):
+    return Game.objects.values_list('state_version', flat=True).get(pk=game.pk)
+
+
+class AnswerGradingTest(SimpleTestCase):
+    def test_normalization(self):
+        self.assertEqual(normalize('  ПУШКИН,  А.С.! '), 'пушкин а с')
+        self.assertEqual(normalize('Ёлка'), 'елка')
+        self.assertEqual(normalize('Müller, Dostoévski'), 'muller dostoevski')
+        # й is a letter of its own, not an accented и
+        self.assertEqual(normalize('Йошкар-Ола'), 'йошкар ола')
+        self.assertEqual(normalize('Ｐｕｓｈｋｉｎ'), 'pushkin')
+
+    def test_transliteration_matches(self):
+        # Latin and Cyrillic spellings share one key
+        for variant, answer in [('Пушкин', 'Pushkin'), ('Pushkin', 'пушкин'), ('Хрущёв', 'Khrushchev'), ('Достоевский', 'Dostoevsky')]:
+            with self.subTest(answer=answer):
+                self.assertEqual(answer_key(variant), answer_key(answer))
+                self.assertIs(AnswerIndex([variant]).grade(answer), True)
+        # other romanizations are near matches
+        self.assertIs(AnswerIndex(['Чайковский']).grade('Tchaikovsky'), True)
+        self.assertIs(AnswerIndex(['Достоевский']).grade('Dostoïevski'), True)
+
+    def test_distance_bound(self):
+        self.assertEqual(bounded_distance('leningrad', 'lenigrd', 5), 2)
+        self.assertEqual(bounded_distance('leningrad', 'moskva', 2), 3)
+        index = AnswerIndex(['Ленинград'], max_distance=2)
+        self.assertEqual(index.near_bound(answer_key('Ленинград')), 2)
+        # exactly at the bound (two edits) is accepted, one edit past it goes to moderation
+        self.assertIs(index.grade('Ленигрд'), True)
+        self.assertIsNone(index.grade('Ленигр'))
+        self.assertIs(index.grade('Москва'), False)
+        # short answers allow no typos; numbers must match exactly
+        self.assertIsNone(AnswerIndex(['Нил']).grade('Нел'))
+        self.assertIsNone(AnswerIndex(['1812']).grade('1813'))
+
+    def test_ambiguous_answers_are_left_for_moderation(self):
+        index = AnswerIndex(['Александр Пушкин'])
+        self.assertIsNone(index.grade('Пушкин'))
+        self.assertIs(index.grade('Alexandr Pushkin'), True)
+        self.assertIs(index.grade(''), False)
+
+    def test_variants_of_question(self):
+        question = Question(correct_answer='Пушкин', accepted_answers='А. С. Пушкин\n\n  Pushkin  ')
+        self.assertEqual(variants_of(question), ['Пушкин', 'А. С. Пушкин', 'Pushkin'])
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='')
+class AutogradeTest(TestCase):
+    def test_ambiguous_answers_stay_pending(self):
+        game = Game.objects.create(title='autograde', is_active=False)
+        rnd = Round.objects.create(game=game, title='r', order=1)
+        question = Question.objects.create(round=rnd, text='q', type=Question.TYPE_OPEN, points=2,
+                                           correct_answer='Александр Пушкин', accepted_answers='Pushkin A. S.')
+        answers = {text: Answer.objects.create(question=question, user_id=text, answer_text=text)
+                   for text in ('александр пушкин!', 'Aleksandr Pushkin', 'Пушкин', 'Лермонтов')}
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = grade_answers(game.pk, round_id=rnd.pk)
+        self.assertEqual(counts, {'correct': 2, 'incorrect': 1, 'ambiguous': 1})
+        verdicts = {text: Answer.objects.get(pk=a.pk).is_correct for text, a in answers.items()}
+        self.assertEqual(verdicts, {'александр пушкин!': True, 'Aleksandr Pushkin': True, 'Пушкин': None, 'Лермонтов': False})
+
+
+def _protocol_messages():
+    """A message of every server type and client action, with every field, data maps and unknown keys."""
+    question = {'id': 12, 'text': 'Кто?', 'type': 'choice', 'options': ['a', 'б'], 'time': 30, 'points': 2,
+                'allow_bet': True, 'max_bet': 10, 'started_at': '2026-10-19T19:00:00+00:00', 'started_at_ts': 1792436400}
+    server = [{
+        'type': kind, 'seq': 7, 'epoch': 'e1', 'snapshot': True, 'accepting': False, 'question': question,
+        'round': {'id': 3, 'title': 'Раунд', 'questions': [question], 'saved_answers': {12: {'answer_text': 'a', 'bet_used': 1}}},
+        'round_id': 3, 'question_id': 12, 'time': 60, 'digest': 'd', 'nonce': 'n', 'sealed': 's', 'key': 'k',
+        'top': [{'participant_id': 1, 'team_name': 't', 'score': 5, 'rank': 1, 'gap': 0}],
+        'me': {'participant_id': 1, 'rank': 1, 'total': 2}, 'ratings': [{'participant_id': 1, 'score': 5}],
+        'stats': {'question_id': 12, 'bets': {1: 2}, 'time_histogram': {'0-5': 3}},
+        'ok': True, 'correlation_id': 'c1', 'error': None, 'saved_ids': [1, 2], 'answer_id': 4, 'answer': 'a', 'bet': 1,
+        'brand_new_field': {'nested_unknown': [1, 'два', None, 2.5]},
+    } for kind in list(protocol.TYPES) + ['not_a_type_yet']]
+    client = [{
+        'action': action, 'participant_id': '17', 'question_id': 12, 'answer': 'Толстой', 'bet': 2, 'round_id': 3, 'digest': 'd',
+        'answers': [{'question_id': 12, 'answer': 'Толстой', 'bet': 1, 'unknown': True}], 'brand_new_field': [{'later': 1}],
+    } for action in list(protocol.ACTIONS) + ['not_an_action_yet']]
+    return server, client
+
+
+class ProtocolTest(SimpleTestCase):
+    def test_round_trip(self):
+        server, client = _protocol_messages()
+        for content in server + client:
+            with self.subTest(message=content.get('type') or content.get('action')):
+                data = protocol.pack(content)
+                self.assertEqual(protocol.unpack(data), content)
+                raw = msgpack.unpackb(data, raw=False, strict_map_key=False)
+                # known fields travel as their codes, unknown ones unchanged
+                self.assertEqual(set(raw), {protocol.FIELDS.get(k, k) for k in content})
+        self.assertEqual(msgpack.unpackb(protocol.pack(server[0]), raw=False, strict_map_key=False)['t'], protocol.TYPES[server[0]['type']])
+
+    def test_codes_are_unique(self):
+        for table in protocol.codes().values():
+            self.assertEqual(len(set(table.values())), len(table))
+        # a field name that is another field's code would be expanded to that field on the way back
+        for name, code in protocol.FIELDS.items():
+            self.assertTrue(code == name or code not in protocol.FIELDS, code)
+
+    def test_play_page_data_maps_match(self):
+        source = (settings.BASE_DIR / 'static' / 'quiz' / 'js' / 'play.js').read_text(encoding='utf-8')
+        skip_keys = re.search(r"const skipKeys = \[([^\]]*)\]", source).group(1)
+        self.assertEqual(tuple(re.findall(r"'(\w+)'", skip_keys)), protocol._DATA_MAPS)
+
+    @skipUnless(shutil.which('node'), 'node is not installed')
+    def test_javascript_codec(self):
+        # static/quiz/js/msgpack.js decodes the server's frames and encodes what the server can unpack
+        server, client = _protocol_messages()
+        script = """
+            global.window = {};
+            require(process.argv[1]);
+            const input = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+            const decoded = input.frames.map(hex => window.MessagePack.decode(Buffer.from(hex, 'hex')));
+            const encoded = input.messages.map(m => Buffer.from(window.MessagePack.encode(m)).toString('hex'));
+            process.stdout.write(JSON.stringify({decoded, encoded}));
+        """
+        codec = str(settings.BASE_DIR / 'static' / 'quiz' / 'js' / 'msgpack.js')
+        payload = json.dumps({'frames': [protocol.pack(m).hex() for m in server],
+                              'messages': [protocol._shorten(m) for m in client]})
+        result = json.loads(subprocess.run(['node', '-e', script, codec], input=payload, capture_output=True,
+                                           text=True, check=True, timeout=60).stdout)
+        # JavaScript object keys are strings, as JSON's are
+        self.assertEqual(result['decoded'], [json.loads(json.dumps(protocol._shorten(m))) for m in server])
+        self.assertEqual([protocol.unpack(bytes.fromhex(h)) for h in result['encoded']], client)
+
+
+class GameEventBufferTest(TestCase):
+    def test_resume_needs_the_same_epoch(self):
+        buffer = GameEventBuffer(size=10)
+        first = buffer.record(1, {'type': 'show_question'})
+        second = buffer.record(1, {'type': 'stop_answers'})
+        self.assertEqual(first['epoch'], buffer.epoch)
+        self.assertEqual(buffer.since(1, first['seq'], buffer.epoch), [second])
+        # a restarted process numbers its events from 1 again
+        restarted = GameEventBuffer(size=10)
+        restarted.record(1, {'type': 'show_question'})
+        restarted.record(1, {'type': 'show_round'})
+        self.assertIsNone(restarted.since(1, first['seq'], buffer.epoch))
+        self.assertIsNone(restarted.since(1, first['seq']))
+
+
+@override_settings(QUIZ_EVENT_LOG_DIR='')
+class PublishAfterCommitTest(TestCase):
+    def test_events_wait_for_the_commit(self):
+        game = Game.objects.create(title='commit', is_active=False)
+        seq = game_events.current(game.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            broadcast_ratings(game)
+            publish_game_event(game.pk, {'type': 'stop_answers'})
+            # nothing is sequenced or sent while the transaction is open
+            self.assertEqual(game_events.current(game.pk), seq)
+        self.assertEqual(game_events.current(game.pk), seq + 2)
+
+
+@override_settings(QUIZ_EVENT_LOG_DIR='')
+class LeaderboardTest(TestCase):
+    def test_ranks_and_gaps(self):
+        board = Leaderboard([{'participant_id': 1, 'score': 5}, {'participant_id': 2, 'score': 9},
+                             {'participant_id': 3, 'score': 5}, {'participant_id': 4, 'score': 2}])
+        self.assertEqual([(r['participant_id'], r['rank'], r['dense_rank'], r['gap']) for r in board.top(3)],
+                         [(2, 1, 1, 0), (1, 2, 2, 4), (3, 2, 2, 4)])
+        self.assertEqual(board.position(4), {'participant_id': 4, 'rank': 4, 'dense_rank': 3, 'score': 2, 'gap': 3, 'total': 4})
+        self.assertIsNone(board.position(99))
+
+    def test_rows_carry_only_leaderboard_fields(self):
+        board = Leaderboard([{'participant_id': 1, 'team_name': 'a', 'score': 1, 'session_key': 'secret'}])
+        self.assertEqual(set(board.top()[0]), set(ENTRY_FIELDS) | {'rank', 'dense_rank', 'gap'})
+
+    def test_broadcast_has_no_session_keys(self):
+        game = Game.objects.create(title='ratings', is_active=False)
+        Participant.objects.create(game=game, session_key='secret-session', team_name='t')
+        with mock.patch('quiz.utils.publish_game_event') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                broadcast_ratings(game)
+        (game_id, event), _ = publish.call_args
+        self.assertNotIn('secret-session', repr(event))
+        self.assertEqual(set(event['ratings'][0]), set(ENTRY_FIELDS))
+
+
+class SingleWriterAfterCommitTest(TransactionTestCase):
+    def test_after_commit_work_runs_after_the_futures(self):
+        writer = SingleWriter(batch_size=10)
+        gate = threading.Event()
+        calls = []
+        done = threading.Event()
+        futures = []
+
+        def job(i, fail=False):
+            after_commit_once(('ratings', 1), lambda: calls.append(('ratings', [f.done() for f in futures])))
+            after_commit(calls.append, ('publish', i))
+            if fail:
+                raise ValueError(i)
+            return i
+
+        # the writer is busy with a first batch while the next jobs queue up behind it
+        blocker = writer.submit(gate.wait)
+        futures.extend(writer.submit(job, i, fail=(i == 1)) for i in range(3))
+        futures.append(writer.submit(after_commit, done.set))
+        gate.set()
+        blocker.result(5)
+        self.assertEqual([f.result(5) if i != 1 else None for i, f in enumerate(futures[:3])], [0, None, 2])
+        self.assertTrue(done.wait(5))
+        # one coalesced ratings broadcast, after every future of the batch resolved; the failed job's calls are dropped
+        self.assertEqual(calls, [('ratings', [True] * 4), ('publish', 0), ('publish', 2)])
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='')
+class StopScopeTest(TestCase):
+    def setUp(self):
+        configure_db_executor(0)
+        self.addCleanup(configure_db_executor, getattr(settings, 'QUIZ_DB_EXECUTOR_WORKERS', 8))
+        patcher = mock.patch('quiz.actor.schedule_answers_closed')
+        self.closed = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(get_user_model().objects.create_superuser('stop-scope', password=None))
+
+    def test_stop_after_round_closes_the_round(self):
+        game = Game.objects.create(title='scope', is_active=False)
+        first = Round.objects.create(game=game, title='r1', order=1)
+        second = Round.objects.create(game=game, title='r2', order=2)
+        question = Question.objects.create(round=first, text='q', type=Question.TYPE_OPEN, points=1)
+        Question.objects.create(round=second, text='q2', type=Question.TYPE_OPEN, points=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin_panel:send_question', args=[game.pk, question.pk]), {'state_version': _version(game)})
+            self.client.post(reverse('admin_panel:send_round', args=[game.pk, second.pk]), {'state_version': _version(game)})
+        game.refresh_from_db()
+        self.assertIsNone(game.active_question_id)
+        self.assertIsNone(game.active_question_started_at)
+        self.client.post(reverse('admin_panel:stop_answers', args=[game.pk]), {'state_version': _version(game)})
+        self.closed.assert_called_once_with(game.pk, round_id=second.pk)
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='')
+class ActorStateCacheTest(TestCase):
+    """Answers are checked against an actor's cached state only while no newer transition is known."""
+
+    def setUp(self):
+        configure_db_executor(0)
+        self.addCleanup(configure_db_executor, getattr(settings, 'QUIZ_DB_EXECUTOR_WORKERS', 8))
+        patcher = mock.patch('quiz.actor.schedule_answers_closed')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.game = Game.objects.create(title='cache', is_active=False, accepting_answers=True)
+
+    async def test_transition_in_another_process_invalidates_the_cache(self):
+        actor = game_actor.get_actor(self.game.pk)
+        self.addCleanup(actor._task.cancel)
+        state = await actor.call({'op': 'state'})
+        self.assertTrue(game_actor.local_state(self.game.pk)['accepting_answers'])
+        consumer = GameConsumer()
+        consumer.game_id = self.game.pk
+        consumer.outbound = mock.Mock()
+        # events of our own actor's transitions are not newer than its state
+        await consumer.show_question({'type': 'show_question', 'state_version': state['state_version']})
+        self.assertIsNotNone(game_actor.local_state(self.game.pk))
+        # another worker's actor stops answers and broadcasts the stop
+        version = await sync_to_async(game_actor.apply_transition)(self.game.pk, state['state_version'], {'accepting_answers': False})
+        await consumer.stop_answers({'type': 'stop_answers', 'state_version': version})
+        self.assertIsNone(game_actor.local_state(self.game.pk))
+        self.assertFalse((await actor.call({'op': 'state'}))['accepting_answers'])
+
+    async def test_transition_events_carry_the_version(self):
+        actor = game_actor.get_actor(self.game.pk)
+        self.addCleanup(actor._task.cancel)
+        with mock.patch('quiz.actor.apublish_game_event') as publish:
+            state = await actor.call({'op': 'transition', 'set': {'accepting_answers': False}, 'event': {'type': 'stop_answers'}})
+        (_, event), _ = publish.call_args
+        self.assertEqual(event['state_version'], state['state_version'])
+        self.assertIsNotNone(game_actor.local_state(self.game.pk))
+
+    @override_settings(QUIZ_GAME_ACTOR_CHANNEL='game-actors')
+    async def test_no_local_state_with_an_actor_worker(self):
+        actor = game_actor.get_actor(self.game.pk)
+        self.addCleanup(actor._task.cancel)
+        await actor.call({'op': 'state'})
+        self.assertIsNone(game_actor.local_state(self.game.pk))
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='')
+class OperatorFormVersionTest(TestCase):
+    """Transitions from operator forms apply only against the state version the form was rendered with."""
+
+    def setUp(self):
+        configure_db_executor(0)
+        self.addCleanup(configure_db_executor, getattr(settings, 'QUIZ_DB_EXECUTOR_WORKERS', 8))
+        patcher = mock.patch('quiz.actor.schedule_answers_closed')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(get_user_model().objects.create_superuser('operator', password=None))
+        self.game = Game.objects.create(title='versions', is_active=False)
+        rnd = Round.objects.create(game=self.game, title='r', order=1)
+        self.question = Question.objects.create(round=rnd, text='q', type=Question.TYPE_OPEN, points=1)
+
+    def _post(self, url, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, data)
+        self.game.refresh_from_db()
+
+    def test_panel_forms_need_the_current_version(self):
+        send = reverse('admin_panel:send_question', args=[self.game.pk, self.question.pk])
+        stop = reverse('admin_panel:stop_answers_question', args=[self.game.pk, self.question.pk])
+        for data in ({}, {'state_version': ''}, {'state_version': 'x'}, {'state_version': _version(self.game) + 1}):
+            with self.subTest(data=data):
+                self._post(send, data)
+                self.assertFalse(self.game.accepting_answers)
+        self._post(send, {'state_version': _version(self.game)})
+        self.assertTrue(self.game.accepting_answers)
+        stale = self.game.state_version - 1
+        self._post(stop, {'state_version': stale})
+        self.assertTrue(self.game.accepting_answers)
+        self._post(stop, {'state_version': self.game.state_version})
+        self.assertFalse(self.game.accepting_answers)
+
+    def test_question_admin_controls_post_the_version(self):
+        send = reverse('admin:quiz_question_send', args=[self.question.pk])
+        stop = reverse('admin:quiz_question_stop', args=[self.question.pk])
+        self.assertEqual(self.client.get(send).status_code, 405)
+        self._post(send, {})
+        self.assertFalse(self.game.accepting_answers)
+        page = self.client.get(reverse('admin:quiz_question_changelist')).content.decode()
+        self.assertIn(f'name="state_version" value="{self.game.state_version}"', page)
+        self._post(send, {'state_version': self.game.state_version})
+        self.assertTrue(self.game.accepting_answers)
+        self._post(stop, {'state_version': self.game.state_version - 1})
+        self.assertTrue(self.game.accepting_answers)
+        self._post(stop, {'state_version': self.game.state_version})
+        self.assertFalse(self.game.accepting_answers)
+
+
+class GameAdminLiveStateTest(TestCase):
+    def test_change_form_keeps_the_actors_state(self):
+        self.client.force_login(get_user_model().objects.create_superuser('game-admin', password=None))
+        game = Game.objects.create(title='before', is_active=False)
+        url = reverse('admin:quiz_game_change', args=[game.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # the actor opens answers while the change form is open
+        Game.objects.filter(pk=game.pk).update(accepting_answers=True, state_version=5)
+        created = timezone.localtime(game.created_at)
+        response = self.client.post(url, {
+            'title': 'after', 'description': '', 'video_url': '', 'is_active': '', 'mode': Game.MODE_INDIVIDUAL,
+            'created_at_0': created.strftime('%Y-%m-%d'), 'created_at_1': created.strftime('%H:%M:%S'),
+            'accepting_answers': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        game.refresh_from_db()
+        self.assertEqual(game.title, 'after')
+        self.assertTrue(game.accepting_answers)
+        self.assertEqual(game.state_version, 5)
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='')
+class RoundSheetQueryBudgetTest(TestCase):
+    """A round sheet is written with per-sheet deltas, inside the ws:save_round_answers budget."""
+
+    def setUp(self):
+        self.game = Game.objects.create(title='sheet', is_active=False, accepting_answers=True)
+        rnd = Round.objects.create(game=self.game, title='r', order=1)
+        # choice questions with a correct answer are graded on save: the most expensive sheet
+        self.questions = [Question.objects.create(round=rnd, text=f'q{i}', type=Question.TYPE_CHOICE, points=1,
+                                                  options=['a', 'b'], correct_answer='a', allow_bet=True)
+                          for i in range(6)]
+        self.participant = Participant.objects.create(game=self.game, session_key='sheet', team_name='t')
+        self.consumer = GameConsumer()
+        self.consumer.game_id = self.game.pk
+
+    def _save(self, questions, answer):
+        sheet = [{'question_id': q.pk, 'answer': answer, 'bet': 1} for q in questions]
+        save = GameConsumer._save_round_answers.__wrapped__
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            saved = save(self.consumer, self.participant.pk, sheet, None)
+        self.assertEqual(len(saved), len(questions))
+        return len(queries)
+
+    def test_sheet_within_budget(self):
+        budget = budget_for('ws:save_round_answers')
+        for size in (2, 6):
+            with self.subTest(answers=size):
+                questions = self.questions[:size]
+                self.assertLessEqual(self._save(questions, 'a'), budget)
+                # saving the sheet again updates the answers in place
+                self.assertLessEqual(self._save(questions, 'b'), budget)
+        self.assertEqual(materialized_round_scores(self.game), compute_round_scores(self.game))
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.total_score, -6)
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='event-log-test')
+class EventLogRecordTest(TestCase):
+    """Answer and grade records name the participant, never the session, and only committed writes are logged."""
+
+    def setUp(self):
+        self.game = Game.objects.create(title='log', is_active=False, accepting_answers=True)
+        rnd = Round.objects.create(game=self.game, title='r', order=1)
+        self.question = Question.objects.create(round=rnd, text='q', type=Question.TYPE_CHOICE, points=1,
+                                                options=['a', 'b'], correct_answer='a')
+        self.participant = Participant.objects.create(game=self.game, session_key='secret-session', team_name='t')
+        self.consumer = GameConsumer()
+        self.consumer.game_id = self.game.pk
+        self.records = []
+        for target in ('quiz.consumers.log_event', 'quiz.utils.log_event'):
+            patcher = mock.patch(target, side_effect=lambda game_id, kind, **fields: self.records.append(dict(fields, e=kind)))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _save(self):
+        GameConsumer._save_round_answers.__wrapped__(self.consumer, self.participant.pk, [{'question_id': self.question.pk, 'answer': 'a'}], None)
+
+    def test_records_use_participant_ids(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._save()
+            self.assertEqual(self.records, [])
+        self.assertEqual([(r['e'], r['p'], r['q']) for r in self.records],
+                         [('answer', self.participant.pk, self.question.pk), ('grade', self.participant.pk, self.question.pk)])
+        self.assertNotIn('secret-session', repr(self.records))
+
+    def test_rolled_back_answer_is_not_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self._save()
+                    raise RuntimeError('write failed')
+            except RuntimeError:
+                pass
+        self.assertEqual(self.records, [])
+        self.assertFalse(Answer.objects.filter(question=self.question).exists())
+
+
+class ModerationQueueTest(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(title='moderation', is_active=False)
+        rnd = Round.objects.create(game=self.game, title='r', order=1)
+        self.open = Question.objects.create(round=rnd, text='open', type=Question.TYPE_OPEN, points=1)
+        choice = Question.objects.create(round=rnd, text='choice', type=Question.TYPE_CHOICE, points=1, options=['a'])
+        other = Game.objects.create(title='other', is_active=False)
+        Answer.objects.create(question=Question.objects.create(round=Round.objects.create(game=other, title='r', order=1),
+                                                               text='q', type=Question.TYPE_OPEN, points=1), user_id='x')
+        start = timezone.now()
+        for i in range(23):
+            answer = Answer.objects.create(question=self.open if i % 3 else choice, user_id=f'u{i}', answer_text=str(i),
+                                           is_correct=True if i % 5 == 0 else None)
+            # runs of equal timestamps: pages must split them by id
+            Answer.objects.filter(pk=answer.pk).update(submitted_at=start + datetime.timedelta(seconds=i // 4))
+
+    def _walk(self, limit, **filters):
+        pages, after = [], None
+        while True:
+            answers, after = moderation_queue(self.game.pk, after=after, limit=limit, **filters)
+            pages.append([a.pk for a in answers])
+            if after is None:
+                return pages
+
+    def test_pages_are_disjoint_and_complete(self):
+        for filters in ({'state': 'all'}, {'state': 'pending'}, {'state': 'pending', 'question_type': Question.TYPE_OPEN},
+                        {'state': 'correct', 'question_id': self.open.pk}):
+            expected = list(moderation_queue(self.game.pk, limit=200, **filters)[0])
+            expected_ids = [a.pk for a in sorted(expected, key=lambda a: (a.submitted_at, a.pk))]
+            for limit in (1, 4, 5, 7, len(expected_ids) or 1):
+                with self.subTest(filters=filters, limit=limit):
+                    pages = self._walk(limit, **filters)
+                    flat = [pk for page in pages for pk in page]
+                    self.assertEqual(flat, expected_ids)
+                    self.assertEqual(len(set(flat)), len(flat))
+                    self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+        self.assertEqual(len(self._walk(200, state='all')[0]), 23)
+
+    def test_invalid_cursors_start_over(self):
+        first, _ = moderation_queue(self.game.pk, state='all', limit=5)
+        def b64(raw):
+            return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+        for cursor in ('garbage!', '%%%', b64(b'no separator'), b64(b'x|1'), b64(b'2026-10-19T19:00:00+00:00|abc'),
+                       b64(b'2026-13-45T19:00:00+00:00|3'), b64(b'2026-10-19T19:00:00|3'), b64(b'\xff\xfe|1'), ''):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                self.assertEqual(moderation_queue(self.game.pk, state='all', limit=5, after=cursor)[0], first)
+
+    def test_cursor_round_trip_and_tampering(self):
+        answers, cursor = moderation_queue(self.game.pk, state='all', limit=5)
+        self.assertEqual(decode_cursor(cursor), (answers[-1].submitted_at, answers[-1].pk))
+        # a well-formed cursor edited by hand only moves the start: rows after that position, nothing else
+        last = Answer.objects.filter(question__round__game=self.game).order_by('submitted_at', 'pk').last()
+        self.assertEqual(moderation_queue(self.game.pk, state='all', after=encode_cursor(last))[0], [])
+
+    def test_json_view_handles_bad_cursors(self):
+        self.client.force_login(get_user_model().objects.create_superuser('moderator', password=None))
+        url = reverse('admin_panel:moderation_queue_json', args=[self.game.pk])
+        first = self.client.get(url, {'state': 'all', 'limit': 5}).json()
+        self.assertEqual(self.client.get(url, {'state': 'all', 'limit': 5, 'after': 'tampered'}).json(), first)
+        second = self.client.get(url, {'state': 'all', 'limit': 5, 'after': first['next']}).json()
+        self.assertFalse({a['id'] for a in first['answers']} & {a['id'] for a in second['answers']})
+
+
+class LeaderboardSnapshotTest(TestCase):
+    def test_pack_unpack_round_trip(self):
+        cases = [
+            ([], [], []),
+            ([7], [0], [1]),
+            ([1, 2, 5, 40, 41, 100000], [3, -2, 10, 10, 0, 2 ** 31 - 1], [3, 6, 1, 1, 5, 1]),
+            (list(range(3, 3000, 3)), [random.randint(-50, 500) for _ in range(999)], [random.randint(1, 999) for _ in range(999)]),
+        ]
+        for ids, scores, ranks in cases:
+            with self.subTest(n=len(ids)):
+                data = pack_snapshot(ids, scores, ranks)
+                self.assertEqual(data[0], HISTORY_FORMAT_VERSION)
+                out = unpack_snapshot(data)
+                self.assertEqual([a.tolist() for a in out], [ids, scores, ranks])
+
+    def test_unpack_rejects_unknown_or_corrupt_data(self):
+        data = pack_snapshot([1, 2], [5, 3], [1, 2])
+        for bad in (b'', bytes([HISTORY_FORMAT_VERSION + 1]) + data[1:], data[:1] + b'not zlib'):
+            with self.subTest(bad=bad):
+                with self.assertRaises((ValueError, zlib.error)):
+                    unpack_snapshot(bad)
+
+    def test_history_aligns_late_registrations_and_hides_session_keys(self):
+        game = Game.objects.create(title='history', is_active=False)
+        rnd = Round.objects.create(game=game, title='r1', order=1)
+        first = Participant.objects.create(game=game, session_key='secret-session-1', team_name='Альфа')
+        nameless = Participant.objects.create(game=game, session_key='secret-session-2')
+        ParticipantRoundScore.objects.create(participant=first, round=rnd, score=4)
+        capture_snapshot(game.pk, rnd.pk)
+        late = Participant.objects.create(game=game, session_key='secret-session-3', last_name='Петров')
+        ParticipantRoundScore.objects.create(participant=late, round=rnd, score=6)
+        capture_snapshot(game.pk, rnd.pk)  # same round: refreshes instead of adding
+        self.assertEqual(LeaderboardSnapshot.objects.filter(game=game).count(), 1)
+        capture_snapshot(game.pk)
+
+        history = game_history(game)
+        self.assertEqual([p['name'] for p in history['participants']], ['Альфа', f'#{nameless.pk}', 'Петров'])
+        self.assertNotIn('secret-session', json.dumps(history, ensure_ascii=False))
+        self.assertEqual([s['scores'] for s in history['snapshots']], [[4, 0, 6], [4, 0, 6]])
+        self.assertEqual(history['snapshots'][0]['ranks'], [2, 3, 1])
+        # an older snapshot taken before `late` registered is padded with None
+        old = pack_snapshot([first.pk, nameless.pk], [4, 0], [1, 2])
+        column = {p['participant_id']: i for i, p in enumerate(history['participants'])}
+        self.assertEqual(align_snapshot(old, column), ([4, 0, None], [1, 2, None]))
+
+
+class RoundSealTest(SimpleTestCase):
+    payload = {'id': 3, 'title': 'Раунд', 'questions': [{'id': 9, 'text': 'Столица?', 'type': 'open', 'options': [],
+                                                        'allow_bet': False, 'max_bet': 10, 'points': 1}]}
+
+    def test_seal_unseal_round_trip(self):
+        sealed = seal_round(self.payload)
+        self.assertEqual(sealed['digest'], payload_digest(self.payload))
+        self.assertNotIn('Столица'.encode(), base64.b64decode(sealed['sealed']))
+        self.assertEqual(unseal_round(**sealed), self.payload)
+        # deterministic per payload, and any edit changes digest and key
+        self.assertEqual(seal_round(self.payload), sealed)
+        edited = dict(self.payload, title='Раунд 2')
+        self.assertNotEqual(payload_digest(edited), sealed['digest'])
+        self.assertNotEqual(unseal_key(payload_digest(edited)), unseal_key(sealed['digest']))
+
+    def test_wrong_key_and_tampering_fail(self):
+        from cryptography.exceptions import InvalidTag
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        sealed = seal_round(self.payload)
+        other = seal_round(dict(self.payload, id=4))
+        with self.assertRaises(InvalidTag):
+            unseal_round(other['digest'], sealed['nonce'], sealed['sealed'])
+        with self.assertRaises(InvalidTag):
+            AESGCM(os.urandom(16)).decrypt(base64.b64decode(sealed['nonce']), base64.b64decode(sealed['sealed']), None)
+        ciphertext = bytearray(base64.b64decode(sealed['sealed']))
+        for i in (0, len(ciphertext) // 2, len(ciphertext) - 1):
+            with self.subTest(byte=i):
+                flipped = bytearray(ciphertext)
+                flipped[i] ^= 1
+                with self.assertRaises(InvalidTag):
+                    unseal_round(sealed['digest'], sealed['nonce'], base64.b64encode(bytes(flipped)).decode())
+        with self.assertRaises(InvalidTag):
+            unseal_round(sealed['digest'], other['nonce'], sealed['sealed'])
+        with override_settings(SECRET_KEY='another-secret'):
+            with self.assertRaises(InvalidTag):
+                unseal_round(**sealed)
+
+
+class OutboundQueueTest(SimpleTestCase):
+    """A slow client: frames pile up behind one blocked send."""
+
+    async def _run(self, max_state, fill):
+        sent, gate = [], asyncio.Event()
+
+        async def send(message):
+            sent.append(message)
+            await gate.wait()
+
+        before = outbound_stats()
+        queue = OutboundQueue(send, max_state=max_state)
+        queue.start()
+        queue.put_control({'c': 0})
+        while not sent:
+            await asyncio.sleep(0)
+        fill(queue)
+        gate.set()
+        while len(queue):
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await queue.close()
+        after = outbound_stats()
+        self.assertEqual(after['depth'], before['depth'])
+        self.assertEqual(after['connections'], before['connections'])
+        return sent, {k: after[k] - before[k] for k in ('sent', 'coalesced', 'dropped')}
+
+    async def test_control_never_dropped_state_latest_wins(self):
+        def fill(queue):
+            for i in range(1, 201):
+                queue.put_state('ratings', {'s': 'ratings', 'v': i})
+                if i % 2:
+                    queue.put_control({'c': i})
+                if i % 50 == 0:
+                    queue.put_state('counters', {'s': 'counters', 'v': i})
+
+        sent, stats = await self._run(max_state=50, fill=fill)
+        controls = [m['c'] for m in sent if 'c' in m]
+        self.assertEqual(controls, [0] + list(range(1, 201, 2)))
+        # every control goes out before the queued state, which arrives once per key with its newest value
+        self.assertEqual(sent[len(controls):], [{'s': 'ratings', 'v': 200}, {'s': 'counters', 'v': 200}])
+        self.assertEqual(stats, {'sent': len(sent), 'coalesced': 199 + 3, 'dropped': 0})
+
+    async def test_full_queue_drops_oldest_state_only(self):
+        def fill(queue):
+            for i in range(6):
+                queue.put_state(f'k{i}', {'s': f'k{i}', 'v': 1})
+                queue.put_control({'c': i + 1})
+            queue.put_state('k4', {'s': 'k4', 'v': 2})
+            self.assertEqual(len(queue), 6 + 3)
+
+        sent, stats = await self._run(max_state=3, fill=fill)
+        self.assertEqual([m['c'] for m in sent if 'c' in m], list(range(7)))
+        self.assertEqual([m for m in sent if 's' in m],
+                         [{'s': 'k3', 'v': 1}, {'s': 'k4', 'v': 2}, {'s': 'k5', 'v': 1}])
+        self.assertEqual(stats, {'sent': 10, 'coalesced': 1, 'dropped': 3})
+
+
+class RegistrationTest(TestCase):
+    def setUp(self):
+        self.game = Game.objects.create(title='registration', is_active=True, mode=Game.MODE_TEAM)
+        self.url = reverse('quiz:register_for_game', args=[self.game.pk])
+
+    def test_repeated_post_keeps_one_participant(self):
+        for _ in range(3):
+            response = self.client.post(self.url, {'team_name': 'Знатоки'})
+            self.assertRedirects(response, f'/game/{self.game.pk}/play/', fetch_redirect_response=False)
+        participant = Participant.objects.get(game=self.game)
+        self.assertEqual(participant.team_name, 'Знатоки')
+        self.assertEqual(self.client.session['participants'], {str(self.game.pk): participant.pk})
+        # a corrected name updates the same participant
+        self.client.post(self.url, {'team_name': 'Знатоки 2'})
+        self.assertEqual(list(Participant.objects.filter(game=self.game).values_list('pk', 'team_name')),
+                         [(participant.pk, 'Знатоки 2')])
+        # an empty name is rejected and changes nothing
+        self.client.post(self.url, {'team_name': '  '})
+        self.assertEqual(Participant.objects.get(game=self.game).team_name, 'Знатоки 2')
+
+    def test_other_browsers_get_their_own_participant(self):
+        self.client.post(self.url, {'team_name': 'a'})
+        self.client_class().post(self.url, {'team_name': 'b'})
+        self.assertEqual(sorted(Participant.objects.filter(game=self.game).values_list('team_name', flat=True)), ['a', 'b'])
+
+
+class ConcurrentRegistrationTest(TransactionTestCase):
+    def test_concurrent_posts_of_one_browser(self):
+        game = Game.objects.create(title='registration', is_active=True, mode=Game.MODE_TEAM)
+        url = reverse('quiz:register_for_game', args=[game.pk])
+        first = self.client_class()
+        first.get(url)
+        cookie = first.cookies[settings.SESSION_COOKIE_NAME].value
+        barrier = threading.Barrier(4)
+        errors = []
+
+        def register():
+            client = self.client_class()
+            client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        client.post(url, {'team_name': 'Знатоки'})
+                        return
+                    except OperationalError as exc:
+                        # the in-memory test database locks whole tables; a real one would let the upsert wait
+                        if 'locked' not in str(exc):
+                            raise
+                        time.sleep(0.01)
+                errors.append('still locked')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(errors, [])
+        self.assertEqual(list(Participant.objects.filter(game=game).values_list('team_name', flat=True)), ['Знатоки'])
+
+
+class ConsumerLabelTest(TransactionTestCase):
+    async def test_rejects_non_numeric_game_id(self):
+        communicator = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/game/x/')
+        communicator.scope['url_route'] = {'kwargs': {'game_id': 'not-a-game'}}
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_unknown_actions_share_one_label(self):
+        communicator = WebsocketCommunicator(GameConsumer.as_asgi(), '/ws/game/987654/')
+        communicator.scope['url_route'] = {'kwargs': {'game_id': '987654'}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        for action in ('made-up-1', 'made-up-2', None):
+            await communicator.send_json_to({'action': action})
+        await communicator.send_json_to({'action': 'round_staged', 'round_id': 1, 'digest': 'd'})
+        await communicator.disconnect()
+        actions = {key[1] for key in WS_MESSAGES._values if key[0] == '987654'}
+        self.assertEqual(actions, {'other', 'round_staged'})
+
+
+# Query budgets for every view in quiz.views and admin_panel.views. Each view is
+# requested against a small and a large game; the count must stay within
+# budget and must not grow with the number of participants/answers.
+VIEW_BUDGETS = {
+    'quiz:index': 2,
+    'quiz:game_stream': 2,
+    'quiz:register_for_game': 4,
+    'quiz:play_game': 4,
+    'quiz:game_ratings': 4,
+    'quiz:game_ratings_history': 4,
+    'quiz:public_game_ratings': 4,
+    'quiz:metrics': 0,
+    'admin_panel:manage_game': 8,
+    'admin_panel:send_question': 8,
+    'admin_panel:send_round': 8,
+    'admin_panel:stage_round': 4,
+    'admin_panel:stop_answers': 6,
+    'admin_panel:stop_answers_question': 6,
+    'admin_panel:moderate_answers': 6,
+    'admin_panel:moderation_queue_json': 5,
+    'admin_panel:moderate_answers_question': 6,
+    'admin_panel:question_stats_json': 4,
+    'admin_panel:moderate_round': 6,
+    'admin_panel:ratings': 6,
+    'admin_panel:public_ratings': 4,
+    'admin_panel:mark_answer': 15,
+    'admin_panel:profiling': 3,
+}
+
+
+class _CommittingClient:
+    """The test client, running on_commit callbacks (broadcasts) inside each request as a real commit would."""
+
+    def __init__(self, test):
+        self.test = test
+
+    def __getattr__(self, method):
+        def request(*args, **kwargs):
+            with self.test.captureOnCommitCallbacks(execute=True):
+                return getattr(self.test.client, method)(*args, **kwargs)
+        return request
+
+
+@override_settings(QUIZ_DB_SINGLE_WRITER='off', QUIZ_EVENT_LOG_DIR='')
+class ViewQueryBudgetTest(TestCase):
+    """Every view stays within its query budget, independent of the game size.
+
+    Writes run inline and the DB pool is off, so the actor's and the writer's
+    queries run on the test connection and are counted with the view's.
+    """
+
+    SIZES = (3, 30)
+
+    def setUp(self):
+        configure_db_executor(0)
+        self.addCleanup(configure_db_executor, getattr(settings, 'QUIZ_DB_EXECUTOR_WORKERS', 8))
+        # grading and the leaderboard snapshot after a stop run in a background thread, outside the view
+        patcher = mock.patch('quiz.actor.schedule_answers_closed')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_superuser('query-budget', password=None)
+
+    def _make_game(self, participants):
+        game = Game.objects.create(title='query-budget', is_active=False)
+        rounds = [Round.objects.create(game=game, title=f'r{i}', order=i) for i in range(3)]
+        questions = []
+        for rnd in rounds:
+            for i in range(3):
+                qtype = Question.TYPE_OPEN if i == 0 else Question.TYPE_CHOICE
+                questions.append(Question.objects.create(
+                    round=rnd, text=f'q{i}', type=qtype, points=1,
+                    options=None if qtype == Question.TYPE_OPEN else ['a', 'b'],
+                    correct_answer=None if qtype == Question.TYPE_OPEN else 'a',
+                ))
+        answer = None
+        for i in range(participants):
+            p = Participant.objects.create(session_key=f'qb-{game.id}-{i}', game=game, team_name=f't{i}')
+            for q in questions:
+                answer = Answer.objects.create(question=q, user_id=p.session_key, answer_text='a')
+        for rnd in rounds:
+            capture_snapshot(game.id, rnd.id)
+        open_q = questions[0]
+        gid = game.id
+        return {
+            'quiz:index': ('get', reverse('quiz:index'), None),
+            'quiz:game_stream': ('get', reverse('quiz:game_stream', args=[gid]), None),
+            'quiz:register_for_game': ('get', reverse('quiz:register_for_game', args=[gid]), None),
+            'quiz:play_game': ('get', reverse('quiz:play_game', args=[gid]), None),
+            'quiz:game_ratings': ('get', reverse('quiz:game_ratings', args=[gid]), None),
+            'quiz:game_ratings_history': ('get', reverse('quiz:game_ratings_history', args=[gid]), None),
+            'quiz:public_game_ratings': ('get', reverse('quiz:public_game_ratings', args=[gid]), None),
+            'quiz:metrics': ('get', reverse('quiz:metrics'), None),
+            'admin_panel:manage_game': ('get', reverse('admin_panel:manage_game', args=[gid]), None),
+            # operator forms post the state version, filled in just before the request
+            'admin_panel:send_question': ('post', reverse('admin_panel:send_question', args=[gid, open_q.id]), {'state_version': None}),
+            'admin_panel:send_round': ('post', reverse('admin_panel:send_round', args=[gid, rounds[0].id]), {'state_version': None}),
+            'admin_panel:stage_round': ('post', reverse('admin_panel:stage_round', args=[gid, rounds[1].id]), None),
+            'admin_panel:stop_answers': ('post', reverse('admin_panel:stop_answers', args=[gid]), {'state_version': None}),
+            'admin_panel:stop_answers_question': ('post', reverse('admin_panel:stop_answers_question', args=[gid, open_q.id]), {'state_version': None}),
+            'admin_panel:moderate_answers': ('get', reverse('admin_panel:moderate_answers', args=[gid]), None),
+            'admin_panel:moderation_queue_json': ('get', reverse('admin_panel:moderation_queue_json', args=[gid]), None),
+            'admin_panel:moderate_answers_question': ('get', reverse('admin_panel:moderate_answers_question', args=[gid, open_q.id]), None),
+            'admin_panel:question_stats_json': ('get', reverse('admin_panel:question_stats_json', args=[gid, questions[1].id]), None),
+            'admin_panel:moderate_round': ('get', reverse('admin_panel:moderate_round', args=[gid, rounds[0].id]), None),
+            'admin_panel:ratings': ('get', reverse('admin_panel:ratings', args=[gid]), None),
+            'admin_panel:public_ratings': ('get', reverse('admin_panel:public_ratings', args=[gid]), None),
+            'admin_panel:mark_answer': ('post', reverse('admin_panel:mark_answer', args=[gid, answer.id]), {'action': 'correct'}),
+            'admin_panel:profiling': ('get', reverse('admin_panel:profiling'), None),
+        }, game
+
+    def test_views_within_budget(self):
+        counts = {}
+        for size in self.SIZES:
+            urls, game = self._make_game(size)
+            self.client.force_login(self.user)
+            # establish the session first so session creation is not billed to a view
+            self.client.get(urls['quiz:game_stream'][1])
+            for name, (method, url, data) in urls.items():
+                if data and 'state_version' in data:
+                    data = dict(data, state_version=_version(game))
+                with self.subTest(view=name, participants=size):
+                    _, counts[name, size] = assert_query_budget(_CommittingClient(self), url, VIEW_BUDGETS[name], method=method, data=data)
+        small, large = self.SIZES
+        for name in VIEW_BUDGETS:
+            if (name, small) in counts and (name, large) in counts:
+                with self.subTest(view=name):
+                    self.assertLessEqual(counts[name, large], counts[name, small],
+                                         f'{name}: query count grows with the number of participants')
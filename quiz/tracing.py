@@ -0,0 +1,123 @@
+"""Optional latency tracing of inbound WebSocket messages.
+
+Every inbound message gets a correlation id, returned to the client in the
+ack. A sampled fraction (QUIZ_TRACE_SAMPLE_RATE, 0 disables) also records
+spans (time queued for the DB pool, DB work, group_send) and is appended as
+one JSON line to QUIZ_TRACE_FILE by a background writer thread. Summarize the
+file with `manage.py trace_summary`.
+"""
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('quiz_trace', default=None)
+
+
+class Trace:
+    __slots__ = ('id', 'game', 'action', 'sampled', 'spans', 'started', 'ts')
+
+    def __init__(self, game, action, sampled):
+        self.id = uuid.uuid4().hex[:16]
+        self.game = game
+        self.action = action
+        self.sampled = sampled
+        self.spans = []
+        self.started = time.perf_counter()
+        self.ts = time.time()
+
+    def add_span(self, name, seconds):
+        if self.sampled:
+            self.spans.append((name, seconds))
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - started)
+
+    def as_record(self):
+        return {
+            'id': self.id,
+            'game': self.game,
+            'action': self.action,
+            'ts': round(self.ts, 3),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'spans': [{'name': n, 'ms': round(s * 1000, 3)} for n, s in self.spans],
+        }
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """Record a span on the current trace, if any."""
+    trace = _current.get()
+    if trace is None or not trace.sampled:
+        yield
+        return
+    with trace.span(name):
+        yield
+
+
+@contextmanager
+def trace_message(game, action):
+    """Trace the handling of one inbound message; yields the Trace."""
+    rate = getattr(settings, 'QUIZ_TRACE_SAMPLE_RATE', 0.0)
+    trace = Trace(game, action, sampled=bool(rate) and random.random() < rate)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        if trace.sampled:
+            _writer.write(trace.as_record())
+
+
+class _TraceWriter:
+    """Appends records to the trace file from a daemon thread, off the event loop."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='quiz-trace-writer', daemon=True)
+                    self._thread.start()
+        self._queue.put(record)
+
+    def _run(self):
+        path = getattr(settings, 'QUIZ_TRACE_FILE', 'traces.jsonl')
+        while True:
+            records = [self._queue.get()]
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(path, 'a', encoding='utf-8') as fh:
+                    for record in records:
+                        fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+            except OSError:
+                logger.exception('Failed to write traces to %s', path)
+
+
+_writer = _TraceWriter()
@@ -10,5 +10,8 @@ urlpatterns = [
     path('game/<int:game_id>/register/', views.register_for_game, name='register_for_game'),
     path('game/<int:game_id>/play/', views.play_game, name='play_game'),
     path('game/<int:game_id>/ratings/', views.ratings, name='game_ratings'),
+    path('game/<int:game_id>/ratings/history/', views.ratings_history, name='game_ratings_history'),
+    path('game/<int:game_id>/events/', views.spectator_events, name='spectator_events'),
     path('game/<int:game_id>/ratings/public/', admin_views.public_participants_rating, name='public_game_ratings'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,6 +1,18 @@
-from django.db.models import Sum
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .events import after_commit, after_commit_once, publish_game_event
+from .eventlog import log_dir, log_event
+from .metrics import UPDATE_SCORE_SECONDS
+from .models import Answer, Participant, ParticipantRoundScore
+from .stats import apply_stats_delta, publish_question_stats, stats_delta
+
 
 def update_score(participant, question, answer, bet_used):
     """
@@ -18,29 +30,21 @@ def update_score(participant, question, answer, bet_used):
     as the sum of all awarded points for that participant in the game, persist it and
     broadcast updated ratings to the WebSocket group `game_<game_id>`.
     """
+    with UPDATE_SCORE_SECONDS.time(game=question.round.game_id):
+        _update_score(participant, question, answer, bet_used)
+
+
+def _update_score(participant, question, answer, bet_used):
     # defensive defaults
     try:
         bet = int(bet_used) if bet_used is not None else 0
     except Exception:
         bet = 0
 
-    # New scoring rules:
-    # - If no bet (bet == 0): correct -> question.points, incorrect -> 0
-    # - If bet > 0: correct -> question.points + bet, incorrect -> -bet
-    # This follows: base points plus coefficient for correct; negative of coefficient for incorrect.
-    if bet > 0:
-        if answer.is_correct:
-            pts = question.points + bet
-        else:
-            pts = -bet
-    else:
-        if answer.is_correct:
-            pts = question.points
-        else:
-            pts = 0
-
+    pts = answer_points(question, answer.is_correct, bet)
     answer.points_awarded = pts
     answer.save()
+    log_grades(question.round.game_id, [(answer.user_id, question.pk, answer.is_correct, pts)])
 
     # Recalculate participant total for this game
     game = question.round.game
@@ -53,10 +57,270 @@ def update_score(participant, question, answer, bet_used):
     participant.save()
 
     # Broadcast updated ratings
-    participants = list(game.participants.all())
-    ratings = []
+    broadcast_ratings(game)
+
+
+def answer_points(question, is_correct, bet):
+    """Points for an automatically graded answer.
+
+    New scoring rules:
+    - If no bet (bet == 0): correct -> question.points, incorrect -> 0
+    - If bet > 0: correct -> question.points + bet, incorrect -> -bet
+    This follows: base points plus coefficient for correct; negative of coefficient for incorrect.
+    """
+    if bet > 0:
+        return question.points + bet if is_correct else -bet
+    return question.points if is_correct else 0
+
+
+def log_grades(game_id, grades, src='auto'):
+    """Log `grade` records for [(session key, question id, is_correct, points)] once the transaction commits.
+
+    The log identifies players by participant id; session keys never reach it.
+    """
+    if log_dir() and grades:
+        after_commit(_log_grades, game_id, list(grades), src)
+
+
+def _log_grades(game_id, grades, src):
+    pids = dict(Participant.objects.filter(game_id=game_id, session_key__in={g[0] for g in grades})
+                .values_list('session_key', 'id'))
+    for session_key, question_id, is_correct, points in grades:
+        log_event(game_id, 'grade', p=pids.get(session_key), q=question_id, c=is_correct, pts=points, src=src)
+
+
+def refresh_total_scores(game_id, user_ids):
+    """Recompute Participant.total_score of the given session keys, as update_score does for one answer."""
+    totals = dict(Answer.objects.filter(question__round__game_id=game_id, user_id__in=user_ids, points_awarded__isnull=False)
+                  .values_list('user_id').annotate(total=Sum('points_awarded')))
+    participants = list(Participant.objects.filter(game_id=game_id, session_key__in=user_ids))
     for p in participants:
-        ratings.append({'participant_id': p.id, 'session_key': p.session_key, 'team_name': p.team_name, 'score': p.total_score})
+        p.total_score = totals.get(p.session_key, 0)
+    Participant.objects.bulk_update(participants, ['total_score'])
+
+
+_answer_batch = ContextVar('quiz_answer_batch', default=None)
+
+
+class AnswerBatch:
+    """ParticipantRoundScore / QuestionStat deltas and grades of the Answer.save calls in an `answer_batch()`."""
+
+    def __init__(self):
+        # (game_id, session_key, round_id) -> [answered, correct, score]
+        self.scores = defaultdict(lambda: [0, 0, 0])
+        self.stats = Counter()
+        self.games = {}
+        # game_id -> [(session key, question id, is_correct, points)]
+        self.grades = defaultdict(list)
+
+    def add_score(self, game_id, session_key, round_id, answered=0, correct=0, score=0):
+        delta = self.scores[(game_id, session_key, round_id)]
+        delta[0] += answered
+        delta[1] += correct
+        delta[2] += score
+
+    def graded(self, answer):
+        """An answer graded on save: its game gets one ratings broadcast at the end, as update_score would send."""
+        game = answer.question.round.game
+        self.games[game.pk] = game
+        self.grades[game.pk].append((answer.user_id, answer.question_id, answer.is_correct, answer.points_awarded))
+
+    def apply(self):
+        for (game_id, session_key, round_id), delta in self.scores.items():
+            apply_round_score_delta(game_id, session_key, round_id, *delta)
+        apply_stats_delta(self.stats)
+        totals = defaultdict(set)
+        for (game_id, session_key, _), delta in self.scores.items():
+            if delta[2]:
+                totals[game_id].add(session_key)
+        for game_id, user_ids in totals.items():
+            refresh_total_scores(game_id, list(user_ids))
+        for game_id, grades in self.grades.items():
+            log_grades(game_id, grades)
+        for game in self.games.values():
+            broadcast_ratings(game)
+
+
+def current_answer_batch():
+    return _answer_batch.get()
+
+
+@contextmanager
+def answer_batch():
+    """Save several answers (e.g. a player's round sheet) in one transaction with their aggregates applied once.
+
+    Answer.save inside the block computes points before its write and collects
+    its score and stats deltas here instead of applying them; at the end the
+    deltas are summed per participant and round (and per counter), Participant
+    totals are refreshed once and each game with graded answers gets one
+    ratings broadcast after the commit.
+    """
+    if _answer_batch.get() is not None:
+        yield _answer_batch.get()
+        return
+    batch = AnswerBatch()
+    with transaction.atomic():
+        token = _answer_batch.set(batch)
+        try:
+            yield batch
+        finally:
+            _answer_batch.reset(token)
+        batch.apply()
+
+
+def grade_choice_answers(question):
+    """Grade the pending answers of a choice question with one UPDATE comparing option indexes.
+
+    Round scores and participant totals get the resulting deltas and ratings are
+    broadcast once. Returns the number of graded answers.
+    """
+    game_id = question.round.game_id
+    pending = Answer.objects.filter(question=question, is_correct__isnull=True)
+    with transaction.atomic():
+        rows = list(pending.select_for_update().values_list('user_id', 'option_index', 'bet_used', 'points_awarded', 'response_ms'))
+        if not rows:
+            return 0
+        bet = Coalesce('bet_used', 0)
+        if question.correct_option is None:
+            pending.update(is_correct=False, points_awarded=-bet)
+        else:
+            correct = Q(option_index=question.correct_option)
+            pending.update(
+                # Case rather than a bare comparison: NULL option indexes (blank answers) are incorrect
+                is_correct=Case(When(correct, then=Value(True)), default=Value(False), output_field=BooleanField()),
+                points_awarded=Case(When(correct, then=Value(question.points) + bet), default=-bet),
+            )
+
+        deltas = {}
+        stats = Counter()
+        grades = []
+        for user_id, option, bet_used, old_points, response_ms in rows:
+            is_correct = option is not None and option == question.correct_option
+            stats.update(stats_delta((question.pk, option, bet_used, None, response_ms),
+                                     (question.pk, option, bet_used, is_correct, response_ms)))
+            pts = answer_points(question, is_correct, bet_used or 0)
+            correct_n, score = deltas.get(user_id, (0, 0))
+            deltas[user_id] = (correct_n + is_correct, score + pts - (old_points or 0))
+            grades.append((user_id, question.pk, is_correct, pts))
+        for user_id, (correct_n, score) in deltas.items():
+            apply_round_score_delta(game_id, user_id, question.round_id, correct=correct_n, score=score)
+        refresh_total_scores(game_id, list(deltas))
+        apply_stats_delta(stats)
+        log_grades(game_id, grades)
+    broadcast_ratings(question.round.game)
+    publish_question_stats(question.pk)
+    return len(rows)
+
+
+def option_distribution(question):
+    """[(option text, answers)] for a choice question, counted with one GROUP BY on option_index.
+
+    Answers that match no option are counted under None (as the last row, if any).
+    """
+    counts = dict(Answer.objects.filter(question=question).values_list('option_index')
+                  .annotate(n=Count('id')).order_by())
+    rows = [(opt, counts.pop(i, 0)) for i, opt in enumerate(question.options or [])]
+    other = sum(counts.values())
+    if other:
+        rows.append((None, other))
+    return rows
+
+
+def broadcast_ratings(game):
+    """Send the current ratings of `game` to its WebSocket group.
+
+    The event carries the full table plus a `rating_id`; consumers build one
+    Leaderboard per event and send players only the top-K and their own position.
+    Inside a transaction the table is read and sent after the commit, once per
+    game for a whole single-writer batch.
+    """
+    after_commit_once(('ratings', game.pk), _broadcast_ratings, game)
+
+
+def _broadcast_ratings(game):
+    ratings = []
+    for r in round_ratings(game, list(game.rounds.all())):
+        p = r['participant']
+        # no session keys: the table reaches every socket of the game
+        ratings.append({'participant_id': p.id, 'team_name': p.team_name, 'score': r['score']})
+
+    publish_game_event(game.id, {'type': 'update_rating', 'ratings': ratings, 'rating_id': uuid.uuid4().hex})
+
+
+def apply_round_score_delta(game_id, session_key, round_id, answered=0, correct=0, score=0, create=True):
+    """Add a delta to the ParticipantRoundScore rows of every participant with `session_key`.
+
+    Answers are linked to participants by session key, so all participants of the
+    game sharing that key get the same delta (this matches the raw aggregation).
+    Missing rows are created unless `create` is False.
+    """
+    if not (answered or correct or score) or round_id is None:
+        return
+    pids = list(Participant.objects.filter(game_id=game_id, session_key=session_key).values_list('id', flat=True))
+    if not pids:
+        return
+    # no savepoint: callers (Answer.save, answer batches, bulk grading) already run in a transaction
+    with transaction.atomic(savepoint=False):
+        rows = ParticipantRoundScore.objects.filter(participant_id__in=pids, round_id=round_id)
+        if create:
+            existing = set(rows.values_list('participant_id', flat=True))
+            missing = [ParticipantRoundScore(participant_id=pid, round_id=round_id) for pid in pids if pid not in existing]
+            if missing:
+                ParticipantRoundScore.objects.bulk_create(missing, ignore_conflicts=True)
+        rows.update(
+            score=F('score') + score,
+            answered_count=F('answered_count') + answered,
+            correct_count=F('correct_count') + correct,
+        )
+
 
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'game_{game.id}', {'type': 'update_rating', 'ratings': ratings})
+def compute_round_scores(game):
+    """Aggregate raw answers into {(participant_id, round_id): (score, answered, correct)}."""
+    by_session = {}
+    for pid, session_key in game.participants.values_list('id', 'session_key'):
+        by_session.setdefault(session_key, []).append(pid)
+
+    rows = (Answer.objects.filter(question__round__game=game)
+            .values('user_id', 'question__round_id')
+            .annotate(score=Sum('points_awarded'), answered=Count('id'), correct=Count('id', filter=Q(is_correct=True))))
+    result = {}
+    for row in rows:
+        for pid in by_session.get(row['user_id'], []):
+            result[(pid, row['question__round_id'])] = (row['score'] or 0, row['answered'], row['correct'])
+    return result
+
+
+def rebuild_round_scores(game):
+    """Replace the materialized ParticipantRoundScore rows of `game` with a fresh aggregation."""
+    scores = compute_round_scores(game)
+    with transaction.atomic():
+        ParticipantRoundScore.objects.filter(participant__game=game).delete()
+        ParticipantRoundScore.objects.bulk_create([
+            ParticipantRoundScore(participant_id=pid, round_id=rid, score=score, answered_count=answered, correct_count=correct)
+            for (pid, rid), (score, answered, correct) in scores.items()
+        ])
+    return len(scores)
+
+
+def materialized_round_scores(game):
+    """Read the materialized table in the same shape as `compute_round_scores` (zero rows skipped)."""
+    result = {}
+    for pid, rid, score, answered, correct in ParticipantRoundScore.objects.filter(participant__game=game).values_list(
+            'participant_id', 'round_id', 'score', 'answered_count', 'correct_count'):
+        if score or answered or correct:
+            result[(pid, rid)] = (score, answered, correct)
+    return result
+
+
+def round_ratings(game, rounds, participants=None):
+    """Build sorted rating rows `{'participant', 'per_round', 'score'}` from ParticipantRoundScore."""
+    if participants is None:
+        participants = list(game.participants.all())
+    scores = {}
+    for pid, rid, score in ParticipantRoundScore.objects.filter(participant__game=game).values_list('participant_id', 'round_id', 'score'):
+        scores[(pid, rid)] = score
+    ratings = []
+    for p in participants:
+        per_round = [scores.get((p.id, r.id), 0) for r in rounds]
+        ratings.append({'participant': p, 'per_round': per_round, 'score': sum(per_round)})
+    return sorted(ratings, key=lambda r: r['score'], reverse=True)
@@ -10,9 +10,28 @@ import base64
 from django.shortcuts import redirect
 from django.urls import reverse
 from .models import Participant
+from .utils import round_ratings
+from .history import game_history
+from . import metrics as quiz_metrics
+from .metrics import timed_view
+from .dbrouter import read_from_replica
+from .cache import cached_game, two_tier
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from .db import db_sync_to_async
+from .spectators import event_stream
+from .protocol import codes as ws_codes
 import uuid
 
 
+def _qr_base64(url):
+    qr_img = qrcode.make(url)
+    buffer = BytesIO()
+    qr_img.save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+@read_from_replica
 def game_stream(request: HttpRequest, game_id: int):
     game = get_object_or_404(Game, pk=game_id)
 
@@ -22,11 +41,8 @@ def game_stream(request: HttpRequest, game_id: int):
     # Prefer absolute URL for QR so scanners work across devices
     registration_url = request.build_absolute_uri(registration_path)
 
-    # Generate QR code image and encode as base64 PNG
-    qr_img = qrcode.make(registration_url)
-    buffer = BytesIO()
-    qr_img.save(buffer, format='PNG')
-    qr_b64 = base64.b64encode(buffer.getvalue()).decode('ascii')
+    # Generate QR code image and encode as base64 PNG (cached: the URL rarely changes)
+    qr_b64 = two_tier.get_or_set(f'quiz:qr:{registration_url}', lambda: _qr_base64(registration_url), 24 * 3600)
 
     context = {
         'game': game,
@@ -37,20 +53,60 @@ def game_stream(request: HttpRequest, game_id: int):
     return render(request, 'quiz/stream.html', context)
 
 
-def register_for_game(request: HttpRequest, game_id: int):
-    game = get_object_or_404(Game, pk=game_id)
+def _player_key(request):
+    """Stable per-browser key participants are registered under.
 
-    # Ensure session exists
+    This is the session key, except with signed-cookie sessions, whose key
+    changes on every write: there a random key kept in the session is used.
+    """
+    if settings.SESSION_ENGINE.endswith('signed_cookies'):
+        key = request.session.get('player_key')
+        if not key:
+            key = request.session['player_key'] = uuid.uuid4().hex
+        return key
     if not request.session.session_key:
         request.session.save()
-    session_key = request.session.session_key
+    return request.session.session_key
+
+
+def _remember_participant(request, game_id, participant_id):
+    participants = dict(request.session.get('participants') or {})
+    if participants.get(str(game_id)) != participant_id:
+        participants[str(game_id)] = participant_id
+        request.session['participants'] = participants
+    if request.session.get('participant_id') != participant_id:
+        request.session['participant_id'] = participant_id
+
+
+def _register(game, player_key, **fields):
+    """Create the participant of `player_key` in `game`, or update its names, in one upsert."""
+    participant = Participant(game=game, session_key=player_key, **fields)
+    Participant.objects.bulk_create(
+        [participant],
+        update_conflicts=True,
+        unique_fields=['game', 'session_key'],
+        update_fields=list(fields),
+    )
+    if participant.pk is None:
+        # backends that do not return ids from an upsert
+        participant = Participant.objects.get(game=game, session_key=player_key)
+    return participant
+
+
+def register_for_game(request: HttpRequest, game_id: int):
+    game = cached_game(game_id)
+    if game is None:
+        raise Http404('Game not found')
+
+    # Ensure session exists
+    player_key = _player_key(request)
 
     if request.method == 'POST':
         if game.mode == Game.MODE_TEAM:
             team_name = request.POST.get('team_name', '').strip()
             if not team_name:
                 return render(request, 'quiz/register.html', {'game': game, 'error': 'Team name is required for team games.'})
-            participant = Participant.objects.create(session_key=session_key, game=game, team_name=team_name)
+            participant = _register(game, player_key, team_name=team_name)
         else:
             # require last, first, middle name for registration
             last = request.POST.get('last_name', '').strip()
@@ -59,38 +115,57 @@ def register_for_game(request: HttpRequest, game_id: int):
             if not (last and first and middle):
                 return render(request, 'quiz/register.html', {'game': game, 'error': 'Фамилия, имя и отчество обязательны для регистрации.'})
             full = f"{last} {first} {middle}"
-            participant = Participant.objects.create(session_key=session_key, game=game, team_name=full, last_name=last, first_name=first, middle_name=middle)
+            participant = _register(game, player_key, team_name=full, last_name=last, first_name=first, middle_name=middle)
 
-        # store participant id in session for convenience
-        request.session['participant_id'] = participant.id
+        # double taps and refreshes land on the same participant
+        _remember_participant(request, game.id, participant.id)
 
         return redirect(f'/game/{game_id}/play/')
 
-    # GET
+    # GET: already registered in this game from this browser
+    if (request.session.get('participants') or {}).get(str(game.id)):
+        return redirect(f'/game/{game_id}/play/')
     return render(request, 'quiz/register.html', {'game': game})
 
 
 def play_game(request: HttpRequest, game_id: int):
-    game = get_object_or_404(Game, pk=game_id)
-
-    # Ensure session exists and participant id if any
-    if not request.session.session_key:
-        request.session.save()
+    game = cached_game(game_id)
+    if game is None:
+        raise Http404('Game not found')
 
     ws_scheme = 'wss' if request.is_secure() else 'ws'
     host = request.get_host()
     ws_url = f"{ws_scheme}://{host}/ws/game/{game_id}/"
 
-    participant_id = request.session.get('participant_id')
-
-    return render(request, 'quiz/play.html', {'game': game, 'ws_url': ws_url, 'participant_id': participant_id})
+    # fast path: the session already holds the participant registered for this game
+    participant_id = (request.session.get('participants') or {}).get(str(game.id))
+    if participant_id is None:
+        # sessions from before the per-game map, or registered elsewhere: one indexed lookup
+        participant_id = Participant.objects.filter(game_id=game.id, session_key=_player_key(request)).values_list('id', flat=True).first()
+        if participant_id is not None:
+            _remember_participant(request, game.id, participant_id)
+
+    # WebSocket wire format; ?proto=msgpack|json overrides QUIZ_WS_PROTOCOL for this page
+    ws_protocol = request.GET.get('proto') or getattr(settings, 'QUIZ_WS_PROTOCOL', 'json')
+    if ws_protocol not in ('json', 'msgpack'):
+        ws_protocol = 'json'
+    return render(request, 'quiz/play.html', {
+        'game': game,
+        'ws_url': ws_url,
+        'participant_id': participant_id,
+        'ws_protocol': ws_protocol,
+        'ws_codes': ws_codes() if ws_protocol == 'msgpack' else None,
+    })
 
 
+@timed_view
+@read_from_replica
 def ratings(request, game_id: int):
     game = get_object_or_404(Game, pk=game_id)
-    participants = game.participants.all()
+    rounds = list(game.rounds.all().order_by('pk'))
     data = []
-    for p in participants:
+    for r in round_ratings(game, rounds):
+        p = r['participant']
         data.append({
             'participant_id': p.id,
             'session_key': p.session_key,
@@ -99,16 +174,47 @@ def ratings(request, game_id: int):
             'first_name': p.first_name,
             'middle_name': p.middle_name,
             'full_name': p.full_name,
-            'score': p.total_score,
+            'score': r['score'],
+            'per_round': r['per_round'],
         })
     # sort desc
     data = sorted(data, key=lambda x: x['score'], reverse=True)
     return JsonResponse({'ratings': data})
 
 
+@timed_view
+@read_from_replica
+def ratings_history(request, game_id: int):
+    """Score and rank of every participant at each round close, in one response."""
+    game = get_object_or_404(Game, pk=game_id)
+    return JsonResponse(game_history(game))
+
+
+async def spectator_events(request, game_id: int):
+    """Server-Sent Events stream of a game's leaderboard and current question, for overlays."""
+    if not await db_sync_to_async(Game.objects.filter(pk=game_id).exists)():
+        raise Http404('Game not found')
+    response = StreamingHttpResponse(event_stream(game_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def index(request: HttpRequest):
     """Redirect root to latest active game's stream or to admin if none."""
     latest = Game.objects.filter(is_active=True).order_by('-created_at').first()
     if latest:
         return redirect('quiz:game_stream', game_id=latest.id)
     return redirect('/admin/')
+
+
+def metrics(request: HttpRequest):
+    """Prometheus text exposition of the in-process quiz metrics.
+
+    When QUIZ_METRICS_TOKEN is set, the scraper must send it as a Bearer token.
+    """
+    token = getattr(settings, 'QUIZ_METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization', '') != f'Bearer {token}':
+        return HttpResponseForbidden('forbidden')
+    return HttpResponse(quiz_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,114 @@
+"""Single-writer queue for answer and grade writes.
+
+SQLite allows one writer at a time; many consumer threads writing at once
+end in "database is locked". With QUIZ_DB_SINGLE_WRITER enabled ('auto' = when
+the default database is SQLite) those writes are queued to one thread with
+one connection, which commits them in batches of up to QUIZ_DB_WRITER_BATCH
+jobs per transaction (each job in its own savepoint, so one failing job does
+not undo the others). Callers get a concurrent.futures.Future resolved after
+the batch commits. The batch's after-commit work (broadcasts, event log
+records; see quiz.events.after_commit) runs after the futures are resolved,
+on a separate thread, with one ratings broadcast per game and batch.
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from .events import collect_after_commit, run_collected
+from .metrics import WRITER_BATCH_SIZE, WRITER_FAILURES
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_writer = None
+
+
+def single_writer_enabled():
+    mode = str(getattr(settings, 'QUIZ_DB_SINGLE_WRITER', 'auto')).lower()
+    if mode == 'auto':
+        return connections['default'].vendor == 'sqlite'
+    return mode in ('1', 'true', 'on', 'yes')
+
+
+class SingleWriter:
+    def __init__(self, batch_size=50):
+        self.batch_size = max(1, int(batch_size))
+        self._queue = queue.Queue()
+        # one thread: after-commit work of successive batches keeps its order
+        self._after_commit = ThreadPoolExecutor(max_workers=1, thread_name_prefix='quiz-db-after-commit')
+        self._thread = threading.Thread(target=self._run, name='quiz-db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(jobs)
+
+    def _commit(self, jobs):
+        close_old_connections()
+        results = []
+        calls = []
+        try:
+            with collect_after_commit(calls), transaction.atomic():
+                for future, func, args, kwargs in jobs:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic():
+                            results.append((future, func(*args, **kwargs), None))
+                    except Exception as exc:
+                        WRITER_FAILURES.inc(error=type(exc).__name__)
+                        results.append((future, None, exc))
+        except Exception as exc:
+            # the batch itself did not commit: every job in it failed
+            logger.exception('Single-writer batch of %s jobs failed', len(jobs))
+            WRITER_FAILURES.inc(error=type(exc).__name__)
+            for future, _, _, _ in jobs:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        WRITER_BATCH_SIZE.observe(len(results))
+        for future, result, exc in results:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+        if calls:
+            self._after_commit.submit(_run_after_commit, calls)
+
+
+def _run_after_commit(calls):
+    close_old_connections()
+    try:
+        run_collected(calls)
+    finally:
+        close_old_connections()
+
+
+def get_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = SingleWriter(getattr(settings, 'QUIZ_DB_WRITER_BATCH', 50))
+        return _writer
+
+
+def run_write(func, *args, **kwargs):
+    """Run a write from sync code: through the single writer when enabled, else inline."""
+    if single_writer_enabled():
+        return get_writer().submit(func, *args, **kwargs).result()
+    return func(*args, **kwargs)
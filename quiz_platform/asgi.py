@@ -1,13 +1,15 @@
 import os
 import django
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.routing import ChannelNameRouter, ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz_platform.settings')
 django.setup()
 
 import quiz.routing
+from django.conf import settings
+from quiz.actor import GameActorWorker
 
 application = ProtocolTypeRouter({
     'http': get_asgi_application(),
@@ -16,4 +18,8 @@ application = ProtocolTypeRouter({
             quiz.routing.websocket_urlpatterns
         )
     ),
+    # game actors served by `manage.py runworker <QUIZ_GAME_ACTOR_CHANNEL>` when configured
+    'channel': ChannelNameRouter({
+        settings.QUIZ_GAME_ACTOR_CHANNEL: GameActorWorker.as_asgi(),
+    } if settings.QUIZ_GAME_ACTOR_CHANNEL else {}),
 })
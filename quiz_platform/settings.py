@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+import django
 from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'quiz.middleware.QueryBudgetMiddleware',
+    'quiz.dbrouter.ReadReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -89,12 +92,163 @@ else:
         'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
     }
 
+# Caches: per-process local memory ('default') plus, when QUIZ_CACHE_REDIS_URL is set
+# (defaults to REDIS_URL), a Redis tier shared by all workers ('shared'); see quiz.cache
+QUIZ_CACHE_REDIS_URL = get_env_var('QUIZ_CACHE_REDIS_URL', REDIS_URL)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quiz-local',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if QUIZ_CACHE_REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': QUIZ_CACHE_REDIS_URL,
+        'KEY_PREFIX': 'quiz',
+    }
+# Seconds the local tier keeps values read from the shared tier
+QUIZ_CACHE_LOCAL_TIMEOUT = int(get_env_var('QUIZ_CACHE_LOCAL_TIMEOUT', '5'))
+
+# Sessions: 'db' (a DB write per change), 'cached_db' (DB plus cache reads) or
+# 'signed_cookies' (no server-side storage; keep session data small)
+QUIZ_SESSION_ENGINE = get_env_var('QUIZ_SESSION_ENGINE', 'cached_db')
+if QUIZ_SESSION_ENGINE not in ('db', 'cached_db', 'signed_cookies', 'cache'):
+    raise ImproperlyConfigured(f'Unknown QUIZ_SESSION_ENGINE {QUIZ_SESSION_ENGINE!r}')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{QUIZ_SESSION_ENGINE}'
+SESSION_CACHE_ALIAS = 'shared' if 'shared' in CACHES else 'default'
+
+# Players receive only the top-K rows of the leaderboard plus their own position
+QUIZ_LEADERBOARD_TOP_K = int(get_env_var('QUIZ_LEADERBOARD_TOP_K', '20'))
+
+# Max queued state messages (ratings, player events) per WebSocket connection;
+# control messages (show/stop) are never dropped
+QUIZ_WS_OUTBOUND_QUEUE_SIZE = int(get_env_var('QUIZ_WS_OUTBOUND_QUEUE_SIZE', '50'))
+
+# Wire format the play page asks for: 'json' or 'msgpack' (MessagePack with short
+# field codes, quiz.protocol); the server accepts both from any client
+QUIZ_WS_PROTOCOL = get_env_var('QUIZ_WS_PROTOCOL', 'json')
+
+# Recent game events kept per game for replay to reconnecting clients
+QUIZ_EVENT_BUFFER_SIZE = int(get_env_var('QUIZ_EVENT_BUFFER_SIZE', '200'))
+
+# Broadcast groups per game (quiz.fanout): 1 = one flat `game_<id>` group; N > 1 =
+# N sub-groups, each joined once per worker by a relay that expands events to local sockets
+QUIZ_GROUP_SHARDS = int(get_env_var('QUIZ_GROUP_SHARDS', '1'))
+
+# Threads in the WebSocket consumers' database pool (0 = channels' single shared thread)
+QUIZ_DB_EXECUTOR_WORKERS = int(get_env_var('QUIZ_DB_EXECUTOR_WORKERS', '8'))
+
+# Per-game actors (quiz.actor): idle seconds before an actor exits, and an optional
+# channel name to route commands to a `runworker` process instead of the web process
+QUIZ_GAME_ACTOR_IDLE_SECONDS = int(get_env_var('QUIZ_GAME_ACTOR_IDLE_SECONDS', '600'))
+QUIZ_GAME_ACTOR_CHANNEL = get_env_var('QUIZ_GAME_ACTOR_CHANNEL', '')
+
+# Automatic grading of open answers when answers stop (quiz.grading): on/off, the
+# largest edit distance accepted as a typo, and a process pool for big batches
+QUIZ_AUTOGRADE = get_env_var('QUIZ_AUTOGRADE', 'True') == 'True'
+QUIZ_AUTOGRADE_MAX_DISTANCE = int(get_env_var('QUIZ_AUTOGRADE_MAX_DISTANCE', '2'))
+QUIZ_AUTOGRADE_WORKERS = int(get_env_var('QUIZ_AUTOGRADE_WORKERS', str(min(os.cpu_count() or 1, 4))))
+QUIZ_AUTOGRADE_PARALLEL_MIN = int(get_env_var('QUIZ_AUTOGRADE_PARALLEL_MIN', '2000'))
+
+# Per-question statistics pushed to admin WebSockets at most this often while answers arrive
+QUIZ_STATS_PUBLISH_SECONDS = float(get_env_var('QUIZ_STATS_PUBLISH_SECONDS', '1'))
+
+# Spectator SSE streams (quiz.spectators): min seconds between frames per spectator,
+# leaderboard rows sent, keepalive comment interval, and how long an idle game feed stays subscribed
+QUIZ_SPECTATOR_INTERVAL = float(get_env_var('QUIZ_SPECTATOR_INTERVAL', '1'))
+QUIZ_SPECTATOR_TOP = int(get_env_var('QUIZ_SPECTATOR_TOP', '20'))
+QUIZ_SPECTATOR_KEEPALIVE = float(get_env_var('QUIZ_SPECTATOR_KEEPALIVE', '15'))
+QUIZ_SPECTATOR_LINGER = float(get_env_var('QUIZ_SPECTATOR_LINGER', '30'))
+
+# Optional bearer token required to scrape /metrics
+QUIZ_METRICS_TOKEN = get_env_var('QUIZ_METRICS_TOKEN', '')
+
+# Fraction of inbound WebSocket messages traced to QUIZ_TRACE_FILE (0 = off);
+# summarize with `manage.py trace_summary`
+QUIZ_TRACE_SAMPLE_RATE = float(get_env_var('QUIZ_TRACE_SAMPLE_RATE', '0'))
+QUIZ_TRACE_FILE = get_env_var('QUIZ_TRACE_FILE', str(BASE_DIR / 'traces.jsonl'))
+
+# Views / WebSocket actions over these budgets are logged (quiz.querybudget);
+# QUIZ_QUERY_BUDGETS holds per-name overrides such as {'ws:save_round_answers': 40}
+QUIZ_QUERY_BUDGET = int(get_env_var('QUIZ_QUERY_BUDGET', '30'))
+QUIZ_QUERY_TIME_BUDGET_MS = int(get_env_var('QUIZ_QUERY_TIME_BUDGET_MS', '500'))
+QUIZ_QUERY_BUDGETS = {}
+# Where superuser-triggered cProfile captures are written (see /admin/game/profiling/)
+QUIZ_PROFILE_DIR = get_env_var('QUIZ_PROFILE_DIR', str(BASE_DIR / 'profiles'))
+
+# Append-only NDJSON log of game state transitions (empty = disabled); see quiz.eventlog
+QUIZ_EVENT_LOG_DIR = get_env_var('QUIZ_EVENT_LOG_DIR', str(BASE_DIR / 'event_logs'))
+QUIZ_EVENT_LOG_MAX_BYTES = int(get_env_var('QUIZ_EVENT_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+QUIZ_EVENT_LOG_BACKUPS = int(get_env_var('QUIZ_EVENT_LOG_BACKUPS', '5'))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+# e.g. postgres://user:pass@db:5432/quizdb (see .env.example); SQLite above when unset
+DATABASE_URL = get_env_var('DATABASE_URL', '')
+if DATABASE_URL:
+    import dj_database_url
+    DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
+
+# Optional read database (e.g. a streaming replica) for ratings, the public overlay,
+# the stream page and WebSocket reconnect snapshots; see quiz.dbrouter
+QUIZ_READ_DATABASE_URL = get_env_var('QUIZ_READ_DATABASE_URL', '')
+if QUIZ_READ_DATABASE_URL:
+    import dj_database_url
+    DATABASES['replica'] = dj_database_url.parse(QUIZ_READ_DATABASE_URL)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['quiz.dbrouter.ReadReplicaRouter']
+# Seconds a client (or a game/participant on WebSocket) reads from the primary after writing
+QUIZ_READ_REPLICA_PIN_SECONDS = float(get_env_var('QUIZ_READ_REPLICA_PIN_SECONDS', '5'))
+
+# Database connection reuse for request threads and the consumer DB pool:
+#   'off'        - a new connection per request / consumer DB hop (CONN_MAX_AGE=0)
+#   'persistent' - keep connections for QUIZ_DB_CONN_MAX_AGE seconds, health-checked on reuse
+#   'pool'       - Django's native PostgreSQL pool (Django 5.1+, psycopg 3 with psycopg_pool),
+#                  at most QUIZ_DB_POOL_SIZE connections; 'persistent' where unavailable
+QUIZ_DB_POOL = get_env_var('QUIZ_DB_POOL', 'persistent')
+QUIZ_DB_CONN_MAX_AGE = int(get_env_var('QUIZ_DB_CONN_MAX_AGE', '600'))
+# consumer DB pool threads plus a few request threads
+QUIZ_DB_POOL_SIZE = int(get_env_var('QUIZ_DB_POOL_SIZE', str(max(QUIZ_DB_EXECUTOR_WORKERS, 1) + 4)))
+
+# SQLite profile (quiz.sqlite): WAL journal, busy timeout (seconds) and synchronous level
+QUIZ_SQLITE_WAL = get_env_var('QUIZ_SQLITE_WAL', 'True') == 'True'
+QUIZ_SQLITE_BUSY_TIMEOUT = float(get_env_var('QUIZ_SQLITE_BUSY_TIMEOUT', '20'))
+QUIZ_SQLITE_SYNCHRONOUS = get_env_var('QUIZ_SQLITE_SYNCHRONOUS', 'NORMAL')
+# Funnel answer/grade writes through one writer thread in batches (quiz.writer):
+# 'auto' = only when the default database is SQLite, 'on' / 'off' to force
+QUIZ_DB_SINGLE_WRITER = get_env_var('QUIZ_DB_SINGLE_WRITER', 'auto')
+QUIZ_DB_WRITER_BATCH = int(get_env_var('QUIZ_DB_WRITER_BATCH', '50'))
+
+
+def _native_pool_available(db):
+    import importlib.util
+    return (django.VERSION >= (5, 1) and db['ENGINE'] == 'django.db.backends.postgresql'
+            and importlib.util.find_spec('psycopg') is not None
+            and importlib.util.find_spec('psycopg_pool') is not None)
+
+
+for _db in DATABASES.values():
+    if QUIZ_DB_POOL == 'pool' and _native_pool_available(_db):
+        # the pool hands connections back on close; persistent connections must stay off
+        _db['CONN_MAX_AGE'] = 0
+        _db.setdefault('OPTIONS', {})['pool'] = {'min_size': 1, 'max_size': QUIZ_DB_POOL_SIZE, 'timeout': 10}
+    elif QUIZ_DB_POOL in ('pool', 'persistent'):
+        _db['CONN_MAX_AGE'] = QUIZ_DB_CONN_MAX_AGE
+        _db['CONN_HEALTH_CHECKS'] = True
+    else:
+        _db['CONN_MAX_AGE'] = 0
+    if _db['ENGINE'] == 'django.db.backends.sqlite3':
+        _db.setdefault('OPTIONS', {})['timeout'] = QUIZ_SQLITE_BUSY_TIMEOUT
+        if django.VERSION >= (5, 1):
+            # take the write lock at BEGIN instead of failing to upgrade a read lock mid-transaction
+            _db['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
 
 AUTH_PASSWORD_VALIDATORS = []
 
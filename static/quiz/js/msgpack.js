@@ -0,0 +1,152 @@
+// Minimal MessagePack codec for the play page (quiz/protocol.py): window.MessagePack.encode / decode.
+// Covers what the server's msgpack.packb(use_bin_type=True) produces and accepts: nil, booleans,
+// integers, floats, str, bin, arrays and maps. No extension types.
+(function(){
+  const textEncoder = new TextEncoder();
+  const textDecoder = new TextDecoder();
+
+  function encode(value) {
+    const out = [];
+
+    function bytes(n, count) {
+      for (let i = count - 1; i >= 0; i--) out.push(Math.floor(n / Math.pow(256, i)) & 0xff);
+    }
+
+    function head(len, fix, fixMax, codes) {
+      // codes: [8-bit, 16-bit, 32-bit] type bytes (8-bit may be null)
+      if (fix !== null && len <= fixMax) out.push(fix | len);
+      else if (codes[0] !== null && len < 0x100) { out.push(codes[0]); bytes(len, 1); }
+      else if (len < 0x10000) { out.push(codes[1]); bytes(len, 2); }
+      else { out.push(codes[2]); bytes(len, 4); }
+    }
+
+    function number(n) {
+      if (Number.isSafeInteger(n)) {
+        if (n >= 0) {
+          if (n < 0x80) out.push(n);
+          else if (n < 0x100) { out.push(0xcc); bytes(n, 1); }
+          else if (n < 0x10000) { out.push(0xcd); bytes(n, 2); }
+          else if (n < 0x100000000) { out.push(0xce); bytes(n, 4); }
+          else { out.push(0xcf); bytes(n, 8); }
+          return;
+        }
+        if (n >= -0x20) { out.push(n & 0xff); return; }
+        const view = new DataView(new ArrayBuffer(8));
+        if (n >= -0x80) { out.push(0xd0, n & 0xff); return; }
+        if (n >= -0x8000) { view.setInt16(0, n); out.push(0xd1, view.getUint8(0), view.getUint8(1)); return; }
+        if (n >= -0x80000000) { view.setInt32(0, n); out.push(0xd2); for (let i = 0; i < 4; i++) out.push(view.getUint8(i)); return; }
+        view.setBigInt64(0, BigInt(n));
+        out.push(0xd3);
+        for (let i = 0; i < 8; i++) out.push(view.getUint8(i));
+        return;
+      }
+      const view = new DataView(new ArrayBuffer(8));
+      view.setFloat64(0, n);
+      out.push(0xcb);
+      for (let i = 0; i < 8; i++) out.push(view.getUint8(i));
+    }
+
+    function write(v) {
+      if (v === null || v === undefined) out.push(0xc0);
+      else if (v === false) out.push(0xc2);
+      else if (v === true) out.push(0xc3);
+      else if (typeof v === 'number') number(v);
+      else if (typeof v === 'string') {
+        const data = textEncoder.encode(v);
+        head(data.length, 0xa0, 31, [0xd9, 0xda, 0xdb]);
+        for (let i = 0; i < data.length; i++) out.push(data[i]);
+      } else if (v instanceof Uint8Array || v instanceof ArrayBuffer) {
+        const data = v instanceof Uint8Array ? v : new Uint8Array(v);
+        head(data.length, null, 0, [0xc4, 0xc5, 0xc6]);
+        for (let i = 0; i < data.length; i++) out.push(data[i]);
+      } else if (Array.isArray(v)) {
+        head(v.length, 0x90, 15, [null, 0xdc, 0xdd]);
+        v.forEach(write);
+      } else if (typeof v === 'object') {
+        const keys = Object.keys(v);
+        head(keys.length, 0x80, 15, [null, 0xde, 0xdf]);
+        keys.forEach(k => { write(k); write(v[k]); });
+      } else {
+        throw new TypeError('Cannot encode ' + typeof v);
+      }
+    }
+
+    write(value);
+    return Uint8Array.from(out);
+  }
+
+  function decode(data) {
+    const buf = data instanceof Uint8Array ? data : new Uint8Array(data);
+    const view = new DataView(buf.buffer, buf.byteOffset, buf.byteLength);
+    let pos = 0;
+
+    function take(n) {
+      if (pos + n > buf.length) throw new RangeError('Truncated MessagePack data');
+      const start = pos;
+      pos += n;
+      return start;
+    }
+    function str(len) {
+      const start = take(len);
+      return textDecoder.decode(buf.subarray(start, start + len));
+    }
+    function bin(len) {
+      const start = take(len);
+      return buf.slice(start, start + len);
+    }
+    function array(len) {
+      const out = new Array(len);
+      for (let i = 0; i < len; i++) out[i] = read();
+      return out;
+    }
+    function map(len) {
+      const out = {};
+      for (let i = 0; i < len; i++) {
+        const key = read();
+        out[key] = read();
+      }
+      return out;
+    }
+
+    function read() {
+      const b = buf[take(1)];
+      if (b < 0x80) return b;
+      if (b < 0x90) return map(b & 0x0f);
+      if (b < 0xa0) return array(b & 0x0f);
+      if (b < 0xc0) return str(b & 0x1f);
+      if (b >= 0xe0) return b - 0x100;
+      switch (b) {
+        case 0xc0: return null;
+        case 0xc2: return false;
+        case 0xc3: return true;
+        case 0xc4: return bin(view.getUint8(take(1)));
+        case 0xc5: return bin(view.getUint16(take(2)));
+        case 0xc6: return bin(view.getUint32(take(4)));
+        case 0xca: return view.getFloat32(take(4));
+        case 0xcb: return view.getFloat64(take(8));
+        case 0xcc: return view.getUint8(take(1));
+        case 0xcd: return view.getUint16(take(2));
+        case 0xce: return view.getUint32(take(4));
+        case 0xcf: return Number(view.getBigUint64(take(8)));
+        case 0xd0: return view.getInt8(take(1));
+        case 0xd1: return view.getInt16(take(2));
+        case 0xd2: return view.getInt32(take(4));
+        case 0xd3: return Number(view.getBigInt64(take(8)));
+        case 0xd9: return str(view.getUint8(take(1)));
+        case 0xda: return str(view.getUint16(take(2)));
+        case 0xdb: return str(view.getUint32(take(4)));
+        case 0xdc: return array(view.getUint16(take(2)));
+        case 0xdd: return array(view.getUint32(take(4)));
+        case 0xde: return map(view.getUint16(take(2)));
+        case 0xdf: return map(view.getUint32(take(4)));
+        default: throw new TypeError('Unsupported MessagePack type 0x' + b.toString(16));
+      }
+    }
+
+    const value = read();
+    if (pos !== buf.length) throw new RangeError('Extra bytes after MessagePack data');
+    return value;
+  }
+
+  window.MessagePack = {encode: encode, decode: decode};
+})();
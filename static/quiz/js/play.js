@@ -2,6 +2,9 @@
   const cfg = window.PLAY_CONFIG || {};
   const wsUrl = cfg.ws_url;
   const participantId = cfg.participant_id || null;
+  // wire format: MessagePack with short field codes when configured and the decoder loaded (quiz/protocol.py)
+  const codes = cfg.codes || null;
+  const useMsgpack = cfg.protocol === 'msgpack' && codes && window.MessagePack;
 
   const statusEl = document.getElementById('ws-status');
   const questionsContainer = document.getElementById('questions-container');
@@ -15,19 +18,36 @@
   let activeQuestions = {}; // map question_id -> question data
 
   let inputsEnabled = true;
+  // last event seq seen and the server's epoch (its seqs restart with every epoch);
+  // sent on reconnect so the server replays only missed events of the same epoch
+  let lastSeq = null;
+  let epoch = null;
+  let lastControlSeq = 0;
+  let lastRatingSeq = 0;
+  // sealed rounds pushed ahead of the reveal: round_id -> {digest, nonce, sealed}
+  const stagedRounds = {};
 
   function connect() {
-    ws = new WebSocket(wsUrl);
+    const params = new URLSearchParams();
+    if (participantId) params.set('participant_id', participantId);
+    if (lastSeq !== null && epoch) {
+      params.set('last_seq', lastSeq);
+      params.set('epoch', epoch);
+    }
+    const qs = params.toString();
+    const url = qs ? wsUrl + '?' + qs : wsUrl;
+    ws = useMsgpack ? new WebSocket(url, 'quiz.msgpack.v1') : new WebSocket(url);
+    if (useMsgpack) ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
       statusEl.innerText = 'подключено';
       // send join message with participant id
-      ws.send(JSON.stringify({action: 'join_game', participant_id: participantId}));
+      sendMessage({action: 'join_game', participant_id: participantId});
     };
 
     ws.onmessage = (e) => {
       try {
-        const data = JSON.parse(e.data);
+        const data = typeof e.data === 'string' ? JSON.parse(e.data) : expand(MessagePack.decode(new Uint8Array(e.data)));
         handleMessage(data);
       } catch (err) { console.error('Invalid message', err); }
     };
@@ -39,19 +59,131 @@
     };
   }
 
+  function invert(table) {
+    const out = {};
+    Object.keys(table || {}).forEach(k => { out[table[k]] = k; });
+    return out;
+  }
+  const fieldNames = codes ? invert(codes.fields) : {};
+  const typeNames = codes ? invert(codes.types) : {};
+  const skipKeys = ['saved_answers', 'bets', 'time_histogram'];
+
+  function expand(value) {
+    if (Array.isArray(value)) return value.map(expand);
+    if (!value || typeof value !== 'object') return value;
+    const out = {};
+    Object.keys(value).forEach(k => {
+      const name = fieldNames[k] || k;
+      const v = value[k];
+      if (name === 'type') out[name] = typeNames[v] || v;
+      else if (skipKeys.indexOf(name) >= 0 && v && typeof v === 'object') {
+        out[name] = {};
+        Object.keys(v).forEach(dk => { out[name][dk] = expand(v[dk]); });
+      } else out[name] = expand(v);
+    });
+    return out;
+  }
+
+  function shorten(value) {
+    if (Array.isArray(value)) return value.map(shorten);
+    if (!value || typeof value !== 'object') return value;
+    const out = {};
+    Object.keys(value).forEach(k => {
+      const v = value[k];
+      if (k === 'action') out[codes.fields.action] = codes.actions[v] || v;
+      else out[codes.fields[k] || k] = shorten(v);
+    });
+    return out;
+  }
+
+  function sendMessage(payload) {
+    ws.send(useMsgpack ? MessagePack.encode(shorten(payload)) : JSON.stringify(payload));
+  }
+
   function handleMessage(msg) {
+    if (msg.type === 'snapshot') {
+      // full state follows; resume from the server's current seq
+      lastSeq = msg.seq;
+      epoch = msg.epoch || null;
+      lastControlSeq = lastRatingSeq = 0;
+      if (!msg.accepting) stopAnswers();
+      return;
+    }
+    if (msg.seq !== undefined && msg.seq !== null && !msg.snapshot) {
+      if (msg.epoch && msg.epoch !== epoch) {
+        // another sequence space (server restarted): earlier seqs say nothing about these
+        epoch = msg.epoch;
+        lastSeq = null;
+        lastControlSeq = lastRatingSeq = 0;
+      }
+      // control frames jump ahead of queued ratings on the server, so dedupe
+      // (replay overlap) per stream instead of against a single counter
+      if (msg.type === 'update_rating') {
+        if (msg.seq <= lastRatingSeq) return;
+        lastRatingSeq = msg.seq;
+      } else if (msg.type !== 'player_submit' && msg.type !== 'player_joined') {
+        if (msg.seq <= lastControlSeq) return;
+        lastControlSeq = msg.seq;
+      }
+      lastSeq = Math.max(lastSeq || 0, msg.seq);
+    }
     if (msg.type === 'show_question') {
       showQuestion(msg);
+    } else if (msg.type === 'stage_round') {
+      stageRound(msg);
+    } else if (msg.type === 'unseal_round') {
+      unsealRound(msg);
     } else if (msg.type === 'show_round') {
       showRound(msg.round);
     } else if (msg.type === 'stop_answers') {
       stopAnswers();
+    } else if (msg.type === 'ack') {
+      if (!msg.ok) {
+        console.warn('save failed', msg.correlation_id);
+        alert('Ответ не сохранён (код ' + msg.correlation_id + ')');
+      }
+    } else if (msg.type === 'update_rating') {
+      showMyRank(msg.me);
     } else if (msg.type === 'player_submit') {
       // optionally show who submitted
       console.log('player_submit', msg);
     }
   }
 
+  function b64bytes(text) {
+    return Uint8Array.from(atob(text), c => c.charCodeAt(0));
+  }
+
+  function stageRound(msg) {
+    // without WebCrypto (plain http on a LAN address) the server sends the full round instead
+    if (!(window.crypto && window.crypto.subtle)) return;
+    stagedRounds[msg.round_id] = msg;
+    sendMessage({action: 'round_staged', round_id: msg.round_id, digest: msg.digest});
+  }
+
+  async function unsealRound(msg) {
+    const staged = stagedRounds[msg.round_id];
+    try {
+      const key = await crypto.subtle.importKey('raw', b64bytes(msg.key), 'AES-GCM', false, ['decrypt']);
+      const plain = await crypto.subtle.decrypt({name: 'AES-GCM', iv: b64bytes(staged.nonce)}, key, b64bytes(staged.sealed));
+      showRound(JSON.parse(new TextDecoder().decode(plain)));
+    } catch (err) {
+      // reconnect without last_seq: the snapshot carries the round in full
+      console.error('Cannot unseal round', err);
+      lastSeq = null;
+      ws.close();
+    }
+  }
+
+  function showMyRank(me) {
+    const el = document.getElementById('my-rank');
+    if (!el || !me) return;
+    let text = 'Ваше место: ' + me.rank + ' из ' + me.total + ', очки: ' + me.score;
+    if (me.gap) text += ' (до следующего места: ' + me.gap + ')';
+    el.innerText = text;
+    el.classList.remove('hidden');
+  }
+
   function showRound(round) {
     // render whole answer sheet for the round
     if (!round) return;
@@ -113,7 +245,7 @@
         answers.push({question_id: q.id, answer: answer, bet: bet});
       });
       const payload = {action: 'save_round_answers', answers: answers, participant_id: participantId};
-      try { if (ws && ws.readyState === WebSocket.OPEN) { ws.send(JSON.stringify(payload)); alert('Ответы сохранены'); } else alert('Нет соединения'); } catch(e){console.error(e);}
+      try { if (ws && ws.readyState === WebSocket.OPEN) { sendMessage(payload); alert('Ответы сохранены'); } else alert('Нет соединения'); } catch(e){console.error(e);}
     }); saveAllWrap.appendChild(saveAllBtn); questionsContainer.appendChild(saveAllWrap);
 
     // prefill saved answers if provided (server includes saved_answers when sending show_round on connect)
@@ -214,7 +346,7 @@
       const payload = { action: 'save_answer', question_id: q.id, answer: answer, bet: bet, participant_id: participantId };
       try {
         if (ws && ws.readyState === WebSocket.OPEN) {
-          ws.send(JSON.stringify(payload));
+          sendMessage(payload);
           savedLabel.innerText = 'Сохранено';
           savedLabel.style.color = 'green';
         } else {